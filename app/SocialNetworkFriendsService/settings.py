@@ -16,6 +16,8 @@ import datetime
 
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -52,16 +54,20 @@ INSTALLED_APPS = [
 
 ]
 
+# сессии, CSRF, пользователь из сессии и сообщения - только для админки: запросы к API_PATH_PREFIXES
+# проходят мимо них (core.middleware); процессы только с API - профиль settings_api
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'core.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    'core.middleware.CsrfViewMiddleware',
+    'core.middleware.AuthenticationMiddleware',
+    'core.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+API_PATH_PREFIXES = ('/user/', '/async/user/', '/api/token/')
+
 ROOT_URLCONF = 'SocialNetworkFriendsService.urls'
 
 TEMPLATES = [
@@ -85,6 +91,11 @@ WSGI_APPLICATION = 'SocialNetworkFriendsService.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
+# DB_CONN_MAX_AGE - секунд жизни соединения между запросами (0 - новое на каждый запрос, none - бессрочно);
+# под ASGI соединения не переиспользуются между потоками - там 0 и PgBouncer.
+# DB_POOL_MODE=transaction - за PgBouncer в режиме transaction pooling: без серверных курсоров
+
+DB_CONN_MAX_AGE = os.environ.get('DB_CONN_MAX_AGE', '60')
 
 DATABASES = {
     'default': {
@@ -94,15 +105,79 @@ DATABASES = {
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD', 'testtest'),
         'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
         'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        'CONN_MAX_AGE': None if DB_CONN_MAX_AGE.lower() == 'none' else int(DB_CONN_MAX_AGE),
+        # переиспользуемое соединение проверяется в начале запроса: разорванное после рестарта БД или
+        # PgBouncer заменяется новым вместо ошибки в запросе
+        'CONN_HEALTH_CHECKS': True,
+        'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DB_POOL_MODE') == 'transaction',
     }
 }
 
+# POSTGRES_REPLICA_HOSTS=host[:port],... - реплики для чтений списков друзей и статусов (core.routers).
+# После изменения дружбы чтения о ее участниках REPLICA_PIN_SECONDS секунд идут в primary - дольше отставания реплик
+REPLICA_DATABASES = []
+for number, replica in enumerate(filter(None, os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(',')), 1):
+    host, _, port = replica.strip().partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'], 'HOST': host, 'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(f'replica_{number}')
+
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# REDIS_URL (redis://host:6379/0) - общий кэш друзей для всех воркеров, иначе - локальная память процесса.
+# WEB_CONCURRENCY - число воркеров (его же читают gunicorn и uvicorn): в памяти процесса invalidate() сбрасывает
+# версию только у воркера, который записал, поэтому без REDIS_URL воркер должен быть один
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# закрепление за primary (core.routers.pin_to_primary) и версии кэша друзей должны видеть все воркеры:
+# в локальной памяти другой воркер после записи читал бы отстающую реплику и кэшировал ее строки
+if REPLICA_DATABASES and not os.environ.get('REDIS_URL'):
+    raise ImproperlyConfigured('POSTGRES_REPLICA_HOSTS требует общего кэша: задайте REDIS_URL')
+if WEB_CONCURRENCY > 1 and not os.environ.get('REDIS_URL'):
+    raise ImproperlyConfigured('WEB_CONCURRENCY > 1 требует общего кэша: задайте REDIS_URL')
+
+# в памяти процесса - короткий таймаут: воркеры, запущенные с --workers мимо WEB_CONCURRENCY, расходятся ненадолго
+FRIENDS_CACHE_TIMEOUT = int(os.environ.get('FRIENDS_CACHE_TIMEOUT', 60 * 60 if os.environ.get('REDIS_URL') else 5))
+
+# сколько дней хранится журнал изменений дружбы для /user/me/changes/ (python manage.py prune_friendship_changes)
+FRIENDSHIP_CHANGES_RETENTION_DAYS = int(os.environ.get('FRIENDSHIP_CHANGES_RETENTION_DAYS', 30))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
 AUTH_USER_MODEL = "core.User"
 
+# первый - для новых паролей, остальные проверяют старые хэши и пересчитываются в первый при входе
+PASSWORD_HASHERS = [
+    'core.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -142,14 +217,20 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
+    # только JWT: без токена - 401 с WWW-Authenticate. Сессии у API нет - Session и Authentication middleware
+    # пропускают API_PATH_PREFIXES (core.middleware), Basic не нужен (хэширование пароля на каждый запрос)
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
-    'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema'
+    'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema',
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
 }
 
+# JWT_STATELESS_READS=1 - чтения, которым нужен только id пользователя, берут его из токена без запроса к БД
+# (core.authentication.StatelessReadMixin)
+JWT_STATELESS_READS = bool(os.environ.get('JWT_STATELESS_READS'))
+
 
 JWT_AUTH = {
     'JWT_VERIFY': True,
@@ -161,9 +242,26 @@ JWT_AUTH = {
 
 
 if 'test' in sys.argv:
+    # тесты создают заявки напрямую через ORM, мимо инвалидации; кэш включается в тестах кэша явно
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        }
+    }
+
+# TEST_WITH_POSTGRES=1 - прогон тестов на PostgreSQL (нужен для EXPLAIN-тестов индексов)
+if 'test' in sys.argv and not os.environ.get('TEST_WITH_POSTGRES'):
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': ':memory:',
         }
-    }
\ No newline at end of file
+    }
+
+if 'test' in sys.argv:
+    # второй алиас на ту же тестовую базу - тесты роутера реплик включают его через REPLICA_DATABASES
+    DATABASES = {
+        'default': DATABASES['default'],
+        'replica': {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}},
+    }
+    REPLICA_DATABASES = []
\ No newline at end of file
@@ -0,0 +1,36 @@
+"""
+Профиль только для API (DJANGO_SETTINGS_MODULE=SocialNetworkFriendsService.settings_api):
+без админки, сессий, CSRF и сообщений, аутентификация только по JWT, ответы только JSON
+"""
+
+from .settings import *  # noqa: F401, F403
+from .settings import INSTALLED_APPS, REST_FRAMEWORK, TEMPLATES
+
+INSTALLED_APPS = [
+    app for app in INSTALLED_APPS
+    if app not in ('django.contrib.admin', 'django.contrib.sessions', 'django.contrib.messages')
+]
+
+MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+ROOT_URLCONF = 'SocialNetworkFriendsService.urls_api'
+
+TEMPLATES = [{
+    **TEMPLATES[0],
+    'OPTIONS': {
+        'context_processors': [
+            'django.template.context_processors.debug',
+            'django.template.context_processors.request',
+            'django.contrib.auth.context_processors.auth',
+        ],
+    },
+}]
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_AUTHENTICATION_CLASSES': ('rest_framework_simplejwt.authentication.JWTAuthentication',),
+    'DEFAULT_RENDERER_CLASSES': ('rest_framework.renderers.JSONRenderer',),
+}
@@ -27,6 +27,8 @@ schema_view = get_schema_view(
 urlpatterns = [
 
     path('user/', include(('core.urls', 'core'), namespace='core')),
+    # асинхронные варианты для запуска под ASGI (uvicorn), см. core.async_views
+    path('async/user/', include(('core.async_urls', 'core'), namespace='core_async')),
 
     path('admin/', admin.site.urls),
 
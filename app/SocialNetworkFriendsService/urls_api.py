@@ -0,0 +1,17 @@
+from django.urls import path, include
+
+from rest_framework_simplejwt.views import (
+    TokenObtainPairView,
+    TokenRefreshView,
+    TokenVerifyView
+)
+
+# маршруты профиля settings_api: только API, без админки и swagger
+urlpatterns = [
+    path('user/', include(('core.urls', 'core'), namespace='core')),
+    path('async/user/', include(('core.async_urls', 'core'), namespace='core_async')),
+
+    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/verify/', TokenVerifyView.as_view(), name='token_verify'),
+]
@@ -1,6 +1,12 @@
 from django.contrib import admin
+from django.db import router, transaction
 
-from .models import User, Friendship
+from . import cache as friends_cache
+from . import changelog
+from . import counters
+from . import graph as friends_graph
+from . import routers
+from .models import User, Friendship, StatusApplicationFriends
 
 
 class UserAdmin(admin.ModelAdmin):
@@ -10,7 +16,17 @@ class UserAdmin(admin.ModelAdmin):
         ('Данные пользователя', {'fields': ('username', 'email')}),
         ('Статус', {'fields': ('is_active', )}),
         ('Данные учетки', {'fields': ('last_login', 'date_joined')}),
+        ('Счетчики', {'fields': ('friends_count', 'incoming_pending_count', 'outgoing_pending_count')}),
     )
+    readonly_fields = ('friends_count', 'incoming_pending_count', 'outgoing_pending_count')
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            # только поля формы: счетчики из прочитанной строки не перезаписывают переходы заявок (core.counters)
+            obj.save(update_fields=form.changed_data)
+        else:
+            super().save_model(request, obj, form, change)
+        friends_cache.invalidate_profile(obj.id, form.changed_data if change else ())
 
 
 class FriendshipAdmin(admin.ModelAdmin):
@@ -27,6 +43,51 @@ class FriendshipAdmin(admin.ModelAdmin):
     )
     save_on_top = True
 
+    def lock_users(self, user_ids):
+        """Строки пользователей пары блокируются до изменения, как в services.lock_relations"""
+        list(User.objects.select_for_update().filter(id__in=user_ids).order_by('id').values_list('id'))
+
+    def reconcile_counters(self, user_ids):
+        """Правка из админки может быть любым переходом - счетчики пары пересчитываются целиком"""
+        counters.reconcile(User.objects.filter(id__in=user_ids))
+
+    def save_model(self, request, obj, form, change):
+        self.lock_users([obj.outgoing_friend_id, obj.incoming_friend_id])
+        super().save_model(request, obj, form, change)
+        self.reconcile_counters([obj.outgoing_friend_id, obj.incoming_friend_id])
+        changelog.record((obj.outgoing_friend_id, obj.incoming_friend_id, obj.status))
+        friends_cache.invalidate(obj.outgoing_friend_id, obj.incoming_friend_id)
+        routers.pin_to_primary(obj.outgoing_friend_id, obj.incoming_friend_id)
+        if obj.status == StatusApplicationFriends.ACCEPTED:
+            friends_graph.add_friends(obj.outgoing_friend_id, [obj.incoming_friend_id])
+        else:
+            friends_graph.remove_friends(obj.outgoing_friend_id, [obj.incoming_friend_id])
+
+    def delete_model(self, request, obj):
+        self.lock_users([obj.outgoing_friend_id, obj.incoming_friend_id])
+        super().delete_model(request, obj)
+        self.reconcile_counters([obj.outgoing_friend_id, obj.incoming_friend_id])
+        changelog.record((obj.outgoing_friend_id, obj.incoming_friend_id, ''))
+        friends_cache.invalidate(obj.outgoing_friend_id, obj.incoming_friend_id)
+        routers.pin_to_primary(obj.outgoing_friend_id, obj.incoming_friend_id)
+        friends_graph.remove_friends(obj.outgoing_friend_id, [obj.incoming_friend_id])
+
+    def delete_queryset(self, request, queryset):
+        # действие delete_selected, в отличие от delete_view, не открывает транзакцию
+        with transaction.atomic(using=router.db_for_write(Friendship)):
+            pairs = queryset.values_list('outgoing_friend', 'incoming_friend')
+            self.lock_users({user_id for pair in pairs for user_id in pair})
+            # пары перечитываются под блокировкой - конкурентный переход мог удалить строку
+            pairs = list(pairs.all())
+            super().delete_queryset(request, queryset)
+            user_ids = {user_id for pair in pairs for user_id in pair}
+            self.reconcile_counters(user_ids)
+            changelog.record(*((outgoing_id, incoming_id, '') for outgoing_id, incoming_id in pairs))
+            friends_cache.invalidate(*user_ids)
+            routers.pin_to_primary(*user_ids)
+            for outgoing_friend_id, incoming_friend_id in pairs:
+                friends_graph.remove_friends(outgoing_friend_id, [incoming_friend_id])
+
 
 admin.site.register(User, UserAdmin)
 admin.site.register(Friendship, FriendshipAdmin)
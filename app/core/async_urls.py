@@ -0,0 +1,12 @@
+from django.urls import path
+from .async_views import (
+    AsyncApplicationAPIView,
+    AsyncFriendsAPIView,
+    AsyncUserMeAPIView,
+)
+
+urlpatterns = [
+    path('<pk>/application/', AsyncApplicationAPIView.as_view(), name='user_application'),
+    path('me/profile/', AsyncUserMeAPIView.as_view(), name='user_me_profile'),
+    path('me/friends/', AsyncFriendsAPIView.as_view(), name='user_me_friends'),
+]
@@ -0,0 +1,91 @@
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.views import exception_handler
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from . import cache as friends_cache
+from .authentication import aauthenticate
+from .models import Friendship
+from .pagination import KeysetPagination
+from .serializers import FriendSerializer, UserSerializer
+from .services import submit_applications, reject_applications
+from .views import ApplicationMixin
+
+
+class AsyncAPIView(View):
+    """
+    Асинхронная view для ASGI (uvicorn) с ответами как у APIView: обработчики - корутины, возвращают Response.
+    Пользователь из JWT и чтения - асинхронным ORM, транзакции core.services и сериализаторы
+    с обращениями к кэшу/БД - через sync_to_async
+    """
+    http_method_names = ['get', 'post', 'delete']
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # как у APIView: авторизация только по JWT, CSRF не нужен; csrf_exempt в Django 4.2 не оборачивает корутины
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.request = Request(request)
+        try:
+            handler = getattr(self, request.method.lower(), None)
+            if request.method.lower() not in self.http_method_names or handler is None:
+                raise exceptions.MethodNotAllowed(request.method)
+            self.user, _ = await aauthenticate(request)
+            response = await handler(self.request, *args, **kwargs)
+        except (Http404, exceptions.APIException) as exc:
+            if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+                exc.auth_header = JWTAuthentication().authenticate_header(request)
+            response = exception_handler(exc, {'view': self, 'request': self.request})
+        return self.finalize_response(response)
+
+    def finalize_response(self, response: Response) -> Response:
+        response.accepted_renderer = JSONRenderer()
+        response.accepted_media_type = response.accepted_renderer.media_type
+        response.renderer_context = {'view': self, 'request': self.request, 'response': response}
+        return response.render()
+
+
+class AsyncUserMeAPIView(AsyncAPIView):
+    async def get(self, request):
+        data = await sync_to_async(lambda: UserSerializer(self.user, context={'request': request}).data)()
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class AsyncFriendsAPIView(AsyncAPIView):
+    """Список друзей: та же страница и тот же ключ кэша, что у FriendsViewSet"""
+
+    async def get_page(self, request) -> tuple:
+        paginator = KeysetPagination()
+        friendships = await paginator.apaginate_queryset(Friendship.objects.friend_sides_of(self.user), request)
+        friends = [friendship.get_friend(self.user.id) for friendship in friendships]
+        return paginator.next_cursor, FriendSerializer(friends, many=True).data
+
+    async def get(self, request):
+        next_cursor, results = await friends_cache.aget_or_set(
+            self.user.id, f'rows:{request.query_params.urlencode()}', lambda: self.get_page(request)
+        )
+        paginator = KeysetPagination()
+        paginator.resume(request, next_cursor)
+        return paginator.get_paginated_response(results)
+
+
+class AsyncApplicationAPIView(ApplicationMixin, AsyncAPIView):
+    async def get(self, request, pk):
+        friend = await Friendship.objects.relations(self.user).filter(id=self.get_friend_id()).afirst()
+        if friend is None:
+            raise Http404
+        return self.get_status_response(self.user, friend)
+
+    async def post(self, request, pk):
+        return self.get_response(await sync_to_async(submit_applications)(self.user, [self.get_friend_id()]))
+
+    async def delete(self, request, pk):
+        return self.get_response(await sync_to_async(reject_applications)(self.user, [self.get_friend_id()]))
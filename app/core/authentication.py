@@ -0,0 +1,57 @@
+from django.conf import settings
+from rest_framework.exceptions import NotAuthenticated
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .models import User
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    Пользователь из claims токена без запроса к БД: несохраненный User только с id.
+    Годится для чтений, которым нужен лишь id (списки друзей и заявок, статус пары): удаленный или
+    заблокированный пользователь сохраняет доступ на чтение до истечения access-токена
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+        return User(**{jwt_settings.USER_ID_FIELD: user_id})
+
+
+class StatelessReadMixin:
+    """Для APIView: при JWT_STATELESS_READS GET/HEAD/OPTIONS аутентифицируются StatelessJWTAuthentication"""
+
+    def get_authenticators(self):
+        request = getattr(self, 'request', None)
+        if settings.JWT_STATELESS_READS and request is not None and request.method in SAFE_METHODS:
+            return [StatelessJWTAuthentication()]
+        return super().get_authenticators()
+
+
+async def aauthenticate(request) -> tuple[User, object]:
+    """
+    JWT из заголовка Authorization для асинхронных view: подпись и срок проверяются без БД,
+    пользователь читается асинхронным ORM. Ошибки - те же исключения, что у JWTAuthentication
+    """
+    authenticator = JWTAuthentication()
+    header = authenticator.get_header(request)
+    raw_token = authenticator.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        raise NotAuthenticated()
+    validated_token = authenticator.get_validated_token(raw_token)
+    try:
+        user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken('Token contained no recognizable user identification')
+    try:
+        user = await User.objects.aget(**{jwt_settings.USER_ID_FIELD: user_id})
+    except User.DoesNotExist:
+        raise AuthenticationFailed('User not found', code='user_not_found')
+    if not user.is_active:
+        raise AuthenticationFailed('User is inactive', code='user_inactive')
+    return user, validated_token
@@ -0,0 +1,170 @@
+import http.client
+import os
+import socket
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+
+SERVER_START_TIMEOUT = 30
+
+
+def percentile(values: list[float], q: float) -> float:
+    """q-й процентиль по ближайшему рангу, values отсортированы"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def running_server(command: list[str], host: str, port: int, cwd=None, env: dict | None = None):
+    """
+    Сервер command на время блока: ждет, пока порт начнет принимать соединения, затем останавливает.
+    env - переменные окружения поверх текущих
+    """
+    process = subprocess.Popen(
+        command, cwd=cwd, env={**os.environ, **(env or {})}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f'{command[0]} завершился с кодом {process.returncode}')
+            try:
+                socket.create_connection((host, port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f'{command[0]} не открыл порт {port} за {SERVER_START_TIMEOUT} s')
+                time.sleep(0.2)
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def run_load(host: str, port: int, paths: list[str], headers: dict, concurrency: int, duration: float) -> dict:
+    """
+    Замкнутая нагрузка: concurrency потоков по keep-alive соединению шлют GET по кругу paths duration секунд.
+    Ответ >= 400 и ошибка соединения считаются ошибкой, задержка - от отправки до прочитанного тела
+    """
+    deadline = time.perf_counter() + duration
+    latencies, errors, lock = [], [0], threading.Lock()
+
+    def worker(offset: int):
+        connection = http.client.HTTPConnection(host, port, timeout=30)
+        local_latencies, local_errors, i = [], 0, offset
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                local_errors += response.status >= 400
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                connection.close()
+            local_latencies.append(time.perf_counter() - start)
+        connection.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': len(latencies) / elapsed,
+        'p50': percentile(latencies, 50) * 1000,
+        'p95': percentile(latencies, 95) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+    }
+
+
+def measure_requests(path: str, headers: dict, repeat: int, method: str = 'get', **kwargs) -> dict:
+    """
+    Задержка запроса через весь стек Django в процессе (django.test.Client, без сети) и запросы к БД на вызов.
+    Первый вызов - прогрев, в замер не входит
+    """
+    return measure_sequence([(path, method, path, headers, kwargs)], repeat)[path]
+
+
+def measure_sequence(steps: list[tuple], repeat: int) -> dict[str, dict]:
+    """
+    measure_requests для цикла шагов (name, method, path, headers, kwargs), которые выполняются по порядку
+    repeat раз: так запись чередуется со своей отменой (заявка - отмена заявки) и каждый повтор видит то же
+    состояние. path, headers и kwargs (аргументы Client) - значения или функции номера повтора (0 - прогрев),
+    например для записи, которую нельзя повторить с теми же участниками. Ответ >= 400 считается ошибкой.
+    Внутри откатываемой транзакции колбэки on_commit (сброс кэша друзей, закрепление за primary) выполняются
+    сразу после запроса и входят в его время, как после коммита без обертки
+    """
+    client = Client(SERVER_NAME='localhost')
+    latencies = {name: [] for name, *_ in steps}
+    queries, errors, current = dict.fromkeys(latencies, 0), dict.fromkeys(latencies, 0), [None]
+
+    def count(execute, sql, params, many, context):
+        if current[0] is not None:
+            queries[current[0]] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count):
+        for i in range(repeat + 1):
+            for name, method, *arguments in steps:
+                path, headers, kwargs = (argument(i) if callable(argument) else argument for argument in arguments)
+                current[0] = name if i else None
+                start = time.perf_counter()
+                with TestCase.captureOnCommitCallbacks(execute=True):
+                    response = getattr(client, method)(path, headers=headers, **kwargs)
+                if i:
+                    latencies[name].append(time.perf_counter() - start)
+                    errors[name] += response.status_code >= 400
+    stats = {}
+    for name, values in latencies.items():
+        values.sort()
+        stats[name] = {
+            'queries': queries[name] / repeat,
+            'errors': errors[name],
+            'p50': percentile(values, 50) * 1000,
+            'p95': percentile(values, 95) * 1000,
+            'p99': percentile(values, 99) * 1000,
+        }
+    return stats
+
+
+@contextmanager
+def override_api_settings(**overrides):
+    """
+    override_settings, которое доходит до view DRF: APIView берет классы аутентификации и рендеров
+    из настроек при объявлении класса, поэтому они переустанавливаются на время блока
+    """
+    saved = APIView.authentication_classes, APIView.renderer_classes
+    with override_settings(**overrides):
+        APIView.authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        APIView.renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+        try:
+            yield
+        finally:
+            APIView.authentication_classes, APIView.renderer_classes = saved
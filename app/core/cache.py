@@ -0,0 +1,136 @@
+import functools
+import time
+from typing import Awaitable, Callable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from .managers import FRIEND_FIELDS
+from .models import Friendship
+
+STATS_EVENTS = ('hits', 'misses')
+
+
+def version_key(user_id: int) -> str:
+    return f'friends:version:{user_id}'
+
+
+def stats_key(event: str) -> str:
+    return f'friends:stats:{event}'
+
+
+def count(event: str) -> None:
+    try:
+        cache.incr(stats_key(event))
+    except ValueError:
+        cache.add(stats_key(event), 1, timeout=None)
+
+
+async def acount(event: str) -> None:
+    try:
+        await cache.aincr(stats_key(event))
+    except ValueError:
+        await cache.aadd(stats_key(event), 1, timeout=None)
+
+
+def get_stats() -> dict:
+    values = cache.get_many([stats_key(event) for event in STATS_EVENTS])
+    return {event: values.get(stats_key(event), 0) for event in STATS_EVENTS}
+
+
+def reset_stats() -> None:
+    cache.delete_many([stats_key(event) for event in STATS_EVENTS])
+
+
+def get_version(user_id: int) -> int:
+    """
+    Версия данных о друзьях пользователя - входит в ключи всех его записей.
+    Инвалидация удаляет версию, следующее чтение заводит новую, старые записи истекают по таймауту
+    """
+    key = version_key(user_id)
+    if (version := cache.get(key)) is None:
+        version = time.time_ns()
+        if not cache.add(key, version, settings.FRIENDS_CACHE_TIMEOUT):
+            version = cache.get(key, version)
+    return version
+
+
+def conditional_get(method):
+    """
+    Декоратор GET-метода APIView с данными пользователя запроса (профиль, друзья, заявки): ETag из версии его
+    данных о друзьях - она меняется при каждом изменении его пар (invalidate).
+    Совпадение с If-None-Match - 304 без запросов к БД и сериализации. Last-Modified не отдается: версия - время
+    ее создания при чтении, а не изменения, и две версии в одной секунде дали бы 304 на устаревшие данные
+    """
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        etag = f'"{request.user.id}.{get_version(request.user.id)}.{request.accepted_renderer.format}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = method(self, request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response.headers['ETag'] = etag
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+    return wrapper
+
+
+def get_or_set(user_id: int, name: str, default: Callable):
+    """
+    Запись name пользователя из кэша, при промахе - default().
+    Версия берется до чтения из БД: если пара изменится во время чтения,
+    результат ляжет под устаревшую версию и не будет прочитан
+    """
+    key = f'friends:{name}:{user_id}:{get_version(user_id)}'
+    if (value := cache.get(key)) is not None:
+        count('hits')
+        return value
+    count('misses')
+    value = default()
+    cache.set(key, value, settings.FRIENDS_CACHE_TIMEOUT)
+    return value
+
+
+async def aget_version(user_id: int) -> int:
+    key = version_key(user_id)
+    if (version := await cache.aget(key)) is None:
+        version = time.time_ns()
+        if not await cache.aadd(key, version, settings.FRIENDS_CACHE_TIMEOUT):
+            version = await cache.aget(key, version)
+    return version
+
+
+async def aget_or_set(user_id: int, name: str, default: Callable[[], Awaitable]):
+    """get_or_set для асинхронных view: default - корутинная функция"""
+    key = f'friends:{name}:{user_id}:{await aget_version(user_id)}'
+    if (value := await cache.aget(key)) is not None:
+        await acount('hits')
+        return value
+    await acount('misses')
+    value = await default()
+    await cache.aset(key, value, settings.FRIENDS_CACHE_TIMEOUT)
+    return value
+
+
+def get_friend_ids(user_id: int) -> list[int]:
+    """Отсортированные id друзей пользователя"""
+    return get_or_set(user_id, 'ids', lambda: sorted(Friendship.objects.friend_ids_of(user_id)))
+
+
+def invalidate(*user_ids: int) -> None:
+    """Сброс кэша друзей пользователей после фиксации текущей транзакции"""
+    keys = [version_key(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_profile(user_id: int, changed_fields) -> None:
+    """
+    Сброс после правки профиля: версия пользователя (ETag профиля), а если изменились поля FriendSerializer -
+    и всех, с кем у него есть пара в любом статусе: их страницы друзей, заявки и ETag содержат эти поля
+    """
+    user_ids = [user_id]
+    if set(changed_fields) & set(FRIEND_FIELDS):
+        user_ids.extend(Friendship.objects.related_ids_of(user_id))
+    invalidate(*user_ids)
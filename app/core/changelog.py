@@ -0,0 +1,93 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .enums import StatusApplicationFriends
+from .models import FriendshipChange
+
+PRUNE_BATCH_SIZE = 10000
+CHANGES_LIMIT = 500
+CHANGES_MAX_LIMIT = 1000
+CURSOR_MARGIN = datetime.timedelta(hours=1)
+
+
+def record(*changes: tuple[int, int, str]) -> None:
+    """
+    Новое состояние пар (outgoing_id, incoming_id, status) в журнал - строка каждому участнику, status '' - строки
+    пары больше нет. Вызывать в транзакции перехода после блокировки строк обоих пользователей
+    (services.lock_relations или UPDATE счетчиков): переходы одного пользователя тогда идут последовательно,
+    и его id журнала растут в порядке фиксации - курсор не перескочит незафиксированное изменение
+    """
+    if not changes:
+        return
+    FriendshipChange.objects.bulk_create([
+        FriendshipChange(user_id=user_id, other_user_id=other_id, status=status, outgoing=user_id == outgoing_id)
+        for outgoing_id, incoming_id, status in changes
+        for user_id, other_id in ((outgoing_id, incoming_id), (incoming_id, outgoing_id))
+    ])
+
+
+def make_cursor(change_id: int) -> str:
+    """Курсор - id последней прочитанной записи и время выдачи: по нему видно, не удалил ли prune записи после id"""
+    return f'{change_id}.{int(time.time())}'
+
+
+def parse_cursor(cursor: str) -> tuple[int, int] | None:
+    change_id, _, issued = cursor.partition('.')
+    if not (change_id.isdigit() and issued.isdigit()):
+        return None
+    return int(change_id), int(issued)
+
+
+def get_cursor(user_id: int) -> str:
+    """Курсор для начала синхронизации - берется до полной загрузки списков"""
+    changes = FriendshipChange.objects.filter(user_id=user_id).order_by('-id').values_list('id', flat=True)
+    return make_cursor(changes.first() or 0)
+
+
+def is_expired(issued: int) -> bool:
+    """
+    Курсор выдан раньше, чем prune удаляет записи, - изменения после него могли пропасть, нужна полная загрузка.
+    CURSOR_MARGIN - запас на транзакции, которые записали изменение до выдачи курсора, а зафиксировали после
+    """
+    retention = datetime.timedelta(days=settings.FRIENDSHIP_CHANGES_RETENTION_DAYS) - CURSOR_MARGIN
+    return issued < time.time() - retention.total_seconds()
+
+
+def get_changes(user_id: int, cursor: int, limit: int) -> tuple[dict[int, FriendshipChange], str, bool]:
+    """
+    Последнее состояние каждой пары пользователя, изменившейся после записи cursor (не больше limit строк
+    журнала), новый курсор и есть ли изменения дальше. Один запрос по индексу (user, id)
+    """
+    rows = list(FriendshipChange.objects.filter(user_id=user_id, id__gt=cursor).order_by('id')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {row.other_user_id: row for row in rows}, make_cursor(rows[-1].id if rows else cursor), has_more
+
+
+def group_changes(changes: dict[int, FriendshipChange]) -> dict[str, list[int]]:
+    """
+    id вторых пользователей по новому состоянию пары: friends - теперь друзья, submitted_in/submitted_out -
+    ожидающие заявки, removed - ни дружбы, ни заявки (удаление из друзей, отклонение, отмена)
+    """
+    groups = {'friends': [], 'submitted_in': [], 'submitted_out': [], 'removed': []}
+    for other_id, change in changes.items():
+        if change.status == StatusApplicationFriends.ACCEPTED:
+            groups['friends'].append(other_id)
+        elif change.status == StatusApplicationFriends.SUBMITTED:
+            groups['submitted_out' if change.outgoing else 'submitted_in'].append(other_id)
+        else:
+            groups['removed'].append(other_id)
+    return groups
+
+
+def prune() -> int:
+    """Удаление записей старше FRIENDSHIP_CHANGES_RETENTION_DAYS пачками по id"""
+    retention = datetime.timedelta(days=settings.FRIENDSHIP_CHANGES_RETENTION_DAYS)
+    expired = FriendshipChange.objects.filter(created__lt=timezone.now() - retention)
+    deleted = 0
+    while ids := list(expired.order_by('id').values_list('id', flat=True)[:PRUNE_BATCH_SIZE]):
+        deleted += FriendshipChange.objects.filter(id__in=ids).delete()[0]
+    return deleted
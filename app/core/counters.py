@@ -0,0 +1,84 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import F, Func, IntegerField, OuterRef, QuerySet, Subquery
+
+from .models import Friendship, User
+
+COUNTER_FIELDS = ('friends_count', 'incoming_pending_count', 'outgoing_pending_count')
+RECONCILE_BATCH_SIZE = 1000
+
+# переходы заявок: (изменение у пользователя, который действует; изменение у каждого второго пользователя пары)
+SUBMIT = ({'outgoing_pending_count': 1}, {'incoming_pending_count': 1})
+ACCEPT = ({'friends_count': 1, 'incoming_pending_count': -1}, {'friends_count': 1, 'outgoing_pending_count': -1})
+REJECT = ({'incoming_pending_count': -1}, {'outgoing_pending_count': -1})
+CANCEL = ({'outgoing_pending_count': -1}, {'incoming_pending_count': -1})
+REMOVE = ({'friends_count': -1}, {'friends_count': -1})
+
+
+class CounterDeltas(defaultdict):
+    """Накопленные изменения счетчиков по id пользователя"""
+
+    def __init__(self):
+        super().__init__(Counter)
+
+    def add(self, transition: tuple[dict, dict], user_id: int, other_ids: list[int]) -> None:
+        user_delta, other_delta = transition
+        for field, value in user_delta.items():
+            self[user_id][field] += value * len(other_ids)
+        for other_id in other_ids:
+            self[other_id].update(other_delta)
+
+    def save(self) -> None:
+        """
+        Один UPDATE ... SET field = field + delta на группу пользователей с одинаковыми изменениями.
+        Вызывать в транзакции перехода, после блокировки строк пользователей (см. services.lock_relations)
+        """
+        groups = defaultdict(list)
+        for user_id, delta in self.items():
+            if key := tuple(sorted((field, value) for field, value in delta.items() if value)):
+                groups[key].append(user_id)
+        for key, user_ids in groups.items():
+            User.objects.filter(id__in=user_ids).update(**{field: F(field) + value for field, value in key})
+
+
+def count_of(queryset: QuerySet) -> Subquery:
+    return Subquery(
+        queryset.order_by().annotate(count=Func(F('id'), function='COUNT')).values('count'),
+        output_field=IntegerField(),
+    )
+
+
+def actual_counts() -> dict:
+    """Значения счетчиков по строкам Friendship - аннотации для запроса к User"""
+    accepted, submitted = Friendship.objects.accepted(), Friendship.objects.submitted()
+    return {
+        'actual_friends_count': count_of(accepted.filter(outgoing_friend=OuterRef('id')))
+        + count_of(accepted.filter(incoming_friend=OuterRef('id'))),
+        'actual_incoming_pending_count': count_of(submitted.filter(incoming_friend=OuterRef('id'))),
+        'actual_outgoing_pending_count': count_of(submitted.filter(outgoing_friend=OuterRef('id'))),
+    }
+
+
+def reconcile(users: QuerySet, batch_size: int = RECONCILE_BATCH_SIZE) -> int:
+    """
+    Пересчет счетчиков пользователей users пачками по id, возвращает число исправленных.
+    Строки пачки сначала блокируются: переход, начатый раньше, успеет закоммититься до подсчета,
+    начатый позже - применит свое изменение поверх пересчитанного значения
+    """
+    fixed, last_id = 0, 0
+    while True:
+        with transaction.atomic():
+            batch = users.select_for_update().filter(id__gt=last_id).order_by('id')[:batch_size]
+            ids = list(batch.values_list('id', flat=True))
+            if not ids:
+                return fixed
+            last_id = ids[-1]
+            drifted = list(User.objects.filter(id__in=ids).annotate(**actual_counts()).exclude(
+                **{field: F(f'actual_{field}') for field in COUNTER_FIELDS}
+            ).only('id', *COUNTER_FIELDS))
+            for user in drifted:
+                for field in COUNTER_FIELDS:
+                    setattr(user, field, getattr(user, f'actual_{field}'))
+            User.objects.bulk_update(drifted, COUNTER_FIELDS)
+            fixed += len(drifted)
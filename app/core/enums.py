@@ -1,5 +1,8 @@
 from enum import Enum
 
+from django.db import models
+from django.utils.translation import gettext_lazy
+
 
 class BaseEnum(Enum):
 
@@ -19,3 +22,15 @@ class StatusApplicationEnum(str, BaseEnum):
     FRI = 'Уже друзья'
     NONE = 'Нет ничего'
     REJ = 'Не стали друзьями'
+
+
+class FriendsProjectionEnum(str, BaseEnum):
+    FULL = 'full'
+    IDS = 'ids'
+    COUNT = 'count'
+
+
+class StatusApplicationFriends(models.TextChoices):
+    ACCEPTED = 'ACC', gettext_lazy('Заявка принята')
+    REJECTED = 'REJ', gettext_lazy('Заявка отклонена')
+    SUBMITTED = 'SUB', gettext_lazy('Заявка подана')
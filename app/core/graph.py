@@ -0,0 +1,226 @@
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Iterator, NamedTuple
+
+from django.db import transaction
+from django.db.models import Max
+
+from .models import Friendship, User
+
+LOAD_CHUNK_SIZE = 20000
+COMPACT_THRESHOLD = 100000
+
+
+class GraphSnapshot(NamedTuple):
+    """
+    Состояние графа, которое читатели берут одной ссылкой: массивы CSR и изменения после их построения.
+    changes - пользователь -> (добавленные, удаленные) друзья, оба frozenset: запись заменяет значение
+    пользователя целиком, и читатель видит либо старую, либо новую пару множеств
+    """
+    offsets: array
+    targets: array
+    changes: dict[int, tuple[frozenset[int], frozenset[int]]]
+
+
+NO_CHANGES = (frozenset(), frozenset())
+
+
+class FriendGraph:
+    """
+    Граф друзей в памяти в формате CSR с индексом User.id:
+    друзья пользователя u - targets[offsets[u]:offsets[u + 1]], отсортированные по id.
+    8 байт на ребро и 8 байт на id пользователя, без объектов Python на строку.
+    Изменения после построения копятся в snapshot.changes и вливаются в массивы в compact() в фоновом потоке.
+    Читатели не берут lock: каждый метод читает self.snapshot один раз, compact публикует новый снимок
+    одним присваиванием
+    """
+
+    def __init__(self, offsets: array, targets: array, compact_threshold: int = COMPACT_THRESHOLD):
+        self.snapshot = GraphSnapshot(offsets, targets, {})
+        self.pending = 0
+        self.compact_threshold = compact_threshold
+        self.lock = threading.Lock()
+        # фоновая пересборка и записи, сделанные за время нее
+        self.compaction: threading.Thread | None = None
+        self.replay: list[tuple[int, list[int], bool]] = []
+
+    @classmethod
+    def from_sorted_edges(cls, edges: Iterable[tuple[int, int]], size: int, **kwargs) -> 'FriendGraph':
+        """Построение из ребер (user_id, friend_id), отсортированных по паре; size - больше любого id"""
+        offsets = array('q', bytes(8 * (size + 1)))
+        targets = array('q')
+        for user_id, friend_id in edges:
+            targets.append(friend_id)
+            offsets[user_id + 1] += 1
+        for i in range(1, size + 1):
+            offsets[i] += offsets[i - 1]
+        return cls(offsets, targets, **kwargs)
+
+    @classmethod
+    def load(cls, **kwargs) -> 'FriendGraph':
+        """
+        Принятые заявки из БД: строка пары дает ребра в обе стороны, UNION ALL двух
+        проходов по частичным индексам принятых заявок сливается в порядке (user_id, friend_id).
+        Пользователи, созданные во время загрузки, попадут в граф через add_friends
+        """
+        size = (User.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+        accepted = Friendship.objects.accepted().filter(outgoing_friend_id__lt=size, incoming_friend_id__lt=size)
+        edges = accepted.values_list('outgoing_friend_id', 'incoming_friend_id').union(
+            accepted.values_list('incoming_friend_id', 'outgoing_friend_id'), all=True
+        ).order_by('outgoing_friend_id', 'incoming_friend_id').iterator(chunk_size=LOAD_CHUNK_SIZE)
+        return cls.from_sorted_edges(edges, size, **kwargs)
+
+    @property
+    def targets(self) -> array:
+        return self.snapshot.targets
+
+    @property
+    def size(self) -> int:
+        return len(self.snapshot.offsets) - 1
+
+    @property
+    def nbytes(self) -> int:
+        """Память массивов CSR (без накопленных изменений)"""
+        offsets, targets, _ = self.snapshot
+        return offsets.itemsize * len(offsets) + targets.itemsize * len(targets)
+
+    @staticmethod
+    def base_range(snapshot: GraphSnapshot, user_id: int) -> tuple[int, int]:
+        offsets = snapshot.offsets
+        if 0 <= user_id < len(offsets) - 1:
+            return offsets[user_id], offsets[user_id + 1]
+        return 0, 0
+
+    def has_base_edge(self, snapshot: GraphSnapshot, user_id: int, friend_id: int) -> bool:
+        start, end = self.base_range(snapshot, user_id)
+        i = bisect_left(snapshot.targets, friend_id, start, end)
+        return i < end and snapshot.targets[i] == friend_id
+
+    def has_edge(self, user_id: int, friend_id: int) -> bool:
+        snapshot = self.snapshot
+        added, removed = snapshot.changes.get(user_id, NO_CHANGES)
+        if friend_id in added:
+            return True
+        return friend_id not in removed and self.has_base_edge(snapshot, user_id, friend_id)
+
+    def degree(self, user_id: int) -> int:
+        snapshot = self.snapshot
+        added, removed = snapshot.changes.get(user_id, NO_CHANGES)
+        start, end = self.base_range(snapshot, user_id)
+        return end - start + len(added) - len(removed)
+
+    def neighbors(self, user_id: int, snapshot: GraphSnapshot | None = None) -> list[int]:
+        """Отсортированные id друзей"""
+        snapshot = snapshot or self.snapshot
+        start, end = self.base_range(snapshot, user_id)
+        base = snapshot.targets[start:end]
+        added, removed = snapshot.changes.get(user_id, NO_CHANGES)
+        if not added and not removed:
+            return base.tolist()
+        return sorted(set(base).difference(removed).union(added))
+
+    def intersection(self, user_id: int, other_id: int) -> list[int]:
+        """Отсортированные id общих друзей: множество строится по меньшему списку"""
+        snapshot = self.snapshot
+        smaller, larger = sorted((self.neighbors(user_id, snapshot), self.neighbors(other_id, snapshot)), key=len)
+        return sorted(set(smaller).intersection(larger))
+
+    def iter_edges(self, snapshot: GraphSnapshot, size: int) -> Iterator[tuple[int, int]]:
+        for user_id in range(size):
+            for friend_id in self.neighbors(user_id, snapshot):
+                yield user_id, friend_id
+
+    def link(self, snapshot: GraphSnapshot, user_id: int, friend_id: int, present: bool) -> int:
+        """Ребро user_id -> friend_id в изменениях снимка относительно его массивов, 1 - если изменение новое"""
+        added, removed = snapshot.changes.get(user_id, NO_CHANGES)
+        added, removed = added - {friend_id}, removed - {friend_id}
+        pending = 0
+        if present != self.has_base_edge(snapshot, user_id, friend_id):
+            if present:
+                added |= {friend_id}
+            else:
+                removed |= {friend_id}
+            pending = 1
+        snapshot.changes[user_id] = (added, removed)
+        return pending
+
+    def link_pairs(self, snapshot: GraphSnapshot, user_id: int, friend_ids: Iterable[int], present: bool) -> int:
+        pending = 0
+        for friend_id in friend_ids:
+            pending += self.link(snapshot, user_id, friend_id, present)
+            pending += self.link(snapshot, friend_id, user_id, present)
+        return pending
+
+    def update(self, user_id: int, friend_ids: Iterable[int], present: bool) -> None:
+        """
+        Добавление (present) или удаление дружбы user_id с friend_ids в обе стороны.
+        На COMPACT_THRESHOLD изменений запускает compact() в фоновом потоке - запись его не ждет
+        """
+        friend_ids = list(friend_ids)
+        with self.lock:
+            self.pending += self.link_pairs(self.snapshot, user_id, friend_ids, present)
+            if self.compaction is not None:
+                self.replay.append((user_id, friend_ids, present))
+                return
+            if self.pending < self.compact_threshold:
+                return
+            # изменения до этой точки остаются в base неизменными, дальше запись идет в копию
+            base = self.snapshot
+            self.snapshot = base._replace(changes=dict(base.changes))
+            self.replay = []
+            self.compaction = threading.Thread(target=self.compact, args=(base,), daemon=True)
+        self.compaction.start()
+
+    def compact(self, base: GraphSnapshot) -> None:
+        """
+        Пересборка массивов по снимку base без self.lock. Изменения, записанные за время пересборки, повторяются
+        на новом снимке до его публикации - читатели не видят графа без них
+        """
+        size = max(len(base.offsets) - 1, max(base.changes, default=-1) + 1)
+        compacted = self.from_sorted_edges(self.iter_edges(base, size), size).snapshot
+        with self.lock:
+            pending = 0
+            for user_id, friend_ids, present in self.replay:
+                pending += self.link_pairs(compacted, user_id, friend_ids, present)
+            self.snapshot, self.pending = compacted, pending
+            self.replay, self.compaction = [], None
+
+
+_graph: FriendGraph | None = None
+_graph_lock = threading.Lock()
+
+
+def get_graph() -> FriendGraph:
+    """
+    Граф процесса, загружается при первом обращении.
+    Изменения дружбы из этого процесса применяются после коммита, если граф уже был загружен при записи
+    (см. apply_on_commit): пока его никто не читал, записи не платят за него ничего.
+    Записи других воркеров и процессов граф не видит до reset() и повторной загрузки, поэтому ни один endpoint
+    его не читает
+    """
+    global _graph
+    if _graph is None:
+        with _graph_lock:
+            if _graph is None:
+                _graph = FriendGraph.load()
+    return _graph
+
+
+def reset() -> None:
+    global _graph
+    _graph = None
+
+
+def apply_on_commit(user_id: int, friend_ids: list[int], present: bool) -> None:
+    """Пока граф процесса не загружен, запись ничего не регистрирует: загрузка прочитает ее из БД"""
+    if (graph := _graph) is not None:
+        transaction.on_commit(lambda: graph.update(user_id, friend_ids, present))
+
+
+def add_friends(user_id: int, friend_ids: list[int]) -> None:
+    apply_on_commit(user_id, friend_ids, True)
+
+
+def remove_friends(user_id: int, friend_ids: list[int]) -> None:
+    apply_on_commit(user_id, friend_ids, False)
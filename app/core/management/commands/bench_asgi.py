@@ -0,0 +1,69 @@
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.benchmark import free_port, run_load, running_server
+from core.models import User
+from core.synthetic import create_users, create_friendships
+
+WSGI_APPLICATION = 'SocialNetworkFriendsService.wsgi:application'
+ASGI_APPLICATION = 'SocialNetworkFriendsService.asgi:application'
+
+
+def get_modes(workers: int, host: str, port: int) -> dict:
+    """Режим -> (команда запуска сервера, префикс url)"""
+    gunicorn = [
+        sys.executable, '-m', 'gunicorn', WSGI_APPLICATION, '--workers', str(workers), '--bind', f'{host}:{port}',
+    ]
+    uvicorn = [
+        sys.executable, '-m', 'uvicorn', ASGI_APPLICATION, '--workers', str(workers),
+        '--host', host, '--port', str(port), '--log-level', 'warning', '--no-access-log',
+    ]
+    return {
+        'wsgi gunicorn, sync views': (gunicorn, '/user/'),
+        'asgi uvicorn, sync views': (uvicorn, '/user/'),
+        'asgi uvicorn, async views': (uvicorn, '/async/user/'),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный бенчмарк WSGI (gunicorn, sync-воркеры) против ASGI (uvicorn) при одинаковом числе воркеров. '
+        'Серверы запускаются подпроцессами на базе из настроек; данные удаляются после замера'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=10, help='Секунд нагрузки на каждый endpoint')
+        parser.add_argument('--warmup', type=float, default=2)
+        parser.add_argument('--friends', type=int, default=100)
+        parser.add_argument('--host', default='127.0.0.1')
+
+    def handle(self, *args, **options):
+        host, concurrency, duration = options['host'], options['concurrency'], options['duration']
+        user_id, *friend_ids = create_users(1 + options['friends'], prefix='benchasgi')
+        try:
+            create_friendships([(user_id, friend_id) for friend_id in friend_ids])
+            token = RefreshToken.for_user(User.objects.get(id=user_id)).access_token
+            headers = {'Authorization': f'Bearer {token}'}
+            endpoints = ['me/profile/?friends=ids', 'me/friends/', f'{friend_ids[0]}/application/']
+            self.stdout.write(
+                f'{options["workers"]} воркеров, {concurrency} соединений, {duration:.0f} s на endpoint, '
+                f'{options["friends"]} друзей'
+            )
+            port = free_port()
+            for mode, (command, prefix) in get_modes(options['workers'], host, port).items():
+                with running_server(command, host, port, cwd=settings.BASE_DIR):
+                    run_load(host, port, [prefix + path for path in endpoints], headers, concurrency, options['warmup'])
+                    self.stdout.write(mode)
+                    for path in endpoints:
+                        stats = run_load(host, port, [prefix + path], headers, concurrency, duration)
+                        self.stdout.write(
+                            f'  {path:>28}: {stats["rps"]:8.1f} rps, p50 {stats["p50"]:7.1f} ms, '
+                            f'p99 {stats["p99"]:7.1f} ms, ошибок {stats["errors"]}'
+                        )
+        finally:
+            User.objects.filter(id__in=[user_id, *friend_ids]).delete()
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory, override_settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.authentication import StatelessJWTAuthentication
+from core.benchmark import measure_requests
+from core.models import User
+from core.synthetic import create_users, create_friendships
+
+
+class Command(BaseCommand):
+    help = (
+        'Задержка запросов с JWT в процессе: пользователь из БД против пользователя из claims (JWT_STATELESS_READS) '
+        'и цена повторной аутентификации во view. Данные откатываются после замера'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--friends', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=500)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        with transaction.atomic():
+            user_id, *friend_ids = create_users(1 + options['friends'], prefix='benchauth')
+            create_friendships([(user_id, friend_id) for friend_id in friend_ids])
+            token = RefreshToken.for_user(User.objects.get(id=user_id)).access_token
+            headers = {'Authorization': f'Bearer {token}'}
+
+            # повторный JWTAuthentication().authenticate во view стоил столько же поверх аутентификации DRF
+            request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+            for name, authenticator in (('JWT + пользователь из БД', JWTAuthentication()),
+                                        ('JWT stateless', StatelessJWTAuthentication())):
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    authenticator.authenticate(request)
+                elapsed = (time.perf_counter() - start) / repeat * 1000
+                self.stdout.write(f'{name:>28}: {elapsed:6.3f} ms на authenticate')
+
+            self.stdout.write('p50/p99 запроса через стек Django, запросов к БД на запрос:')
+            endpoints = ['/user/me/profile/?friends=ids', '/user/me/friends/', f'/user/{friend_ids[0]}/application/']
+            for path in endpoints:
+                for stateless in (False, True):
+                    with override_settings(JWT_STATELESS_READS=stateless):
+                        stats = measure_requests(path, headers, repeat)
+                    self.stdout.write(
+                        f'{path:>36} {"stateless" if stateless else "из БД":>9}: '
+                        f'p50 {stats["p50"]:6.2f} ms, p99 {stats["p99"]:6.2f} ms, запросов {stats["queries"]:.1f}'
+                    )
+            transaction.set_rollback(True)
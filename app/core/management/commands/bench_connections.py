@@ -0,0 +1,100 @@
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.benchmark import free_port, run_load, running_server
+from core.models import User
+from core.synthetic import create_users, create_friendships
+
+WSGI_APPLICATION = 'SocialNetworkFriendsService.wsgi:application'
+
+
+def get_modes(pgbouncer: str | None) -> dict:
+    """Режим -> переменные окружения сервера"""
+    modes = {
+        'CONN_MAX_AGE=0 (соединение на запрос)': {'DB_CONN_MAX_AGE': '0'},
+        'CONN_MAX_AGE=60 + health checks': {'DB_CONN_MAX_AGE': '60'},
+    }
+    if pgbouncer:
+        host, _, port = pgbouncer.partition(':')
+        modes['PgBouncer transaction, CONN_MAX_AGE=0'] = {
+            'DB_CONN_MAX_AGE': '0', 'DB_POOL_MODE': 'transaction',
+            'POSTGRES_HOST': host, 'POSTGRES_PORT': port or '6432',
+        }
+    return modes
+
+
+def sessions_opened() -> int | None:
+    """Соединений к базе с запуска статистики (pg_stat_database.sessions, PostgreSQL 14+)"""
+    if connection.vendor != 'postgresql' or connection.pg_version < 140000:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_stat_clear_snapshot()')
+        cursor.execute('SELECT sessions FROM pg_stat_database WHERE datname = current_database()')
+        return cursor.fetchone()[0]
+
+
+class Command(BaseCommand):
+    help = (
+        'Цена открытия соединения с БД и задержка под нагрузкой (gunicorn, sync-воркеры): соединение на каждый '
+        'запрос против постоянных соединений CONN_MAX_AGE и PgBouncer (--pgbouncer host:port). '
+        'Данные удаляются после замера'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument('--warmup', type=float, default=2)
+        parser.add_argument('--connects', type=int, default=50, help='Соединений для замера их открытия')
+        parser.add_argument('--pgbouncer', help='host:port PgBouncer в режиме transaction pooling')
+        parser.add_argument('--host', default='127.0.0.1')
+
+    def handle(self, *args, **options):
+        self.measure_connect(options['connects'])
+        host, duration = options['host'], options['duration']
+        user_id, *friend_ids = create_users(21, prefix='benchconn')
+        try:
+            create_friendships([(user_id, friend_id) for friend_id in friend_ids])
+            headers = {'Authorization': f'Bearer {RefreshToken.for_user(User.objects.get(id=user_id)).access_token}'}
+            paths = ['/user/me/profile/?friends=count', '/user/me/friends/']
+            port = free_port()
+            command = [
+                sys.executable, '-m', 'gunicorn', WSGI_APPLICATION,
+                '--workers', str(options['workers']), '--bind', f'{host}:{port}',
+            ]
+            for mode, env in get_modes(options['pgbouncer']).items():
+                with running_server(command, host, port, cwd=settings.BASE_DIR, env=env):
+                    run_load(host, port, paths, headers, options['concurrency'], options['warmup'])
+                    before = sessions_opened()
+                    stats = run_load(host, port, paths, headers, options['concurrency'], duration)
+                    time.sleep(1)
+                    after = sessions_opened()
+                opened = '' if before is None else f', соединений на запрос {(after - before) / stats["requests"]:.2f}'
+                self.stdout.write(
+                    f'{mode:>40}: {stats["rps"]:7.1f} rps, p50 {stats["p50"]:6.2f} ms, p95 {stats["p95"]:6.2f} ms, '
+                    f'p99 {stats["p99"]:6.2f} ms, ошибок {stats["errors"]}{opened}'
+                )
+        finally:
+            User.objects.filter(id__in=[user_id, *friend_ids]).delete()
+
+    def measure_connect(self, count: int) -> None:
+        """Открытие соединения (TCP, аутентификация, запуск backend) против запроса по открытому соединению"""
+        start = time.perf_counter()
+        for _ in range(count):
+            new_connection = connections.create_connection('default')
+            with new_connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            new_connection.close()
+        connect = (time.perf_counter() - start) / count * 1000
+        connection.ensure_connection()
+        start = time.perf_counter()
+        for _ in range(count):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        query = (time.perf_counter() - start) / count * 1000
+        self.stdout.write(f'Новое соединение + SELECT 1: {connect:.2f} ms, SELECT 1 по открытому: {query:.3f} ms')
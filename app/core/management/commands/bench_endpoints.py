@@ -0,0 +1,109 @@
+import logging
+import random
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core import cache as friends_cache
+from core import changelog
+from core.benchmark import measure_sequence
+from core.models import Friendship, User
+from core.synthetic import graph_users
+
+DUMMY_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+def auth_headers(user_id: int) -> dict:
+    return {'Authorization': f'Bearer {RefreshToken.for_user(User(id=user_id)).access_token}'}
+
+
+def pick_users(prefix: str) -> dict[str, int]:
+    """Пользователи графа для замера: с наибольшим числом друзей, медианный и с одним-двумя друзьями"""
+    users = graph_users(prefix).filter(friends_count__gt=0)
+    count = users.count()
+    if not count:
+        raise CommandError(f'Нет графа с префиксом "{prefix}": сначала python manage.py generate_graph')
+    by_degree = users.order_by('-friends_count', 'id').values_list('id', flat=True)
+    return {'hub': by_degree[0], 'median': by_degree[count // 2], 'tail': by_degree[count - 1]}
+
+
+def get_steps(user_id: int, prefix: str, repeat: int, rng: random.Random) -> list[tuple]:
+    """
+    Цикл запросов ко всем маршрутам core/urls.py от имени user_id. Записи идут парами с откатом своего эффекта
+    (заявка - отмена), чтобы повторы видели то же состояние. Удаление из друзей необратимо (пара остается
+    отклоненной), поэтому заявка незнакомца - принятие - удаление идут с новым незнакомцем на каждом повторе
+    """
+    headers = auth_headers(user_id)
+    related = set(Friendship.objects.related_ids_of(user_id))
+    friend_ids = list(Friendship.objects.friend_ids_of(user_id))
+    ids = list(graph_users(prefix).filter(friends_count__gt=0).values_list('id', flat=True)[:10000])
+    strangers = [pk for pk in ids if pk not in related and pk != user_id]
+    submitted, bulk, strangers = strangers[0], strangers[1:21], strangers[21:]
+    if len(strangers) <= repeat:
+        raise CommandError(f'Незнакомых пользователю {user_id} в графе меньше, чем повторов ({repeat})')
+    other = rng.choice(friend_ids)
+    run = uuid.uuid4().hex[:8]
+    return [
+        ('GET me/profile/', 'get', '/user/me/profile/', headers, {}),
+        ('GET me/profile/?friends=count', 'get', '/user/me/profile/?friends=count', headers, {}),
+        ('GET me/friends/', 'get', '/user/me/friends/', headers, {}),
+        ('GET me/submitted/out/', 'get', '/user/me/submitted/out/', headers, {}),
+        ('GET me/submitted/in/', 'get', '/user/me/submitted/in/', headers, {}),
+        ('GET me/suggestions/', 'get', '/user/me/suggestions/', headers, {}),
+        ('GET me/changes/', 'get', lambda i: f'/user/me/changes/?since={changelog.make_cursor(0)}', headers, {}),
+        ('POST me/relations/ (100 id)', 'post', '/user/me/relations/', headers,
+         {'data': {'ids': rng.sample(ids, 100)}, 'content_type': 'application/json'}),
+        ('GET <pk>/', 'get', f'/user/{other}/', headers, {}),
+        ('GET <pk>/?friends=count', 'get', f'/user/{other}/?friends=count', headers, {}),
+        ('GET <pk>/application/', 'get', f'/user/{other}/application/', headers, {}),
+        ('GET <pk>/mutual/', 'get', f'/user/{other}/mutual/', headers, {}),
+        ('GET <pk>/path/', 'get', f'/user/{rng.choice(ids)}/path/', headers, {}),
+        ('POST <pk>/application/', 'post', f'/user/{submitted}/application/', headers, {}),
+        ('DELETE <pk>/application/', 'delete', f'/user/{submitted}/application/', headers, {}),
+        ('POST me/applications/ (20 id)', 'post', '/user/me/applications/', headers,
+         {'data': {'ids': bulk}, 'content_type': 'application/json'}),
+        ('DELETE me/applications/ (20 id)', 'delete', '/user/me/applications/', headers,
+         {'data': {'ids': bulk}, 'content_type': 'application/json'}),
+        ('POST <pk>/application/ (входящая)', 'post', f'/user/{user_id}/application/',
+         lambda i: auth_headers(strangers[i]), {}),
+        ('POST <pk>/application/ (принять)', 'post', lambda i: f'/user/{strangers[i]}/application/', headers, {}),
+        ('DELETE <pk>/', 'delete', lambda i: f'/user/{strangers[i]}/', headers, {}),
+        ('POST create/', 'post', '/user/create/', {}, lambda i: {'data': {
+            'email': f'{run}_{i}@example.com', 'username': f'benchcreate{run}_{i}', 'password': 'bench-password',
+        }}),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Задержка p50/p95/p99 и запросы к БД на запрос для всех маршрутов core/urls.py в процессе (django.test.Client) '
+        'на графе generate_graph: от имени пользователя с наибольшим числом друзей, медианного и с хвоста '
+        'распределения. Записи откатываются после замера, кэш друзей пользователей графа сбрасывается'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='graph')
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--no-cache', action='store_true', help='Без кэша друзей (DummyCache)')
+
+    def handle(self, *args, **options):
+        rng, repeat = random.Random(options['seed']), options['repeat']
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        with transaction.atomic(), override_settings(**({'CACHES': DUMMY_CACHES} if options['no_cache'] else {})):
+            for role, user_id in pick_users(options['prefix']).items():
+                friends = User.objects.values_list('friends_count', flat=True).get(id=user_id)
+                self.stdout.write(f'{role}: пользователь {user_id}, друзей {friends}')
+                stats = measure_sequence(get_steps(user_id, options['prefix'], repeat, rng), repeat)
+                for name, values in stats.items():
+                    errors = f', ошибок {values["errors"]}' if values['errors'] else ''
+                    self.stdout.write(
+                        f'{name:>36}: p50 {values["p50"]:8.2f}, p95 {values["p95"]:8.2f}, p99 {values["p99"]:8.2f} ms, '
+                        f'запросов {values["queries"]:5.1f}{errors}'
+                    )
+            transaction.set_rollback(True)
+        # версии кэша, заведенные чтениями внутри откаченной транзакции, описывают откаченные строки
+        friends_cache.invalidate(*graph_users(options['prefix']).values_list('id', flat=True))
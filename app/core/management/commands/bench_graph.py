@@ -0,0 +1,63 @@
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from core.graph import FriendGraph
+
+
+def generate_edges(users: int, degree: int, rng: random.Random):
+    """Ребра (user_id, friend_id) по возрастанию пары, в среднем degree друзей на пользователя"""
+    for user_id in range(users):
+        for friend_id in sorted(rng.sample(range(users), rng.randint(0, 2 * degree))):
+            yield user_id, friend_id
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк памяти и операций FriendGraph на синтетическом графе в памяти (без БД)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000000)
+        parser.add_argument('--edges', type=int, default=10000000)
+        parser.add_argument('--sample', type=int, default=10000, help='Пользователей для замера dict[int, set]')
+        parser.add_argument('--repeat', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        users, repeat = options['users'], options['repeat']
+        degree = options['edges'] // users
+        rng = random.Random(options['seed'])
+
+        start = time.perf_counter()
+        graph = FriendGraph.from_sorted_edges(generate_edges(users, degree, rng), users)
+        edges = len(graph.targets)
+        self.stdout.write(f'{users} пользователей, {edges} ребер, построение {time.perf_counter() - start:.1f} s')
+        self.stdout.write(f'CSR: {graph.nbytes / 2 ** 20:.1f} MiB, {graph.nbytes / edges:.1f} байт на ребро')
+
+        sample = options['sample']
+        tracemalloc.start()
+        adjacency = {user_id: set(graph.neighbors(user_id)) for user_id in range(sample)}
+        sample_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        sample_edges = sum(len(friends) for friends in adjacency.values())
+        self.stdout.write(
+            f'dict[int, set[int]]: {sample_bytes / sample_edges:.1f} байт на ребро '
+            f'(~{sample_bytes / sample_edges * edges / 2 ** 20:.0f} MiB на весь граф, по {sample} пользователям)'
+        )
+
+        user_ids = [rng.randrange(users) for _ in range(repeat)]
+        other_ids = [rng.randrange(users) for _ in range(repeat)]
+        operations = {
+            'degree': lambda: [graph.degree(user_id) for user_id in user_ids],
+            'neighbors': lambda: [graph.neighbors(user_id) for user_id in user_ids],
+            'intersection': lambda: [graph.intersection(*pair) for pair in zip(user_ids, other_ids)],
+            'update (add + remove)': lambda: [
+                (graph.update(user_id, [other_id], True), graph.update(user_id, [other_id], False))
+                for user_id, other_id in zip(user_ids, other_ids)
+            ],
+        }
+        for name, operation in operations.items():
+            start = time.perf_counter()
+            operation()
+            self.stdout.write(f'{name:>24}: {(time.perf_counter() - start) / repeat * 1e6:8.2f} us')
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+
+from core.models import User
+from core.user_import import import_users
+
+PBKDF2_HASHERS = ['django.contrib.auth.hashers.PBKDF2PasswordHasher']
+
+
+class Command(BaseCommand):
+    help = (
+        'Скорость создания пользователей: create_user по одному с PBKDF2 (как было) против import_users '
+        '(пул процессов, bulk_create) с PBKDF2 и с текущим PASSWORD_HASHERS. Данные откатываются после замера'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--workers', type=int, default=None)
+
+    def handle(self, *args, **options):
+        count, workers = options['users'], options['workers']
+
+        def create_each(rows):
+            for row in rows:
+                User.objects.create_user(**row)
+
+        cases = (
+            ('create_user, PBKDF2', PBKDF2_HASHERS, create_each),
+            ('import_users, PBKDF2', PBKDF2_HASHERS, lambda rows: import_users(rows, workers)),
+            ('import_users, settings', None, lambda rows: import_users(rows, workers)),
+        )
+        for run, (name, hashers, create) in enumerate(cases):
+            rows = [
+                {'email': f'benchimport{run}_{i}@example.com', 'password': f'password-{i}'} for i in range(count)
+            ]
+            with transaction.atomic(), override_settings(**({'PASSWORD_HASHERS': hashers} if hashers else {})):
+                start = time.perf_counter()
+                create(rows)
+                elapsed = time.perf_counter() - start
+                algorithm = User.objects.filter(email=rows[0]['email']).values_list('password', flat=True)[0]
+                transaction.set_rollback(True)
+            self.stdout.write(
+                f'{name:>24}: {count / elapsed:8.1f} пользователей/s, '
+                f'100k за {100000 / count * elapsed / 60:6.1f} min ({algorithm.split("$")[0]})'
+            )
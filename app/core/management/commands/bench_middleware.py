@@ -0,0 +1,88 @@
+import base64
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.benchmark import measure_requests, override_api_settings
+from core.models import User
+from SocialNetworkFriendsService import settings_api
+
+BENCH_PASSWORD = 'bench-password'
+
+# стек до разделения API и админки: все middleware на каждый запрос, Session и Basic перед JWT
+LEGACY_MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+LEGACY_AUTHENTICATION_CLASSES = (
+    'rest_framework.authentication.SessionAuthentication',
+    'rest_framework.authentication.BasicAuthentication',
+    'rest_framework_simplejwt.authentication.JWTAuthentication',
+)
+
+
+def get_profiles() -> dict:
+    """Профиль -> переопределения настроек"""
+    return {
+        'прежний стек': {
+            'MIDDLEWARE': LEGACY_MIDDLEWARE,
+            'REST_FRAMEWORK': {
+                **settings.REST_FRAMEWORK, 'DEFAULT_AUTHENTICATION_CLASSES': LEGACY_AUTHENTICATION_CLASSES,
+            },
+        },
+        'settings (обход для API)': {},
+        'settings_api': {
+            'MIDDLEWARE': settings_api.MIDDLEWARE,
+            'ROOT_URLCONF': settings_api.ROOT_URLCONF,
+            'REST_FRAMEWORK': settings_api.REST_FRAMEWORK,
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Накладные расходы middleware и классов аутентификации на запрос к API (в процессе, без сети): '
+        'прежний стек, текущий settings и профиль settings_api. Данные откатываются после замера'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=500)
+        parser.add_argument('--basic-repeat', type=int, default=5, help='Повторов запроса с Basic-заголовком')
+        parser.add_argument('--rounds', type=int, default=3)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = User.objects.create_user(email='benchmiddleware@example.com', password=BENCH_PASSWORD)
+            jwt_headers = {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'}
+            basic = base64.b64encode(f'{user.email}:{BENCH_PASSWORD}'.encode()).decode()
+            basic_headers = {'Authorization': f'Basic {basic}'}
+            requests = [
+                ('JWT /user/me/profile/', '/user/me/profile/?friends=count', jwt_headers, options['repeat']),
+                ('JWT /user/me/friends/', '/user/me/friends/', jwt_headers, options['repeat']),
+                ('Basic /user/me/profile/', '/user/me/profile/?friends=count', basic_headers, options['basic_repeat']),
+            ]
+            # профили чередуются по кругу, берется лучший p50 из rounds - на одном ядре шум сравним с разницей
+            results = {}
+            logging.getLogger('django.request').setLevel(logging.ERROR)
+            for _ in range(options['rounds']):
+                for profile, overrides in get_profiles().items():
+                    with override_api_settings(**overrides):
+                        for name, path, headers, repeat in requests:
+                            stats = measure_requests(path, headers, repeat)
+                            best = results.setdefault((profile, name), stats)
+                            if stats['p50'] < best['p50']:
+                                results[profile, name] = stats
+            for (profile, name), stats in results.items():
+                self.stdout.write(
+                    f'{profile:>24} {name:>24}: p50 {stats["p50"]:7.2f} ms, p99 {stats["p99"]:7.2f} ms, '
+                    f'запросов {stats["queries"]:.1f}'
+                )
+            transaction.set_rollback(True)
@@ -0,0 +1,59 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core import cache as friends_cache
+from core.models import Friendship
+from core.services import get_mutual_friend_ids
+from core.synthetic import create_users, create_friendships
+
+
+def measure(func, repeat: int) -> float:
+    """Среднее время вызова в миллисекундах"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк общих друзей на синтетическом графе (данные откатываются после замера)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--friends', type=int, default=10000, help='Друзей у каждого из двух пользователей')
+        parser.add_argument('--overlap', type=float, default=0.5, help='Доля общих друзей')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        friends, repeat = options['friends'], options['repeat']
+        common = int(friends * options['overlap'])
+        with transaction.atomic():
+            user_id, other_id = create_users(2, prefix='bench')
+            friend_ids = create_users(2 * friends - common, prefix='bench')
+            create_friendships(
+                [(user_id, friend_id) for friend_id in friend_ids[:friends]]
+                + [(other_id, friend_id) for friend_id in friend_ids[friends - common:]]
+            )
+            self.stdout.write(f'{friends} друзей у каждого, {common} общих, {2 * friends} строк Friendship')
+            version_keys = [friends_cache.version_key(user_id), friends_cache.version_key(other_id)]
+
+            mutual = Friendship.objects.mutual_friends_of(user_id, other_id)
+            results = {
+                'sql count': measure(mutual.count, repeat),
+                'sql first page (50)': measure(
+                    lambda: list(mutual.order_by('friendship_date', 'id')[:50]), repeat
+                ),
+                'cache cold (ids)': measure(
+                    lambda: (cache.delete_many(version_keys), get_mutual_friend_ids(user_id, other_id)), repeat
+                ),
+                'cache warm (ids)': measure(lambda: get_mutual_friend_ids(user_id, other_id), repeat),
+            }
+            counts = {'cache': len(get_mutual_friend_ids(user_id, other_id)), 'sql': mutual.count()}
+            if set(counts.values()) != {common}:
+                raise CommandError(f'Общих друзей должно быть {common}, получено: {counts}')
+            for name, value in results.items():
+                self.stdout.write(f'{name:>24}: {value:8.2f} ms')
+            transaction.set_rollback(True)
+        cache.delete_many(version_keys)
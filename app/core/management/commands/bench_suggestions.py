@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.models import Friendship
+from core.services import get_suggestions
+from core.synthetic import create_users, create_friendships
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк "возможно, вы знакомы" на синтетическом графе (данные откатываются после замера)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--friends', type=int, default=5000, help='Друзей у пользователя')
+        parser.add_argument('--recent', type=int, default=200, help='Последних друзей с большим числом друзей')
+        parser.add_argument('--friend-degree', type=int, default=5000, help='Друзей у каждого из последних друзей')
+        parser.add_argument('--pool', type=int, default=20000, help='Пользователей на втором шаге')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        friends, degree, pool, repeat = options['friends'], options['friend_degree'], options['pool'], options['repeat']
+        with transaction.atomic():
+            (user_id,) = create_users(1, prefix='bench')
+            friend_ids = create_users(friends, prefix='bench')
+            pool_ids = create_users(pool, prefix='bench')
+            create_friendships([(user_id, friend_id) for friend_id in friend_ids])
+            recent = friend_ids[-options['recent']:]
+            create_friendships([
+                (friend_id, pool_ids[(i * 7919 + j) % pool])
+                for i, friend_id in enumerate(recent) for j in range(degree)
+            ])
+            self.stdout.write(f'{friends} друзей, у {len(recent)} последних - по {degree} друзей из {pool}')
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(f'ANALYZE {Friendship._meta.db_table}')
+            get_suggestions(user_id)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                suggestions = get_suggestions(user_id)
+            self.stdout.write(f'suggestions: {(time.perf_counter() - start) / repeat * 1000:.2f} ms')
+            self.stdout.write(f'top (id, mutual): {suggestions[:5]}')
+            transaction.set_rollback(True)
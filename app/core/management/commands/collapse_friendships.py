@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Exists, OuterRef
+
+from core.models import Friendship
+
+PAIR_CONSTRAINT = 'friendship_pair_uniq'
+
+
+class Command(BaseCommand):
+    help = (
+        'Схлопывание зеркальных строк Friendship (A->B и B->A) в одну строку пары до migrate: '
+        'остается строка с меньшим id, она хранит направление исходной заявки'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        database, batch_size = options['database'], options['batch_size']
+        connection = connections[database]
+        table = Friendship._meta.db_table
+        with connection.cursor() as cursor:
+            if table not in connection.introspection.table_names(cursor):
+                self.stdout.write('Таблицы еще нет, схлопывать нечего')
+                return
+            # в секционированной таблице (partition_friendships) индекс с этим именем не уникален
+            constraint = connection.introspection.get_constraints(cursor, table).get(PAIR_CONSTRAINT)
+            if constraint and constraint['unique']:
+                self.stdout.write(f'{PAIR_CONSTRAINT} уже создан, зеркальных строк нет')
+                return
+
+        friendships = Friendship.objects.using(database)
+        mirrors = friendships.filter(
+            outgoing_friend_id=OuterRef('incoming_friend_id'),
+            incoming_friend_id=OuterRef('outgoing_friend_id'),
+            id__lt=OuterRef('id'),
+        )
+        duplicates = friendships.filter(Exists(mirrors)).order_by('id').values_list('id', flat=True)
+        deleted = 0
+        while True:
+            with transaction.atomic(using=database):
+                ids = list(duplicates[:batch_size])
+                if not ids:
+                    break
+                deleted += friendships.filter(id__in=ids).delete()[0]
+            self.stdout.write(f'Удалено зеркальных строк: {deleted}')
+        self.stdout.write(self.style.SUCCESS(f'Готово, удалено {deleted}'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from core import cache as friends_cache
+
+
+class Command(BaseCommand):
+    help = 'Счетчики попаданий/промахов кэша друзей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Обнулить счетчики после вывода')
+
+    def handle(self, *args, **options):
+        stats = friends_cache.get_stats()
+        total = sum(stats.values())
+        for event, value in stats.items():
+            self.stdout.write(f'{event}: {value}')
+        self.stdout.write(f'hit ratio: {stats["hits"] / total if total else 0:.2%}')
+        if options['reset']:
+            friends_cache.reset_stats()
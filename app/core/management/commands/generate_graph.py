@@ -0,0 +1,81 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q, Sum
+
+from core import counters
+from core.enums import StatusApplicationFriends
+from core.models import Friendship, FriendshipChange, User
+from core.synthetic import BATCH_SIZE, create_users, graph_users, insert_friendships, power_law_pairs
+
+USERS_BATCH_SIZE = 100000
+
+
+class Command(BaseCommand):
+    help = (
+        'Синтетический граф дружбы со степенями по степенному закону: пользователи - bulk_create, пары - COPY '
+        '(PostgreSQL). Данные остаются в базе для bench_endpoints, удаляются --delete'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--edges', type=int, default=1000000, help='Сгенерированных пар до отсева повторов')
+        parser.add_argument('--exponent', type=float, default=2.1, help='Показатель степенного закона степеней')
+        parser.add_argument('--pending', type=float, default=0.05, help='Доля заявок, которые еще не приняты')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='graph', help='Префикс username пользователей графа')
+        parser.add_argument('--delete', action='store_true', help='Удалить граф с префиксом --prefix')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['delete']:
+            return self.delete(prefix)
+        start = time.perf_counter()
+        user_ids = []
+        for offset in range(0, options['users'], USERS_BATCH_SIZE):
+            user_ids += create_users(min(USERS_BATCH_SIZE, options['users'] - offset), prefix=prefix)
+        self.stdout.write(f'Пользователей: {len(user_ids)} за {time.perf_counter() - start:.1f} s')
+
+        start = time.perf_counter()
+        rng = random.Random(options['seed'])
+        statuses = (StatusApplicationFriends.SUBMITTED, StatusApplicationFriends.ACCEPTED)
+        insert_friendships(
+            (user_id, friend_id, statuses[rng.random() >= options['pending']])
+            for user_id, friend_id in power_law_pairs(user_ids, options['edges'], options['exponent'], options['seed'])
+        )
+        self.stdout.write(f'Пары за {time.perf_counter() - start:.1f} s')
+
+        start = time.perf_counter()
+        counters.reconcile(graph_users(prefix))
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {User._meta.db_table}, {Friendship._meta.db_table}')
+        self.stdout.write(f'Счетчики и статистика за {time.perf_counter() - start:.1f} s')
+
+        totals = graph_users(prefix).aggregate(friends=Sum('friends_count'), pending=Sum('outgoing_pending_count'))
+        degrees = sorted(graph_users(prefix).values_list('friends_count', flat=True))
+        self.stdout.write(self.style.SUCCESS(
+            f'Друзей: {totals["friends"] // 2}, заявок: {totals["pending"]}. Друзей у пользователя: '
+            f'максимум {degrees[-1]}, p99 {degrees[len(degrees) * 99 // 100]}, медиана {degrees[len(degrees) // 2]}, '
+            f'без друзей {degrees.count(0)}'
+        ))
+
+    def delete(self, prefix: str) -> None:
+        """
+        Пачками по id. Только если у пользователей графа нет пар и записей журнала изменений с пользователями
+        вне графа: иначе удаление изменило бы их дружбу мимо счетчиков, кэша и журнала
+        """
+        users = graph_users(prefix)
+        mixed = Friendship.objects.filter(
+            Q(outgoing_friend__in=users) & ~Q(incoming_friend__in=users)
+            | Q(incoming_friend__in=users) & ~Q(outgoing_friend__in=users)
+        )
+        if mixed.exists() or FriendshipChange.objects.filter(user__in=users).exclude(other_user__in=users).exists():
+            raise CommandError('У пользователей графа есть пары с пользователями вне графа, удаление отменено')
+        deleted = 0
+        while ids := list(users.values_list('id', flat=True)[:BATCH_SIZE]):
+            Friendship.objects.filter(Q(outgoing_friend_id__in=ids) | Q(incoming_friend_id__in=ids)).delete()
+            deleted += User.objects.filter(id__in=ids).delete()[1].get(User._meta.label, 0)
+        self.stdout.write(self.style.SUCCESS(f'Удалено пользователей: {deleted}'))
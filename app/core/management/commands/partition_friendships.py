@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core import partitioning
+
+
+class Command(BaseCommand):
+    help = (
+        'Перевод таблицы Friendship в секционированную по HASH (outgoing_friend_id) без остановки записи: '
+        'копия таблицы, перенос строк пачками, пока триггер переносит текущие изменения, и переключение имен. '
+        'Старая таблица остается как core_friendship_unpartitioned: --undo возвращает ее, --drop-old удаляет'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--partitions', type=int, default=16)
+        parser.add_argument('--batch-size', type=int, default=50000)
+        parser.add_argument('--undo', action='store_true', help='Вернуть обычную таблицу с текущими строками')
+        parser.add_argument('--drop-old', action='store_true', help='Удалить старую таблицу после проверки')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Секционирование таблиц поддерживается только для PostgreSQL')
+        has_old = partitioning.relkind(partitioning.OLD_TABLE) is not None
+        if options['undo'] or options['drop_old']:
+            if not (partitioning.is_partitioned() and has_old):
+                raise CommandError(f'Таблица не секционирована или {partitioning.OLD_TABLE} уже удалена')
+            if options['undo']:
+                partitioning.undo()
+                self.stdout.write(self.style.SUCCESS('Возвращена обычная таблица'))
+            else:
+                partitioning.drop_old()
+                self.stdout.write(self.style.SUCCESS(f'{partitioning.OLD_TABLE} удалена'))
+            return
+        if partitioning.is_partitioned():
+            self.stdout.write('Таблица уже секционирована')
+            return
+        if has_old:
+            raise CommandError(f'{partitioning.OLD_TABLE} уже существует')
+
+        start = time.perf_counter()
+        if partitioning.relkind(partitioning.STAGING_TABLE) is None:
+            partitioning.create_staging(options['partitions'])
+        else:
+            self.stdout.write(f'{partitioning.STAGING_TABLE} уже создана, перенос продолжается')
+        copied = 0
+        for copied in partitioning.copy_rows(options['batch_size']):
+            self.stdout.write(f'Перенесено строк: {copied}')
+        partitioning.swap()
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {partitioning.TABLE}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - start:.1f} s, перенесено пачками {copied}'
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core import changelog
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаление записей журнала изменений дружбы старше FRIENDSHIP_CHANGES_RETENTION_DAYS. '
+        'Курсоры старше этого срока получают 410, и клиент загружает списки заново'
+    )
+
+    def handle(self, *args, **options):
+        deleted = changelog.prune()
+        self.stdout.write(self.style.SUCCESS(f'Удалено записей: {deleted}'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core import counters
+from core.models import User
+
+
+class Command(BaseCommand):
+    help = 'Пересчет счетчиков друзей и заявок пользователей по строкам Friendship'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=counters.RECONCILE_BATCH_SIZE)
+        parser.add_argument('ids', nargs='*', type=int, help='id пользователей, по умолчанию все')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(id__in=options['ids']) if options['ids'] else User.objects.all()
+        fixed = counters.reconcile(users, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Исправлено пользователей: {fixed}'))
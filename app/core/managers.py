@@ -1,5 +1,12 @@
 from django.contrib.auth.models import BaseUserManager
-from django.db import transaction
+from django.db import models, transaction
+from django.db.models import OuterRef, Q, Subquery, Value
+from django.db.models.functions import Greatest, Least
+
+from .enums import StatusApplicationFriends
+
+FRIEND_FIELDS = ('id', 'email', 'username')
+PAIR_FIELDS = ('outgoing_friend', 'incoming_friend')
 
 
 class UserManager(BaseUserManager):
@@ -33,3 +40,93 @@ class UserManager(BaseUserManager):
         if not extra_fields.get('username'):
             extra_fields['username'] = email.split("@")[0]
         return self._create_user(email, password=password, **extra_fields)
+
+
+class FriendshipQuerySet(models.QuerySet):
+
+    def accepted(self):
+        return self.filter(status=StatusApplicationFriends.ACCEPTED)
+
+    def submitted(self):
+        return self.filter(status=StatusApplicationFriends.SUBMITTED)
+
+    def outgoing_submitted(self, user):
+        """Исходящие заявки пользователя вместе с адресатом (один JOIN)"""
+        return self.submitted().filter(outgoing_friend=user).select_related(
+            'incoming_friend'
+        ).only('id', 'friendship_date', *(f'incoming_friend__{field}' for field in FRIEND_FIELDS))
+
+    def incoming_submitted(self, user):
+        """Входящие заявки пользователя вместе с отправителем (один JOIN)"""
+        return self.submitted().filter(incoming_friend=user).select_related(
+            'outgoing_friend'
+        ).only('id', 'friendship_date', *(f'outgoing_friend__{field}' for field in FRIEND_FIELDS))
+
+    def with_pair(self):
+        """Канонический ключ пары (меньший id, больший id) - по нему уникальный индекс friendship_pair_uniq"""
+        return self.alias(pair_low=Least(*PAIR_FIELDS), pair_high=Greatest(*PAIR_FIELDS))
+
+    def between(self, user, user_ids):
+        """Строки пар user с пользователями user_ids по каноническому ключу (направление заявки не важно)"""
+        user_id = getattr(user, 'pk', user)
+        return self.with_pair().filter(
+            Q(pair_low=user_id, pair_high__in=[other_id for other_id in user_ids if other_id > user_id])
+            | Q(pair_high=user_id, pair_low__in=[other_id for other_id in user_ids if other_id < user_id])
+        )
+
+    def friendships_of(self, user):
+        """Принятые заявки, где user с любой стороны - единственный путь чтения друзей"""
+        return self.accepted().filter(Q(outgoing_friend=user) | Q(incoming_friend=user))
+
+    def with_friends(self):
+        """Оба пользователя пары (два JOIN по первичному ключу), только поля, нужные FriendSerializer"""
+        return self.select_related(*PAIR_FIELDS).only(
+            'id', 'friendship_date', *(f'{side}__{field}' for side in PAIR_FIELDS for field in FRIEND_FIELDS)
+        )
+
+    def friends_of(self, user):
+        """friendships_of вместе с обоими пользователями пары. Друг - Friendship.get_friend(user.id)"""
+        return self.friendships_of(user).with_friends()
+
+    def friend_sides_of(self, user):
+        """
+        friends_of по сторонам пары: заявки, отправленные user, и принятые им. Каждая сторона читается по своему
+        индексу (user, status, friendship_date, id) уже в порядке страницы - см. KeysetPagination.get_page_queryset
+        """
+        friendships = self.accepted().with_friends()
+        return friendships.filter(outgoing_friend=user), friendships.filter(incoming_friend=user)
+
+    def friend_ids_of(self, user):
+        """id друзей user: UNION ALL двух index-only scan'ов по частичным индексам принятых заявок"""
+        return self.accepted().filter(outgoing_friend=user).values_list('incoming_friend_id', flat=True).union(
+            self.accepted().filter(incoming_friend=user).values_list('outgoing_friend_id', flat=True), all=True
+        )
+
+    def related_ids_of(self, user):
+        """id всех, с кем у user есть заявка в любую сторону и в любом статусе"""
+        return self.filter(outgoing_friend=user).values_list('incoming_friend_id', flat=True).union(
+            self.filter(incoming_friend=user).values_list('outgoing_friend_id', flat=True), all=True
+        )
+
+    def mutual_friends_of(self, user, other):
+        """Общие друзья user и other: строки friends_of(user), у которых второй пользователь - друг other"""
+        other_friend_ids = self.friend_ids_of(other)
+        return self.friends_of(user).filter(
+            Q(outgoing_friend=user, incoming_friend__in=other_friend_ids)
+            | Q(incoming_friend=user, outgoing_friend__in=other_friend_ids)
+        )
+
+    def relations(self, user):
+        """
+        Пользователи с их парой относительно user, одним запросом по каноническому ключу:
+        pair_status - статус пары, pair_outgoing_id - кто отправил заявку
+        """
+        user_id = getattr(user, 'pk', user)
+        pair = self.with_pair().filter(
+            pair_low=Least(Value(user_id), OuterRef('pk')), pair_high=Greatest(Value(user_id), OuterRef('pk'))
+        )
+        user_model = self.model._meta.get_field('incoming_friend').related_model
+        return user_model._default_manager.using(self.db).annotate(
+            pair_status=Subquery(pair.values('status')[:1]),
+            pair_outgoing_id=Subquery(pair.values('outgoing_friend_id')[:1]),
+        ).only(*FRIEND_FIELDS)
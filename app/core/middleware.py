@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.contrib.auth import middleware as auth_middleware
+from django.contrib.messages import middleware as messages_middleware
+from django.contrib.sessions import middleware as sessions_middleware
+from django.middleware import csrf
+
+
+def is_api_request(request) -> bool:
+    return request.path_info.startswith(tuple(settings.API_PATH_PREFIXES))
+
+
+def skip_for_api(middleware_class):
+    """
+    Подкласс middleware, через который запросы к API (settings.API_PATH_PREFIXES) проходят мимо нее.
+    API авторизуется только по JWT: сессия, request.user из сессии, CSRF и сообщения ему не нужны,
+    а админка на тех же процессах продолжает их получать
+    """
+
+    def __call__(self, request):
+        if is_api_request(request):
+            return self.get_response(request)
+        return middleware_class.__call__(self, request)
+
+    attrs = {'__call__': __call__, '__module__': __name__, '__doc__': middleware_class.__doc__}
+    if hasattr(middleware_class, 'process_view'):
+        def process_view(self, request, *args):
+            if is_api_request(request):
+                return None
+            return middleware_class.process_view(self, request, *args)
+        attrs['process_view'] = process_view
+    return type(middleware_class.__name__, (middleware_class,), attrs)
+
+
+SessionMiddleware = skip_for_api(sessions_middleware.SessionMiddleware)
+CsrfViewMiddleware = skip_for_api(csrf.CsrfViewMiddleware)
+AuthenticationMiddleware = skip_for_api(auth_middleware.AuthenticationMiddleware)
+MessageMiddleware = skip_for_api(messages_middleware.MessageMiddleware)
@@ -1,15 +1,10 @@
 from django.db import models
+from django.db.models.functions import Greatest, Least
 from django.utils import timezone
-from django.utils.translation import gettext_lazy
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
 
-from .managers import UserManager
-
-
-class StatusApplicationFriends(models.TextChoices):
-    ACCEPTED = 'ACC', gettext_lazy('Заявка принята')
-    REJECTED = 'REJ', gettext_lazy('Заявка отклонена')
-    SUBMITTED = 'SUB', gettext_lazy('Заявка подана')
+from .enums import StatusApplicationFriends
+from .managers import UserManager, FriendshipQuerySet, PAIR_FIELDS
 
 
 class User(AbstractBaseUser, PermissionsMixin):
@@ -21,6 +16,10 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_staff = models.BooleanField(default=False, verbose_name='Aдминистратор')
     is_superuser = models.BooleanField(default=False, verbose_name='++')
     date_joined = models.DateTimeField(default=timezone.now, verbose_name='Время Регистрации')
+    # денормализованные счетчики, меняются вместе со строками Friendship (см. core.counters)
+    friends_count = models.IntegerField(default=0, editable=False, verbose_name='Друзей')
+    incoming_pending_count = models.IntegerField(default=0, editable=False, verbose_name='Входящих заявок')
+    outgoing_pending_count = models.IntegerField(default=0, editable=False, verbose_name='Исходящих заявок')
     objects = UserManager()
 
     USERNAME_FIELD = 'email'
@@ -55,11 +54,64 @@ class Friendship(models.Model):
         choices=StatusApplicationFriends.choices,
     )
     friendship_date = models.DateTimeField(auto_now=True)
+    objects = FriendshipQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Завка в друзья'
         verbose_name_plural = 'Заявки в друзья'
-        unique_together = ('outgoing_friend', 'incoming_friend')
+        constraints = [
+            # одна строка на пару: (меньший id, больший id), направление заявки - порядок outgoing/incoming
+            models.UniqueConstraint(
+                Least(*PAIR_FIELDS), Greatest(*PAIR_FIELDS), name='friendship_pair_uniq'
+            ),
+        ]
+        indexes = [
+            # ключи курсорной пагинации списков друзей и заявок: (пользователь, статус, friendship_date, id)
+            models.Index(
+                fields=['outgoing_friend', 'status', 'friendship_date', 'id'],
+                name='friendship_out_date_idx',
+            ),
+            models.Index(
+                fields=['incoming_friend', 'status', 'friendship_date', 'id'],
+                name='friendship_in_date_idx',
+            ),
+            # частичные индексы по принятым заявкам: id друзей читаются index-only scan'ом в обе стороны
+            models.Index(
+                fields=['outgoing_friend', 'incoming_friend'],
+                condition=models.Q(status=StatusApplicationFriends.ACCEPTED),
+                name='friendship_out_acc_idx',
+            ),
+            models.Index(
+                fields=['incoming_friend', 'outgoing_friend'],
+                condition=models.Q(status=StatusApplicationFriends.ACCEPTED),
+                name='friendship_in_acc_idx',
+            ),
+        ]
 
     def __str__(self) -> str:
         return f'{self.outgoing_friend} => {self.incoming_friend}  status={self.status}'
+
+    def get_friend(self, user_id: int) -> User:
+        """Второй пользователь пары относительно user_id"""
+        return self.incoming_friend if self.outgoing_friend_id == user_id else self.outgoing_friend
+
+
+class FriendshipChange(models.Model):
+    """
+    Журнал изменений пар для инкрементальной синхронизации (GET /user/me/changes/): на каждое изменение пары -
+    строка каждому участнику с новым состоянием пары. id - курсор синхронизации (см. core.changelog)
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', db_index=False)
+    other_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', verbose_name='Второй в паре')
+    # пустой статус - строки пары больше нет (заявку отменили)
+    status = models.CharField(max_length=3, choices=StatusApplicationFriends.choices, blank=True)
+    outgoing = models.BooleanField(verbose_name='Заявка от user')
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Изменение дружбы'
+        verbose_name_plural = 'Изменения дружбы'
+        indexes = [
+            # изменения пользователя после курсора: стоимость чтения - по числу изменений, а не друзей
+            models.Index(fields=['user', 'id'], name='friendship_change_user_idx'),
+        ]
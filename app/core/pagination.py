@@ -0,0 +1,124 @@
+import base64
+import binascii
+import functools
+import operator
+from datetime import datetime
+
+from django.db import connections
+from django.db.models import BooleanField, F, Func, Value
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class RowGreaterThan(Func):
+    """
+    (a, b) > (c, d) - сравнение строк: по индексу (..., a, b) это условие индекса,
+    скан начинается с курсора даже при одинаковых датах
+    """
+    output_field = BooleanField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sqls, params = [], []
+        for expression in self.get_source_expressions():
+            sql, expression_params = compiler.compile(expression)
+            sqls.append(sql)
+            params.extend(expression_params)
+        half = len(sqls) // 2
+        return f'({", ".join(sqls[:half])}) > ({", ".join(sqls[half:])})', params
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная (keyset) пагинация по паре (дата, id).
+    Следующая страница выбирается условием WHERE (date, id) > (курсор),
+    поэтому страница N стоит столько же, сколько первая
+    """
+    ordering = ('friendship_date', 'id')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    invalid_cursor_message = 'Некорректный курсор'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+        return min(max(page_size, 1), self.max_page_size)
+
+    def encode_cursor(self, instance):
+        date_field, id_field = self.ordering
+        position = f'{getattr(instance, date_field).isoformat()}|{getattr(instance, id_field)}'
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            date, pk = base64.urlsafe_b64decode(encoded.encode()).decode().split('|')
+            return datetime.fromisoformat(date), int(pk)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_page_queryset(self, queryset, request):
+        """
+        Запрос страницы: строки после курсора, на одну больше размера страницы - признак следующей.
+        queryset может быть кортежем частей (например, FriendshipQuerySet.friend_sides_of): тогда курсор и лимит
+        ставятся в каждую часть, и части объединяются UNION ALL - каждая идет по своему индексу (дата, id)
+        и останавливается на лимите, сливаются не больше 2 * (размер страницы + 1) строк.
+        Где LIMIT в частях UNION не поддерживается (SQLite), части объединяются через OR
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        parts = queryset if isinstance(queryset, tuple) else (queryset,)
+        if not connections[parts[0].db].features.supports_slicing_ordering_in_compound:
+            parts = (functools.reduce(operator.or_, parts),)
+        cursor = self.decode_cursor(request)
+        parts = [self.filter_after(part, cursor).order_by(*self.ordering)[:self.page_size + 1] for part in parts]
+        if len(parts) == 1:
+            return parts[0]
+        return parts[0].union(*parts[1:], all=True).order_by(*self.ordering)[:self.page_size + 1]
+
+    def filter_after(self, queryset, cursor):
+        if cursor is None:
+            return queryset
+        return queryset.filter(RowGreaterThan(*(F(field) for field in self.ordering), *(Value(v) for v in cursor)))
+
+    def get_page(self, rows: list) -> list:
+        self.has_next = len(rows) > self.page_size
+        page = rows[:self.page_size]
+        self.next_cursor = self.encode_cursor(page[-1]) if self.has_next else None
+        return page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.get_page(list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request):
+        """То же для асинхронных view: строки читаются асинхронным ORM"""
+        return self.get_page([row async for row in self.get_page_queryset(queryset, request)])
+
+    def resume(self, request, next_cursor) -> None:
+        """Состояние после paginate_queryset для страницы из кэша: ссылка на следующую строится по текущему запросу"""
+        self.request = request
+        self.next_cursor = next_cursor
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
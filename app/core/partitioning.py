@@ -0,0 +1,236 @@
+import re
+
+from django.db import connection, transaction
+
+from .models import Friendship, User
+
+TABLE = Friendship._meta.db_table
+# новая таблица до переключения и старая после него
+STAGING_TABLE = f'{TABLE}_partitioned'
+OLD_TABLE = f'{TABLE}_unpartitioned'
+# суффиксы имен индексов и ограничений новой таблицы до переключения и старой после него
+STAGING_SUFFIX = '_part'
+OLD_SUFFIX = '_old'
+SYNC_FUNCTION = f'{TABLE}_partition_sync'
+PAIR_FUNCTION = f'{TABLE}_pair_check'
+PAIR_CONSTRAINT = 'friendship_pair_uniq'
+PARTITION_KEY = Friendship._meta.get_field('outgoing_friend').column
+PAIR_COLUMNS = (PARTITION_KEY, Friendship._meta.get_field('incoming_friend').column)
+
+
+def relkind(table: str) -> str | None:
+    """'r' - обычная таблица, 'p' - секционированная, None - таблицы нет"""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', [table])
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def is_partitioned() -> bool:
+    return connection.vendor == 'postgresql' and relkind(TABLE) == 'p'
+
+
+def get_columns() -> str:
+    return ', '.join(field.column for field in Friendship._meta.concrete_fields)
+
+
+def get_indexes(cursor, table: str) -> list[tuple[str, str, bool]]:
+    """(имя, CREATE INDEX ..., уникальный) индексов таблицы, кроме индексов под ограничениями"""
+    cursor.execute(
+        'SELECT c.relname, pg_get_indexdef(i.indexrelid), i.indisunique FROM pg_index i '
+        'JOIN pg_class c ON c.oid = i.indexrelid '
+        'WHERE i.indrelid = %s::regclass '
+        'AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = i.indexrelid) ORDER BY c.relname',
+        [table],
+    )
+    return cursor.fetchall()
+
+
+def rename_objects(cursor, table: str, rename) -> None:
+    """Переименование ограничений и индексов таблицы: имя -> rename(имя)"""
+    cursor.execute('SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass', [table])
+    for name, in cursor.fetchall():
+        if rename(name) != name:
+            cursor.execute(f'ALTER TABLE {table} RENAME CONSTRAINT {name} TO {rename(name)}')
+    for name, _, _ in get_indexes(cursor, table):
+        if rename(name) != name:
+            cursor.execute(f'ALTER INDEX {name} RENAME TO {rename(name)}')
+
+
+def create_staging(partitions: int) -> None:
+    """
+    Секционированная по HASH (outgoing_friend_id) копия таблицы Friendship и триггер, который переносит в нее
+    изменения старой таблицы на время копирования строк.
+    Уникальные индексы секционированной таблицы должны содержать ключ секционирования без выражений, поэтому
+    первичный ключ - (id, outgoing_friend_id), а friendship_pair_uniq становится обычным индексом для поиска пары
+    и дополняется UNIQUE (outgoing_friend_id, incoming_friend_id). Зеркальную строку пары исключает триггер
+    create_pair_check, его ставит swap
+    """
+    columns, staging = get_columns(), STAGING_TABLE
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE {staging} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE) '
+            f'PARTITION BY HASH ({PARTITION_KEY})'
+        )
+        for remainder in range(partitions):
+            cursor.execute(
+                f'CREATE TABLE {TABLE}_p{remainder} PARTITION OF {staging} '
+                f'FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})'
+            )
+        cursor.execute(
+            f'ALTER TABLE {staging} ADD CONSTRAINT {TABLE}_pkey{STAGING_SUFFIX} PRIMARY KEY (id, {PARTITION_KEY})'
+        )
+        cursor.execute(
+            f'ALTER TABLE {staging} ADD CONSTRAINT friendship_out_in_uniq{STAGING_SUFFIX} '
+            f'UNIQUE ({", ".join(PAIR_COLUMNS)})'
+        )
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass "
+            "AND contype = 'f'", [TABLE]
+        )
+        for name, definition in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {staging} ADD CONSTRAINT {name}{STAGING_SUFFIX} {definition}')
+        for name, definition, _ in get_indexes(cursor, TABLE):
+            definition = re.sub(
+                r'^CREATE (UNIQUE )?INDEX \S+ ON \S+ ', f'CREATE INDEX {name}{STAGING_SUFFIX} ON {staging} ', definition
+            )
+            cursor.execute(definition)
+        new_values = ', '.join(f'NEW.{field.column}' for field in Friendship._meta.concrete_fields)
+        key = f'id = OLD.id AND {PARTITION_KEY} = OLD.{PARTITION_KEY}'
+        cursor.execute(f"""
+            CREATE FUNCTION {SYNC_FUNCTION}() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                IF TG_OP = 'TRUNCATE' THEN
+                    TRUNCATE {staging};
+                    RETURN NULL;
+                END IF;
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    DELETE FROM {staging} WHERE {key};
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO {staging} ({columns}) VALUES ({new_values}) ON CONFLICT DO NOTHING;
+                END IF;
+                RETURN NULL;
+            END $$
+        """)
+        cursor.execute(
+            f'CREATE TRIGGER {SYNC_FUNCTION} AFTER INSERT OR UPDATE OR DELETE ON {TABLE} '
+            f'FOR EACH ROW EXECUTE FUNCTION {SYNC_FUNCTION}()'
+        )
+        cursor.execute(
+            f'CREATE TRIGGER {SYNC_FUNCTION}_truncate AFTER TRUNCATE ON {TABLE} '
+            f'FOR EACH STATEMENT EXECUTE FUNCTION {SYNC_FUNCTION}()'
+        )
+
+
+def create_pair_check(cursor) -> None:
+    """
+    Замена уникальности friendship_pair_uniq: перед вставкой строки или сменой ее пользователей блокируются
+    строки обоих пользователей (в том же порядке, что в services.lock_relations) и проверяется, что зеркальной
+    строки нет. Блокировка нужна для записей без lock_relations (админка, генераторы): встречные вставки одной
+    пары идут последовательно, и вторая видит первую. Нарушение - unique_violation, как у индекса
+    """
+    outgoing, incoming = PAIR_COLUMNS
+    cursor.execute(f"""
+        CREATE FUNCTION {PAIR_FUNCTION}() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            PERFORM 1 FROM {User._meta.db_table} WHERE id IN (NEW.{outgoing}, NEW.{incoming})
+                ORDER BY id FOR NO KEY UPDATE;
+            IF EXISTS (
+                SELECT 1 FROM {TABLE} WHERE {outgoing} = NEW.{incoming} AND {incoming} = NEW.{outgoing} AND id <> NEW.id
+            ) THEN
+                RAISE unique_violation USING CONSTRAINT = '{PAIR_CONSTRAINT}', MESSAGE = format(
+                    'duplicate key value violates unique constraint "{PAIR_CONSTRAINT}": (%s, %s)',
+                    NEW.{outgoing}, NEW.{incoming}
+                );
+            END IF;
+            RETURN NEW;
+        END $$
+    """)
+    cursor.execute(
+        f'CREATE TRIGGER {PAIR_FUNCTION} BEFORE INSERT OR UPDATE OF {outgoing}, {incoming} ON {TABLE} '
+        f'FOR EACH ROW EXECUTE FUNCTION {PAIR_FUNCTION}()'
+    )
+
+
+def copy_rows(batch_size: int):
+    """
+    Перенос строк, существовавших до создания триггера, пачками по id - транзакция на пачку, генератор числа
+    перенесенных строк. FOR SHARE дожидается конкурентных изменений строк пачки и читает их последнюю версию:
+    то, что изменится позже, перенесет триггер. Повторный запуск пропускает уже перенесенное (ON CONFLICT)
+    """
+    columns = get_columns()
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT max(id) FROM {TABLE}')
+        max_id = cursor.fetchone()[0] or 0
+    last_id, copied = 0, 0
+    while last_id < max_id:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT max(id) FROM (SELECT id FROM {TABLE} WHERE id > %s ORDER BY id LIMIT %s) batch',
+                [last_id, batch_size],
+            )
+            upper_id = cursor.fetchone()[0]
+            if upper_id is None:
+                break
+            cursor.execute(
+                f'INSERT INTO {STAGING_TABLE} ({columns}) SELECT {columns} FROM {TABLE} '
+                f'WHERE id > %s AND id <= %s FOR SHARE ON CONFLICT DO NOTHING',
+                [last_id, upper_id],
+            )
+            copied += cursor.rowcount
+        last_id = upper_id
+        yield copied
+
+
+def swap() -> None:
+    """
+    Переключение в одной транзакции под ACCESS EXCLUSIVE: триггер удаляется, старая таблица с индексами
+    и последовательностью id получает имена с OLD_TABLE/OLD_SUFFIX, новая - исходные и триггер create_pair_check.
+    id новых строк - из последовательности, продолженной с max(id)
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(f'DROP TRIGGER {SYNC_FUNCTION} ON {TABLE}')
+        cursor.execute(f'DROP TRIGGER {SYNC_FUNCTION}_truncate ON {TABLE}')
+        cursor.execute(f'DROP FUNCTION {SYNC_FUNCTION}()')
+        cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [TABLE, 'id'])
+        sequence = cursor.fetchone()[0]
+        rename_objects(cursor, TABLE, lambda name: f'{name}{OLD_SUFFIX}')
+        cursor.execute(f'ALTER SEQUENCE {sequence} RENAME TO {sequence.split(".")[-1]}{OLD_SUFFIX}')
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}')
+        cursor.execute(f'ALTER TABLE {STAGING_TABLE} RENAME TO {TABLE}')
+        rename_objects(cursor, TABLE, lambda name: name.removesuffix(STAGING_SUFFIX))
+        cursor.execute(f'CREATE SEQUENCE {sequence} OWNED BY {TABLE}.id')
+        cursor.execute(f"SELECT setval('{sequence}', coalesce(max(id), 0) + 1, false) FROM {TABLE}")
+        cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+        create_pair_check(cursor)
+
+
+def undo() -> None:
+    """
+    Возврат к обычной таблице: текущие строки секционированной копируются в OLD_TABLE, она получает исходные
+    имена, секционированная таблица удаляется. Под ACCESS EXCLUSIVE обеих таблиц - запись на это время стоит
+    """
+    columns = get_columns()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {TABLE}, {OLD_TABLE} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(f'TRUNCATE {OLD_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {OLD_TABLE} ({columns}) OVERRIDING SYSTEM VALUE SELECT {columns} FROM {TABLE}'
+        )
+        cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [TABLE, 'id'])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f'DROP TABLE {TABLE}')
+        cursor.execute(f'DROP FUNCTION {PAIR_FUNCTION}()')
+        cursor.execute(f'ALTER TABLE {OLD_TABLE} RENAME TO {TABLE}')
+        rename_objects(cursor, TABLE, lambda name: name.removesuffix(OLD_SUFFIX))
+        cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [TABLE, 'id'])
+        old_sequence = cursor.fetchone()[0]
+        cursor.execute(f'ALTER SEQUENCE {old_sequence} RENAME TO {sequence.split(".")[-1]}')
+        cursor.execute(f"SELECT setval('{sequence}', coalesce(max(id), 0) + 1, false) FROM {TABLE}")
+
+
+def drop_old() -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE {OLD_TABLE}')
@@ -0,0 +1,75 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from rest_framework.permissions import SAFE_METHODS
+
+# чтения текущего запроса можно отдать репликам - выставляет ReplicaReadMixin
+replica_reads = ContextVar('replica_reads', default=False)
+
+
+def pin_key(user_id: int) -> str:
+    return f'replica:pin:{user_id}'
+
+
+def pin_to_primary(*user_ids: int) -> None:
+    """
+    После фиксации текущей транзакции чтения о user_ids идут в primary REPLICA_PIN_SECONDS секунд:
+    пользователь видит свою запись, а кэш друзей не заполняется строками отстающей реплики
+    """
+    if settings.REPLICA_DATABASES:
+        keys = dict.fromkeys(map(pin_key, user_ids), True)
+        transaction.on_commit(lambda: cache.set_many(keys, settings.REPLICA_PIN_SECONDS))
+
+
+def is_pinned(*user_ids: int) -> bool:
+    return bool(cache.get_many([pin_key(user_id) for user_id in user_ids]))
+
+
+class ReplicaRouter:
+    """
+    Чтения в запросах, разрешенных ReplicaReadMixin, - на случайную из REPLICA_DATABASES, все остальное - в default.
+    Запись всегда в default, в том числе для объектов, прочитанных с реплики
+    """
+
+    def db_for_read(self, model, **hints):
+        if settings.REPLICA_DATABASES and replica_reads.get():
+            return random.choice(settings.REPLICA_DATABASES)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.REPLICA_DATABASES
+
+
+class ReplicaReadMixin:
+    """
+    Для APIView: GET/HEAD/OPTIONS после аутентификации читают с реплик, если ни пользователь запроса,
+    ни пользователь из url (pk) не меняли дружбу последние REPLICA_PIN_SECONDS (см. pin_to_primary)
+    """
+
+    def get_replica_user_ids(self) -> list[int]:
+        user_ids = [self.request.user.id]
+        pk = str(self.kwargs.get('pk', ''))
+        if pk.isdigit():
+            user_ids.append(int(pk))
+        return user_ids
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if settings.REPLICA_DATABASES and request.method in SAFE_METHODS \
+                and not is_pinned(*self.get_replica_user_ids()):
+            self.replica_token = replica_reads.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if token := getattr(self, 'replica_token', None):
+            replica_reads.reset(token)
+            self.replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -1,8 +1,21 @@
 from drf_yasg.utils import swagger_serializer_method
 from rest_framework import serializers
 
-from .models import User, Friendship, StatusApplicationFriends
-from .enums import StatusEnum, StatusApplicationEnum
+from . import cache as friends_cache
+from .models import User, Friendship
+from .enums import StatusEnum, StatusApplicationEnum, FriendsProjectionEnum
+from .services import SUGGESTIONS_DEGREE_LIMIT, SUGGESTIONS_FRIENDS_LIMIT
+
+
+def get_friends_projection(request) -> FriendsProjectionEnum:
+    """Представление списка друзей из ?friends= (по умолчанию full)"""
+    value = request.query_params.get('friends') if request is not None else None
+    try:
+        return FriendsProjectionEnum(value or FriendsProjectionEnum.FULL)
+    except ValueError:
+        raise serializers.ValidationError(
+            {'friends': f'Допустимые значения: {", ".join(e.value for e in FriendsProjectionEnum)}'}
+        )
 
 
 class FriendSerializer(serializers.ModelSerializer):
@@ -12,6 +25,16 @@ class FriendSerializer(serializers.ModelSerializer):
         fields = ('id', 'email', 'username')
 
 
+class SuggestionSerializer(FriendSerializer):
+    mutual = serializers.IntegerField(help_text=(
+        f'Общие друзья в выборке: {SUGGESTIONS_FRIENDS_LIMIT} последних друзей, у каждого - '
+        f'{SUGGESTIONS_DEGREE_LIMIT} друзей с наименьшими id. При больших степенях - нижняя оценка'
+    ))
+
+    class Meta(FriendSerializer.Meta):
+        fields = FriendSerializer.Meta.fields + ('mutual',)
+
+
 class UserCreateSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -33,7 +56,9 @@ class UserCreateSerializer(serializers.ModelSerializer):
                 instance.set_password(value)
             else:
                 setattr(instance, attr, value)
-        instance.save()
+        # только переданные поля: счетчики (core.counters) меняются параллельно через F() и не перезаписываются
+        instance.save(update_fields=validated_data.keys())
+        friends_cache.invalidate_profile(instance.id, validated_data.keys())
         return instance
 
 
@@ -43,12 +68,30 @@ class UserSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = User
-        fields = ('id', 'email', 'first_name', 'last_name', 'date_joined', 'username', 'friends')
+        fields = (
+            'id', 'email', 'first_name', 'last_name', 'date_joined', 'username', 'friends',
+            'friends_count', 'incoming_pending_count', 'outgoing_pending_count',
+        )
+        read_only_fields = ('friends_count', 'incoming_pending_count', 'outgoing_pending_count')
 
     @swagger_serializer_method(serializer_or_field=FriendSerializer(many=True))
     def get_friends(self, obj):
-        friends = User.objects.get(id=obj.id).incoming_friends.filter(status=StatusApplicationFriends.ACCEPTED)
-        return FriendSerializer([i.incoming_friend for i in friends], many=True).data
+        """
+        Список друзей из кэша, при промахе - одним запросом:
+        full - объекты, ids - только id, count - количество (счетчик из строки пользователя)
+        """
+        projection = get_friends_projection(self.context.get('request'))
+        if projection == FriendsProjectionEnum.COUNT:
+            return obj.friends_count
+        if projection == FriendsProjectionEnum.IDS:
+            return friends_cache.get_friend_ids(obj.id)
+        return friends_cache.get_or_set(obj.id, 'profile', lambda: FriendSerializer(
+            sorted(
+                (friendship.get_friend(obj.id) for friendship in Friendship.objects.friends_of(obj)),
+                key=lambda friend: friend.username,
+            ),
+            many=True,
+        ).data)
 
 
 class FriendshipOutSerializer(serializers.ModelSerializer):
@@ -67,6 +110,22 @@ class FriendshipInSerializer(serializers.ModelSerializer):
         fields = ('id', 'in_user')
 
 
+class PathSerializer(serializers.Serializer):
+    depth = serializers.IntegerField(help_text='Количество рукопожатий')
+    path = FriendSerializer(many=True, help_text='Цепочка друзей от текущего пользователя до выбранного')
+
+
+class ChangesSerializer(serializers.Serializer):
+    cursor = serializers.CharField(help_text='since для следующего запроса')
+    has_more = serializers.BooleanField(help_text='После cursor есть еще изменения')
+    friends = FriendSerializer(many=True, help_text='Стали друзьями')
+    submitted_in = FriendSerializer(many=True, help_text='Новые входящие заявки')
+    submitted_out = FriendSerializer(many=True, help_text='Новые исходящие заявки')
+    removed = serializers.ListField(
+        child=serializers.IntegerField(), help_text='id пользователей, с которыми больше нет ни дружбы, ни заявки'
+    )
+
+
 class ResponseSerializer(serializers.Serializer):
     detail = serializers.CharField()
     status = serializers.ChoiceField(StatusEnum.items())
@@ -74,3 +133,16 @@ class ResponseSerializer(serializers.Serializer):
 
 class StatusApplicationSerializer(serializers.Serializer):
     status_application = serializers.ChoiceField(StatusApplicationEnum.items())
+
+
+class UserIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=500)
+
+
+class RelationSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    status = serializers.ChoiceField(StatusApplicationEnum.items())
+
+
+class ApplicationOutcomeSerializer(ResponseSerializer):
+    id = serializers.IntegerField()
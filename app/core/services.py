@@ -0,0 +1,333 @@
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status as http_status
+
+from . import cache as friends_cache
+from . import changelog
+from . import counters
+from . import graph as friends_graph
+from . import routers
+from .enums import StatusEnum, StatusApplicationEnum, StatusApplicationFriends
+from .models import Friendship, User
+
+PATH_MAX_DEPTH = 6
+PATH_MAX_VISITS = 100000
+
+SUGGESTIONS_LIMIT = 20
+SUGGESTIONS_MAX_LIMIT = 100
+SUGGESTIONS_FRIENDS_LIMIT = 100
+SUGGESTIONS_DEGREE_LIMIT = 200
+# второй шаг: по каждому другу не больше degree_limit его друзей с наименьшими id
+SUGGESTIONS_LATERAL_SQL = """
+        SELECT second.id, COUNT(*) AS mutual
+        FROM friend CROSS JOIN LATERAL (
+            SELECT id FROM (
+                (SELECT incoming_friend_id AS id FROM {table}
+                 WHERE outgoing_friend_id = friend.id AND status = %(accepted)s
+                 ORDER BY incoming_friend_id LIMIT %(degree_limit)s)
+                UNION ALL
+                (SELECT outgoing_friend_id FROM {table}
+                 WHERE incoming_friend_id = friend.id AND status = %(accepted)s
+                 ORDER BY outgoing_friend_id LIMIT %(degree_limit)s)
+            ) AS side
+            ORDER BY id
+            LIMIT %(degree_limit)s
+        ) AS second
+        GROUP BY second.id
+"""
+SUGGESTIONS_WINDOW_SQL = """
+        SELECT id, COUNT(*) AS mutual FROM (
+            SELECT side.id, ROW_NUMBER() OVER (PARTITION BY side.friend_id ORDER BY side.id) AS position
+            FROM (
+                SELECT friend.id AS friend_id, incoming_friend_id AS id
+                FROM friend JOIN {table} ON outgoing_friend_id = friend.id AND status = %(accepted)s
+                UNION ALL
+                SELECT friend.id, outgoing_friend_id
+                FROM friend JOIN {table} ON incoming_friend_id = friend.id AND status = %(accepted)s
+            ) AS side
+        ) AS ranked
+        WHERE position <= %(degree_limit)s
+        GROUP BY id
+"""
+SUGGESTIONS_SQL = """
+    WITH friend AS MATERIALIZED (
+        SELECT CASE WHEN outgoing_friend_id = %(user_id)s THEN incoming_friend_id ELSE outgoing_friend_id END AS id
+        FROM {table}
+        WHERE (outgoing_friend_id = %(user_id)s OR incoming_friend_id = %(user_id)s) AND status = %(accepted)s
+        ORDER BY friendship_date DESC, {table}.id DESC
+        LIMIT %(friends_limit)s
+    ), candidate AS MATERIALIZED ({candidates})
+    SELECT candidate.id, candidate.mutual FROM candidate
+    WHERE candidate.id <> %(user_id)s
+        AND candidate.id NOT IN (SELECT incoming_friend_id FROM {table} WHERE outgoing_friend_id = %(user_id)s)
+        AND candidate.id NOT IN (SELECT outgoing_friend_id FROM {table} WHERE incoming_friend_id = %(user_id)s)
+    ORDER BY candidate.mutual DESC, candidate.id
+    LIMIT %(limit)s
+"""
+
+
+def success(detail: str, code: int = http_status.HTTP_200_OK) -> dict:
+    return {"status": StatusEnum.SUCCESS, "detail": detail, "code": code}
+
+
+def unsuccess(detail: str, code: int = http_status.HTTP_400_BAD_REQUEST) -> dict:
+    return {"status": StatusEnum.UNSUCCESS, "detail": detail, "code": code}
+
+
+def resolve_status_application(status_out: str | None, status_in: str | None) -> StatusApplicationEnum:
+    """
+    Статус отношений пары по статусам заявок в обе стороны
+    (status_out - от текущего пользователя, status_in - к текущему пользователю)
+    """
+    if status_in == StatusApplicationFriends.SUBMITTED:
+        return StatusApplicationEnum.OUT
+    if status_in == StatusApplicationFriends.ACCEPTED:
+        return StatusApplicationEnum.FRI
+    if status_in == StatusApplicationFriends.REJECTED:
+        return StatusApplicationEnum.REJ
+    if status_out == StatusApplicationFriends.SUBMITTED:
+        return StatusApplicationEnum.IN
+    return StatusApplicationEnum.NONE
+
+
+def split_pair_status(user_id: int, status: str | None, outgoing_id: int | None) -> tuple[str | None, str | None]:
+    """
+    (status_out, status_in) по строке пары: заявка SUB направлена в одну сторону,
+    принятая/отклоненная пара относится к обоим
+    """
+    if status == StatusApplicationFriends.SUBMITTED:
+        return (status, None) if outgoing_id == user_id else (None, status)
+    return status, status
+
+
+def get_statuses_application(user, user_ids: list[int]) -> dict[int, StatusApplicationEnum]:
+    """Статусы отношений user с каждым из user_ids одним запросом к Friendship"""
+    pairs = {user_id: (None, None) for user_id in user_ids}
+    for outgoing_id, incoming_id, status in Friendship.objects.between(user, user_ids).values_list(
+        'outgoing_friend_id', 'incoming_friend_id', 'status'
+    ):
+        other_id = incoming_id if outgoing_id == user.id else outgoing_id
+        pairs[other_id] = split_pair_status(user.id, status, outgoing_id)
+    return {user_id: resolve_status_application(*pair) for user_id, pair in pairs.items()}
+
+
+def get_mutual_friend_ids(user_id: int, other_id: int) -> list[int]:
+    """Отсортированные id общих друзей - пересечение кэшированных отсортированных списков друзей"""
+    other_friend_ids = set(friends_cache.get_friend_ids(other_id))
+    return [friend_id for friend_id in friends_cache.get_friend_ids(user_id) if friend_id in other_friend_ids]
+
+
+def get_suggestions(
+    user_id: int,
+    limit: int = SUGGESTIONS_LIMIT,
+    friends_limit: int = SUGGESTIONS_FRIENDS_LIMIT,
+    degree_limit: int = SUGGESTIONS_DEGREE_LIMIT,
+) -> list[tuple[int, int]]:
+    """
+    (id кандидата, число общих друзей в выборке) по убыванию общих друзей.
+    Выборка: friends_limit последних друзей (по friendship_date, затем id заявки), у каждого - degree_limit
+    его друзей с наименьшими id, то есть не больше friends_limit * degree_limit строк при любой степени вершин.
+    Для пользователей со степенями ниже лимитов число точное, иначе - нижняя оценка, одинаковая от вызова к вызову.
+    На PostgreSQL ограничение по другу - LATERAL ... ORDER BY id LIMIT по частичным индексам принятых заявок
+    (скан останавливается на лимите), на остальных СУБД - ROW_NUMBER() с тем же результатом.
+    Существующие пары исключаются один раз по агрегату кандидатов
+    """
+    connection = connections[router.db_for_read(Friendship)]
+    table = Friendship._meta.db_table
+    candidates = SUGGESTIONS_LATERAL_SQL if connection.vendor == 'postgresql' else SUGGESTIONS_WINDOW_SQL
+    with connection.cursor() as cursor:
+        cursor.execute(SUGGESTIONS_SQL.format(table=table, candidates=candidates.format(table=table)), {
+            'user_id': user_id,
+            'accepted': StatusApplicationFriends.ACCEPTED,
+            'friends_limit': friends_limit,
+            'degree_limit': degree_limit,
+            'limit': limit,
+        })
+        return cursor.fetchall()
+
+
+def find_path(
+    user_id: int, other_id: int, max_depth: int = PATH_MAX_DEPTH, max_visits: int = PATH_MAX_VISITS
+) -> list[int] | None:
+    """
+    Кратчайшая цепочка друзей user_id -> other_id (id по порядку) двунаправленным BFS.
+    Шаг - один запрос по принятым заявкам всего фронта с меньшей стороны.
+    None - пути нет длиной до max_depth или обход прочитал бы больше max_visits строк
+    """
+    if user_id == other_id:
+        return [user_id]
+    parents = ({user_id: None}, {other_id: None})
+    frontiers = ([user_id], [other_id])
+    budget = max_visits
+    for _ in range(max_depth):
+        side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+        visited, other_visited = parents[side], parents[1 - side]
+        expanding = set(frontiers[side])
+        rows = list(
+            Friendship.objects.accepted().filter(
+                Q(outgoing_friend_id__in=expanding) | Q(incoming_friend_id__in=expanding)
+            ).values_list('outgoing_friend_id', 'incoming_friend_id')[:budget + 1]
+        )
+        if len(rows) > budget:
+            return None
+        budget -= len(rows)
+        frontier = []
+        for pair in rows:
+            for parent_id, friend_id in (pair, pair[::-1]):
+                if parent_id not in expanding or friend_id in visited:
+                    continue
+                visited[friend_id] = parent_id
+                if friend_id in other_visited:
+                    return build_path(friend_id, parents)
+                frontier.append(friend_id)
+        if not frontier:
+            return None
+        frontiers = (frontier, frontiers[1]) if side == 0 else (frontiers[0], frontier)
+    return None
+
+
+def build_path(meeting_id: int, parents: tuple[dict, dict]) -> list[int]:
+    """Цепочка через общую вершину двух деревьев BFS: от корня parents[0] к корню parents[1]"""
+    path, node_id = [], meeting_id
+    while node_id is not None:
+        path.append(node_id)
+        node_id = parents[0][node_id]
+    path.reverse()
+    node_id = parents[1][meeting_id]
+    while node_id is not None:
+        path.append(node_id)
+        node_id = parents[1][node_id]
+    return path
+
+
+def lock_relations(user, user_ids: list[int]) -> dict:
+    """
+    Пользователи user_ids со статусами заявок status_out/status_in относительно user (см. split_pair_status).
+    Сначала строки user и user_ids блокируются SELECT ... FOR UPDATE в порядке id: переходы по одной паре,
+    в том числе встречные заявки, выполняются последовательно и без взаимных блокировок.
+    Статусы читаются отдельным запросом - в READ COMMITTED у него будет снимок после получения блокировки.
+    Вызывать внутри transaction.atomic()
+    """
+    list(User.objects.select_for_update().filter(id__in=[user.id, *user_ids]).order_by('id').values_list('id'))
+    targets = {target.id: target for target in Friendship.objects.relations(user).filter(id__in=user_ids)}
+    for target in targets.values():
+        target.status_out, target.status_in = split_pair_status(user.id, target.pair_status, target.pair_outgoing_id)
+    return targets
+
+
+def submit_applications(user, user_ids: list[int]) -> dict[int, dict]:
+    """
+    Отправка/одобрение заявок пользователям user_ids в одной транзакции:
+    одно чтение статусов пар с блокировкой, затем по одному запросу на каждый вид изменения.
+    Встречная заявка принимается UPDATE своей же строки - у пары остается одна строка
+    """
+    outcomes, accept, submit = {}, [], []
+    with transaction.atomic():
+        targets = lock_relations(user, user_ids)
+        for user_id in user_ids:
+            target = targets.get(user_id)
+            if user_id == user.id:
+                outcomes[user_id] = unsuccess("Вы не можете отправить заявку самому себе")
+            elif target is None:
+                outcomes[user_id] = unsuccess("Пользователь не найден", http_status.HTTP_404_NOT_FOUND)
+            elif target.status_in == StatusApplicationFriends.SUBMITTED:
+                accept.append(user_id)
+                outcomes[user_id] = success("Вы теперь друзья", http_status.HTTP_201_CREATED)
+            elif target.status_in == StatusApplicationFriends.ACCEPTED:
+                outcomes[user_id] = unsuccess("Вы и так друзья")
+            elif target.status_in == StatusApplicationFriends.REJECTED:
+                outcomes[user_id] = unsuccess("Вы не сможете стать друзьями", http_status.HTTP_200_OK)
+            elif target.status_out is not None:
+                outcomes[user_id] = unsuccess("Заявка и так отправлена")
+            else:
+                submit.append(user_id)
+                outcomes[user_id] = success("Заявка успешно отправлена", http_status.HTTP_201_CREATED)
+        if accept:
+            Friendship.objects.submitted().filter(outgoing_friend_id__in=accept, incoming_friend=user).update(
+                status=StatusApplicationFriends.ACCEPTED, friendship_date=timezone.now()
+            )
+        Friendship.objects.bulk_create(
+            [
+                Friendship(outgoing_friend=user, incoming_friend_id=user_id, status=StatusApplicationFriends.SUBMITTED)
+                for user_id in submit
+            ],
+            ignore_conflicts=True,
+        )
+        if accept or submit:
+            deltas = counters.CounterDeltas()
+            deltas.add(counters.ACCEPT, user.id, accept)
+            deltas.add(counters.SUBMIT, user.id, submit)
+            deltas.save()
+            changelog.record(
+                *((user_id, user.id, StatusApplicationFriends.ACCEPTED) for user_id in accept),
+                *((user.id, user_id, StatusApplicationFriends.SUBMITTED) for user_id in submit),
+            )
+            friends_cache.invalidate(user.id, *accept, *submit)
+            routers.pin_to_primary(user.id, *accept, *submit)
+        if accept:
+            friends_graph.add_friends(user.id, accept)
+    return outcomes
+
+
+def reject_applications(user, user_ids: list[int]) -> dict[int, dict]:
+    """
+    Отклонение входящих/отмена исходящих заявок пользователей user_ids в одной транзакции
+    """
+    outcomes, reject, cancel = {}, [], []
+    with transaction.atomic():
+        targets = lock_relations(user, user_ids)
+        for user_id in user_ids:
+            target = targets.get(user_id)
+            if user_id == user.id:
+                outcomes[user_id] = unsuccess("Вы не можете удалить самого себя!")
+            elif target is None:
+                outcomes[user_id] = unsuccess("Пользователь не найден", http_status.HTTP_404_NOT_FOUND)
+            elif target.status_in == StatusApplicationFriends.SUBMITTED:
+                reject.append(user_id)
+                outcomes[user_id] = success("Заявка отклонена. Следующие будут автоматом отклонены")
+            elif target.status_in == StatusApplicationFriends.REJECTED:
+                outcomes[user_id] = unsuccess("Заявка была уже отклонена", http_status.HTTP_200_OK)
+            elif target.status_out == StatusApplicationFriends.SUBMITTED:
+                cancel.append(user_id)
+                outcomes[user_id] = success("Заявка отменена")
+            else:
+                outcomes[user_id] = unsuccess("Заявки не существует")
+        if reject:
+            Friendship.objects.submitted().filter(outgoing_friend_id__in=reject, incoming_friend=user).update(
+                status=StatusApplicationFriends.REJECTED, friendship_date=timezone.now()
+            )
+        if cancel:
+            Friendship.objects.submitted().filter(outgoing_friend=user, incoming_friend_id__in=cancel).delete()
+        if reject or cancel:
+            deltas = counters.CounterDeltas()
+            deltas.add(counters.REJECT, user.id, reject)
+            deltas.add(counters.CANCEL, user.id, cancel)
+            deltas.save()
+            changelog.record(
+                *((user_id, user.id, StatusApplicationFriends.REJECTED) for user_id in reject),
+                *((user.id, user_id, '') for user_id in cancel),
+            )
+            friends_cache.invalidate(user.id, *reject, *cancel)
+            routers.pin_to_primary(user.id, *reject, *cancel)
+    return outcomes
+
+
+def remove_friend(user, friend) -> bool:
+    """
+    Удаление из друзей: строка пары ACC -> REJ одним условным UPDATE. False - друзьями не были.
+    Счетчики меняются только если UPDATE нашел строку - повторное удаление их не уменьшит
+    """
+    with transaction.atomic():
+        if not Friendship.objects.accepted().between(user, [friend.id]).update(
+            status=StatusApplicationFriends.REJECTED, friendship_date=timezone.now()
+        ):
+            return False
+        deltas = counters.CounterDeltas()
+        deltas.add(counters.REMOVE, user.id, [friend.id])
+        deltas.save()
+        changelog.record((user.id, friend.id, StatusApplicationFriends.REJECTED))
+        friends_cache.invalidate(user.id, friend.id)
+        routers.pin_to_primary(user.id, friend.id)
+        friends_graph.remove_friends(user.id, [friend.id])
+    return True
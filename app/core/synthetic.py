@@ -0,0 +1,111 @@
+import io
+import itertools
+import random
+import re
+import uuid
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, make_password
+from django.db import connection, transaction
+from django.db.models import Value
+from django.db.models.functions import Concat
+
+from . import partitioning
+from .enums import StatusApplicationFriends
+from .models import User, Friendship
+
+BATCH_SIZE = 5000
+SYNTHETIC_DOMAIN = 'example.com'
+COPY_BATCH_SIZE = 100000
+
+
+def create_users(count: int, prefix: str = 'synthetic') -> list[int]:
+    """
+    Синтетические пользователи для нагрузочных тестов, id в порядке создания.
+    Пароль непригоден для входа - хэширование не тратит время на генерацию
+    """
+    run = uuid.uuid4().hex[:8]
+    password = make_password(None)
+    users = User.objects.bulk_create(
+        [
+            User(username=f'{prefix}{run}_{i}', email=f'{prefix}{run}_{i}@{SYNTHETIC_DOMAIN}', password=password)
+            for i in range(count)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    return [user.id for user in users]
+
+
+def graph_users(prefix: str):
+    """
+    Пользователи, созданные create_users с префиксом prefix: username {prefix}{run}_{i}, email из username
+    в домене SYNTHETIC_DOMAIN и пароль, непригодный для входа. Настоящий пользователь с username на prefix сюда
+    не попадает
+    """
+    return User.objects.filter(
+        username__regex=rf'^{re.escape(prefix)}[0-9a-f]{{8}}_[0-9]+$',
+        email=Concat('username', Value(f'@{SYNTHETIC_DOMAIN}')),
+        password__startswith=UNUSABLE_PASSWORD_PREFIX,
+    )
+
+
+def create_friendships(pairs, status: str = StatusApplicationFriends.ACCEPTED) -> None:
+    """Строки пар (user_id, friend_id) со статусом status, заявка - от user_id. Повторы пар пропускаются"""
+    insert_friendships((user_id, friend_id, status) for user_id, friend_id in pairs)
+
+
+def power_law_pairs(user_ids: list[int], edges: int, exponent: float = 2.1, seed: int = 0):
+    """
+    edges пар (user_id, friend_id) со степенями по степенному закону (модель Чунга-Лу): оба конца ребра
+    выбираются с весом rank^(-1/(exponent-1)), ранги раздаются user_ids в случайном порядке.
+    Петли отбрасываются, повторы пар остаются - их отсекает уникальный индекс при вставке
+    """
+    rng = random.Random(seed)
+    ranked = user_ids[:]
+    rng.shuffle(ranked)
+    cum_weights = list(itertools.accumulate((rank + 1) ** (-1 / (exponent - 1)) for rank in range(len(ranked))))
+    for start in range(0, edges, BATCH_SIZE):
+        k = min(BATCH_SIZE, edges - start)
+        left = rng.choices(ranked, cum_weights=cum_weights, k=k)
+        right = rng.choices(ranked, cum_weights=cum_weights, k=k)
+        yield from ((user_id, friend_id) for user_id, friend_id in zip(left, right) if user_id != friend_id)
+
+
+def insert_friendships(rows) -> None:
+    """
+    Строки (outgoing_id, incoming_id, status) пачками без повторов пар. На PostgreSQL - COPY во временную таблицу
+    и INSERT ... ON CONFLICT DO NOTHING (повторы и зеркальные пары отсекает friendship_pair_uniq, в секционированной
+    таблице - partition_friendships - отбор в самом INSERT), на остальных СУБД - bulk_create
+    """
+    if connection.vendor != 'postgresql':
+        create_rows = (Friendship(outgoing_friend_id=out_id, incoming_friend_id=in_id, status=status)
+                       for out_id, in_id, status in rows)
+        while batch := list(itertools.islice(create_rows, BATCH_SIZE)):
+            Friendship.objects.bulk_create(batch, ignore_conflicts=True)
+        return
+    table = Friendship._meta.db_table
+    fields = ('outgoing_friend', 'incoming_friend', 'status', 'friendship_date')
+    columns = ', '.join(Friendship._meta.get_field(name).column for name in fields)
+    select, mirror = 'SELECT', ''
+    if partitioning.is_partitioned():
+        # friendship_pair_uniq там не уникален, а триггер пары прервал бы вставку: зеркальные пары отсекаются
+        # в пачке и по уже вставленным строкам
+        select = 'SELECT DISTINCT ON (LEAST(outgoing_id, incoming_id), GREATEST(outgoing_id, incoming_id))'
+        mirror = (
+            f' WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE outgoing_friend_id = incoming_id '
+            f'AND incoming_friend_id = outgoing_id)'
+        )
+    rows = iter(rows)
+    # временная таблица живет в сессии: в одной транзакции она не потеряется за PgBouncer (transaction pooling)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMP TABLE synthetic_friendship (outgoing_id bigint, incoming_id bigint, status varchar(3))'
+        )
+        while batch := list(itertools.islice(rows, COPY_BATCH_SIZE)):
+            buffer = io.StringIO(''.join(f'{out_id}\t{in_id}\t{status}\n' for out_id, in_id, status in batch))
+            cursor.copy_expert('COPY synthetic_friendship FROM STDIN', buffer)
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) {select} outgoing_id, incoming_id, status, now() '
+                f'FROM synthetic_friendship{mirror} ON CONFLICT DO NOTHING'
+            )
+            cursor.execute('TRUNCATE synthetic_friendship')
+        cursor.execute('DROP TABLE synthetic_friendship')
@@ -1,10 +1,46 @@
-from django.test import TestCase, TransactionTestCase
+import base64
+import datetime
+import json
+import os
+import re
+import runpy
+import tempfile
+import threading
+import time
+from collections import Counter
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+from django.contrib.admin import site
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections, router, transaction
+from django.db.models import F, QuerySet
+from django.core.cache import cache
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
 from rest_framework_simplejwt.tokens import RefreshToken
+from SocialNetworkFriendsService import settings_api
 
-from .models import Friendship, User, StatusApplicationFriends
+from .models import Friendship, FriendshipChange, User, StatusApplicationFriends
 from .serializers import UserCreateSerializer
 from .test_data import TEST_DATA_USERS
 from .enums import StatusEnum, StatusApplicationEnum
+from .benchmark import measure_sequence, override_api_settings
+from .pagination import KeysetPagination
+from .user_import import import_users
+from .synthetic import create_friendships, graph_users, insert_friendships, power_law_pairs
+from .services import submit_applications, reject_applications, remove_friend, find_path, get_suggestions
+from . import cache as friends_cache
+from . import changelog
+from . import counters
+from . import graph as friends_graph
+from . import routers
+from . import partitioning
 
 
 def get_credits(data: dict) -> dict:
@@ -17,6 +53,11 @@ def create_user(data: dict) -> User:
     return serializer.save()
 
 
+def make_friends(user_1: User, user_2: User) -> None:
+    Friendship.objects.create(outgoing_friend=user_1, incoming_friend=user_2, status=StatusApplicationFriends.ACCEPTED)
+    User.objects.filter(id__in=[user_1.id, user_2.id]).update(friends_count=F("friends_count") + 1)
+
+
 class CreateUserAPIViewTests(TestCase):
 
     def test_post_success(self):
@@ -99,6 +140,26 @@ class UserAPIViewTests(TestCase):
         self.assertTrue(isinstance(response_dict["friends"], list))
         self.assertTrue(isinstance(response_dict["id"], int))
 
+    def test_get_friends_projection(self):
+        make_friends(self.user_1, self.user_2)
+        headers = {"Authorization": f"Bearer {self.token}"}
+        response = self.client.get(f"/user/{self.id_2}/", headers=headers)
+        self.assertEqual(response.json()["friends"][0]["id"], self.user_1.id)
+        response = self.client.get(f"/user/{self.id_2}/?friends=ids", headers=headers)
+        self.assertEqual(response.json()["friends"], [self.user_1.id])
+        response = self.client.get(f"/user/{self.id_2}/?friends=count", headers=headers)
+        self.assertEqual(response.json()["friends"], 1)
+        response = self.client.get(f"/user/{self.id_2}/?friends=all", headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_query_count(self):
+        for i in range(10):
+            make_friends(self.user_2, User.objects.create_user(email=f"friend{i}@example.com", password="pass"))
+        # пользователь из JWT + профиль + друзья, независимо от их количества
+        with self.assertNumQueries(3):
+            response = self.client.get(f"/user/{self.id_2}/", headers={"Authorization": f"Bearer {self.token}"})
+        self.assertEqual(len(response.json()["friends"]), 10)
+
     def test_get_error_not_exist_id(self):
         response = self.client.get("/user/22/", headers={"Authorization": f"Bearer {self.token}"})
         self.assertEqual(response.status_code, 404)
@@ -110,11 +171,6 @@ class UserAPIViewTests(TestCase):
             incoming_friend=self.user_1,
             status=StatusApplicationFriends.ACCEPTED
         ).save()
-        Friendship(
-            outgoing_friend=self.user_1,
-            incoming_friend=self.user_2,
-            status=StatusApplicationFriends.ACCEPTED
-        ).save()
         response = self.client.delete(f"/user/{self.id_2}/", headers={"Authorization": f"Bearer {self.token}"})
         self.assertEqual(response.status_code, 200)
         self.assertTrue(Friendship.objects.filter(
@@ -122,17 +178,9 @@ class UserAPIViewTests(TestCase):
             incoming_friend=self.user_1,
             status=StatusApplicationFriends.REJECTED
         ).exists())
-        self.assertTrue(Friendship.objects.filter(
-            outgoing_friend=self.user_1,
-            incoming_friend=self.user_2,
-            status=StatusApplicationFriends.REJECTED
-        ).exists())
+        self.assertEqual(Friendship.objects.between(self.user_1, [self.id_2]).count(), 1)
         with self.assertRaises(Friendship.DoesNotExist):
-            Friendship.objects.get(
-                outgoing_friend=self.user_1,
-                incoming_friend=self.user_2,
-                status=StatusApplicationFriends.ACCEPTED
-            )
+            Friendship.objects.between(self.user_1, [self.id_2]).get(status=StatusApplicationFriends.ACCEPTED)
 
     def test_delete_error_not_exits(self):
         response = self.client.delete(f"/user/{self.id_2}/", headers={"Authorization": f"Bearer {self.token}"})
@@ -155,7 +203,7 @@ class SubmittedApplicationInANDOutViewSetTests(TestCase):
     def test_get_in(self):
         response = self.client.get("/user/me/submitted/in/", headers={"Authorization": f"Bearer {self.token_1}"})
         self.assertEqual(response.status_code, 200)
-        response_list = response.json()
+        response_list = response.json()["results"]
         self.assertEqual(len(response_list), 1)
         self.assertEqual(response_list[0]["in_user"]["id"], self.user_2.id)
         self.assertEqual(response_list[0]["in_user"]["email"], self.user_2.email)
@@ -164,12 +212,23 @@ class SubmittedApplicationInANDOutViewSetTests(TestCase):
     def test_get_out(self):
         response = self.client.get("/user/me/submitted/out/", headers={"Authorization": f"Bearer {self.token_2}"})
         self.assertEqual(response.status_code, 200)
-        response_list = response.json()
+        response_list = response.json()["results"]
         self.assertEqual(len(response_list), 1)
         self.assertEqual(response_list[0]["out_user"]["id"], self.user_1.id)
         self.assertEqual(response_list[0]["out_user"]["email"], self.user_1.email)
         self.assertEqual(response_list[0]["out_user"]["username"], self.user_1.username)
 
+    def test_get_in_query_count(self):
+        user_3 = create_user(TEST_DATA_USERS[2])
+        Friendship(
+            outgoing_friend=user_3,
+            incoming_friend=self.user_1,
+            status=StatusApplicationFriends.SUBMITTED
+        ).save()
+        with self.assertNumQueries(2):
+            response = self.client.get("/user/me/submitted/in/", headers={"Authorization": f"Bearer {self.token_1}"})
+        self.assertEqual(len(response.json()["results"]), 2)
+
 
 class FriendsViewSetTests(TestCase):
     def setUp(self):
@@ -183,16 +242,6 @@ class FriendsViewSetTests(TestCase):
             incoming_friend=self.user_2,
             status=StatusApplicationFriends.ACCEPTED
         ).save()
-        Friendship(
-            outgoing_friend=self.user_2,
-            incoming_friend=self.user_1,
-            status=StatusApplicationFriends.ACCEPTED
-        ).save()
-        Friendship(
-            outgoing_friend=self.user_1,
-            incoming_friend=self.user_3,
-            status=StatusApplicationFriends.ACCEPTED
-        ).save()
         Friendship(
             outgoing_friend=self.user_3,
             incoming_friend=self.user_1,
@@ -203,16 +252,11 @@ class FriendsViewSetTests(TestCase):
             incoming_friend=self.user_3,
             status=StatusApplicationFriends.ACCEPTED
         ).save()
-        Friendship(
-            outgoing_friend=self.user_3,
-            incoming_friend=self.user_2,
-            status=StatusApplicationFriends.ACCEPTED
-        ).save()
 
     def test_get_friends_user1(self):
         response = self.client.get("/user/me/friends/", headers={"Authorization": f"Bearer {self.token_1}"})
         self.assertEqual(response.status_code, 200)
-        response_list = response.json()
+        response_list = response.json()["results"]
         self.assertEqual(len(response_list), 2)
         for i, item in enumerate(response_list):
             item["email"] = TEST_DATA_USERS[item["id"] - 1]["email"]
@@ -221,12 +265,193 @@ class FriendsViewSetTests(TestCase):
     def test_get_friends_user2(self):
         response = self.client.get("/user/me/friends/", headers={"Authorization": f"Bearer {self.token_3}"})
         self.assertEqual(response.status_code, 200)
-        response_list = response.json()
+        response_list = response.json()["results"]
         self.assertEqual(len(response_list), 2)
         for i, item in enumerate(response_list):
             item["email"] = TEST_DATA_USERS[item["id"] - 1]["email"]
             item["username"] = TEST_DATA_USERS[item["id"] - 1]["username"]
 
+    def test_get_friends_query_count(self):
+        # 1 запрос на пользователя из JWT + 1 на список друзей, независимо от их количества
+        with self.assertNumQueries(2):
+            self.client.get("/user/me/friends/", headers={"Authorization": f"Bearer {self.token_1}"})
+        for i in range(10):
+            make_friends(self.user_1, User.objects.create_user(email=f"friend{i}@example.com", password="pass"))
+        with self.assertNumQueries(2):
+            response = self.client.get("/user/me/friends/", headers={"Authorization": f"Bearer {self.token_1}"})
+        self.assertEqual(len(response.json()["results"]), 12)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user_1 = create_user(TEST_DATA_USERS[0])
+        self.token_1 = RefreshToken.for_user(self.user_1).access_token
+        for i in range(7):
+            friend = User.objects.create_user(email=f"friend{i}@example.com", password="pass")
+            make_friends(self.user_1, friend)
+        self.incoming = [
+            Friendship.objects.create(
+                outgoing_friend=User.objects.create_user(email=f"in{i}@example.com", password="pass"),
+                incoming_friend=self.user_1,
+                status=StatusApplicationFriends.SUBMITTED
+            )
+            for i in range(5)
+        ]
+
+    def walk(self, url: str) -> list:
+        items = []
+        while url:
+            response = self.client.get(url, headers={"Authorization": f"Bearer {self.token_1}"})
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertLessEqual(len(page["results"]), 3)
+            items += page["results"]
+            url = page["next"]
+        return items
+
+    def test_friends_pages(self):
+        friends = self.walk("/user/me/friends/?page_size=3")
+        self.assertEqual(len(friends), 7)
+        self.assertEqual(len({item["id"] for item in friends}), 7)
+
+    def test_submitted_in_pages(self):
+        applications = self.walk("/user/me/submitted/in/?page_size=3")
+        self.assertEqual([item["id"] for item in applications], [item.id for item in self.incoming])
+
+    def test_next_page_query_count(self):
+        response = self.client.get("/user/me/friends/?page_size=3", headers={"Authorization": f"Bearer {self.token_1}"})
+        with self.assertNumQueries(2):
+            self.client.get(response.json()["next"], headers={"Authorization": f"Bearer {self.token_1}"})
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/user/me/friends/?cursor=xxx", headers={"Authorization": f"Bearer {self.token_1}"})
+        self.assertEqual(response.status_code, 404)
+
+
+class FriendshipIndexesTests(TestCase):
+
+    def test_indexes_created(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Friendship._meta.db_table)
+        for index in Friendship._meta.indexes:
+            self.assertIn(index.name, constraints)
+            self.assertTrue(constraints[index.name]["index"])
+
+    def test_pair_stored_once(self):
+        user_1, user_2 = create_user(TEST_DATA_USERS[0]), create_user(TEST_DATA_USERS[1])
+        make_friends(user_1, user_2)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            make_friends(user_2, user_1)
+        call_command("collapse_friendships", stdout=StringIO())
+        self.assertEqual(Friendship.objects.between(user_1, [user_2.id]).count(), 1)
+
+
+class CollapseFriendshipsTests(TransactionTestCase):
+    """Зеркальные строки, оставшиеся от хранения пары двумя строками, - до создания friendship_pair_uniq"""
+
+    def setUp(self):
+        self.constraint = next(c for c in Friendship._meta.constraints if c.name == "friendship_pair_uniq")
+        with connection.schema_editor() as editor:
+            editor.remove_constraint(Friendship, self.constraint)
+
+    def tearDown(self):
+        Friendship.objects.all().delete()
+        with connection.schema_editor() as editor:
+            editor.add_constraint(Friendship, self.constraint)
+
+    def test_collapse(self):
+        user_1, user_2, user_3 = (create_user(data) for data in TEST_DATA_USERS[:3])
+        status = StatusApplicationFriends.ACCEPTED
+        kept = [
+            Friendship.objects.create(outgoing_friend=user_1, incoming_friend=user_2, status=status),
+            Friendship.objects.create(outgoing_friend=user_3, incoming_friend=user_1, status=status),
+        ]
+        Friendship.objects.create(outgoing_friend=user_2, incoming_friend=user_1, status=status)
+        Friendship.objects.create(outgoing_friend=user_1, incoming_friend=user_3, status=status)
+        kept.append(Friendship.objects.create(
+            outgoing_friend=user_2, incoming_friend=user_3, status=StatusApplicationFriends.SUBMITTED
+        ))
+        out = StringIO()
+        call_command("collapse_friendships", "--batch-size", "1", stdout=out)
+        self.assertIn("Готово, удалено 2", out.getvalue())
+        # остается строка с меньшим id - направление исходной заявки
+        self.assertEqual(list(Friendship.objects.order_by("id")), kept)
+
+
+@skipUnless(connection.vendor == "postgresql", "EXPLAIN-тесты индексов только для PostgreSQL (TEST_WITH_POSTGRES=1)")
+class FriendshipIndexScanTests(TestCase):
+    """Горячие запросы к Friendship должны уметь идти по индексам, а не Seq Scan"""
+
+    def setUp(self):
+        self.user_1 = create_user(TEST_DATA_USERS[0])
+        self.user_2 = create_user(TEST_DATA_USERS[1])
+        make_friends(self.user_1, self.user_2)
+        with connection.cursor() as cursor:
+            # на маленькой таблице планировщик всегда выберет Seq Scan - запрещаем его до конца теста
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(f"ANALYZE {Friendship._meta.db_table}")
+
+    def get_nodes(self, queryset: QuerySet) -> list:
+        nodes, plan = [json.loads(queryset.explain(format="json"))[0]["Plan"]], []
+        while nodes:
+            node = nodes.pop()
+            nodes += node.get("Plans", [])
+            plan.append(node)
+        return plan
+
+    def get_scans(self, queryset: QuerySet) -> list:
+        return [
+            (node["Node Type"], node.get("Index Name")) for node in self.get_nodes(queryset)
+            if node.get("Relation Name") == Friendship._meta.db_table or "Index Name" in node
+        ]
+
+    def assertIndexScan(self, queryset: QuerySet, *index_names: str):
+        scans = self.get_scans(queryset)
+        self.assertNotIn("Seq Scan", {node_type for node_type, _ in scans}, scans)
+        if index_names:
+            self.assertTrue({index_name for _, index_name in scans} & set(index_names), scans)
+
+    def test_pair_lookup(self):
+        self.assertIndexScan(Friendship.objects.between(self.user_1, [self.user_2.id]), "friendship_pair_uniq")
+
+    def test_friends_page(self):
+        paginator = KeysetPagination()
+        for params in ({}, {"cursor": paginator.encode_cursor(Friendship.objects.get())}):
+            request = Request(APIRequestFactory().get("/user/me/friends/", params))
+            page = paginator.get_page_queryset(Friendship.objects.friend_sides_of(self.user_1), request)
+            # обе стороны пары - по своему индексу (user, status, дата, id) с LIMIT, без сортировки всех друзей
+            scans = self.get_scans(page)
+            self.assertNotIn("Seq Scan", {node_type for node_type, _ in scans}, scans)
+            self.assertLessEqual({"friendship_out_date_idx", "friendship_in_date_idx"}, {name for _, name in scans})
+            self.assertNotIn("Sort", {node["Node Type"] for node in self.get_nodes(page)}, page.explain())
+
+    def test_friend_ids(self):
+        self.assertIndexScan(
+            Friendship.objects.friend_ids_of(self.user_1), "friendship_out_acc_idx", "friendship_in_acc_idx"
+        )
+
+    def test_friend_ids_reverse(self):
+        self.assertIndexScan(
+            Friendship.objects.accepted().filter(incoming_friend=self.user_1).values("outgoing_friend_id"),
+            "friendship_in_acc_idx"
+        )
+
+    def test_submitted_lists(self):
+        self.assertIndexScan(
+            Friendship.objects.incoming_submitted(self.user_1).order_by("friendship_date", "id"),
+            "friendship_in_date_idx"
+        )
+        self.assertIndexScan(
+            Friendship.objects.outgoing_submitted(self.user_1).order_by("friendship_date", "id"),
+            "friendship_out_date_idx"
+        )
+
+    def test_changes_after_cursor(self):
+        self.assertIndexScan(
+            FriendshipChange.objects.filter(user=self.user_1, id__gt=0).order_by("id")[:10],
+            "friendship_change_user_idx"
+        )
+
 
 class ApplicationAPIViewTests(TransactionTestCase):
     def setUp(self):
@@ -300,11 +525,7 @@ class ApplicationAPIViewTests(TransactionTestCase):
             incoming_friend=self.user_2,
             status=StatusApplicationFriends.ACCEPTED
         ))
-        self.assertTrue(Friendship.objects.get(
-            outgoing_friend=self.user_2,
-            incoming_friend=self.user_1,
-            status=StatusApplicationFriends.ACCEPTED
-        ))
+        self.assertEqual(Friendship.objects.between(self.user_1, [self.user_2.id]).count(), 1)
 
     def test_post_error_send_app_when_are_friends(self):
         Friendship(
@@ -312,11 +533,6 @@ class ApplicationAPIViewTests(TransactionTestCase):
             incoming_friend=self.user_1,
             status=StatusApplicationFriends.ACCEPTED
         ).save()
-        Friendship(
-            outgoing_friend=self.user_1,
-            incoming_friend=self.user_2,
-            status=StatusApplicationFriends.ACCEPTED
-        ).save()
         response = self.client.post(
             f"/user/{self.user_2.id}/application/",
             headers={"Authorization": f"Bearer {self.token_1}"}
@@ -331,11 +547,6 @@ class ApplicationAPIViewTests(TransactionTestCase):
             incoming_friend=self.user_1,
             status=StatusApplicationFriends.REJECTED
         ).save()
-        Friendship(
-            outgoing_friend=self.user_1,
-            incoming_friend=self.user_2,
-            status=StatusApplicationFriends.REJECTED
-        ).save()
         response = self.client.post(
             f"/user/{self.user_2.id}/application/",
             headers={"Authorization": f"Bearer {self.token_1}"}
@@ -394,11 +605,7 @@ class ApplicationAPIViewTests(TransactionTestCase):
             incoming_friend=self.user_2,
             status=StatusApplicationFriends.REJECTED)
         )
-        self.assertTrue(Friendship.objects.get(
-            outgoing_friend=self.user_2,
-            incoming_friend=self.user_1,
-            status=StatusApplicationFriends.REJECTED)
-        )
+        self.assertEqual(Friendship.objects.between(self.user_1, [self.user_2.id]).count(), 1)
 
     def test_delete_error_self(self):
         response = self.client.delete(
@@ -438,11 +645,6 @@ class ApplicationAPIViewTests(TransactionTestCase):
             incoming_friend=self.user_1,
             status=StatusApplicationFriends.ACCEPTED
         ).save()
-        Friendship(
-            outgoing_friend=self.user_1,
-            incoming_friend=self.user_2,
-            status=StatusApplicationFriends.ACCEPTED
-        ).save()
         response = self.client.get(
             f"/user/{self.user_2.id}/application/",
             headers={"Authorization": f"Bearer {self.token_1}"}
@@ -474,17 +676,37 @@ class ApplicationAPIViewTests(TransactionTestCase):
         response_dict = response.json()
         self.assertEqual(response_dict["status"], StatusApplicationEnum.OUT)
 
+    def test_get_query_count(self):
+        make_friends(self.user_1, self.user_2)
+        # пользователь из JWT + статус пары одним запросом
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                f"/user/{self.user_2.id}/application/",
+                headers={"Authorization": f"Bearer {self.token_1}"}
+            )
+        self.assertEqual(response.json()["status"], StatusApplicationEnum.FRI)
+
+    def test_post_accept_query_count(self):
+        Friendship(
+            outgoing_friend=self.user_2,
+            incoming_friend=self.user_1,
+            status=StatusApplicationFriends.SUBMITTED
+        ).save()
+        # пользователь из JWT + транзакция: блокировка пары, чтение статусов, UPDATE строки пары,
+        # UPDATE счетчиков у каждой стороны, INSERT в журнал изменений
+        with self.assertNumQueries(9):
+            response = self.client.post(
+                f"/user/{self.user_2.id}/application/",
+                headers={"Authorization": f"Bearer {self.token_1}"}
+            )
+        self.assertEqual(response.json()["detail"], "Вы теперь друзья")
+
     def test_get_success_rej(self):
         Friendship(
             outgoing_friend=self.user_1,
             incoming_friend=self.user_2,
             status=StatusApplicationFriends.REJECTED
         ).save()
-        Friendship(
-            outgoing_friend=self.user_2,
-            incoming_friend=self.user_1,
-            status=StatusApplicationFriends.REJECTED
-        ).save()
         response = self.client.get(
             f"/user/{self.user_2.id}/application/",
             headers={"Authorization": f"Bearer {self.token_1}"}
@@ -492,3 +714,1046 @@ class ApplicationAPIViewTests(TransactionTestCase):
         self.assertEqual(response.status_code, 200)
         response_dict = response.json()
         self.assertEqual(response_dict["status"], StatusApplicationEnum.REJ)
+
+
+class RelationsAPIViewTests(TestCase):
+    def setUp(self):
+        self.user_1 = create_user(TEST_DATA_USERS[0])
+        self.token_1 = RefreshToken.for_user(self.user_1).access_token
+        self.user_2 = create_user(TEST_DATA_USERS[1])
+        self.user_3 = create_user(TEST_DATA_USERS[2])
+        self.user_4 = User.objects.create_user(email="444@example.com", password="pass")
+        make_friends(self.user_1, self.user_2)
+        Friendship(
+            outgoing_friend=self.user_1,
+            incoming_friend=self.user_3,
+            status=StatusApplicationFriends.SUBMITTED
+        ).save()
+        Friendship(
+            outgoing_friend=self.user_4,
+            incoming_friend=self.user_1,
+            status=StatusApplicationFriends.SUBMITTED
+        ).save()
+
+    def test_post_success(self):
+        ids = [self.user_2.id, self.user_3.id, self.user_4.id, 1000, self.user_2.id]
+        # пользователь из JWT + один запрос к Friendship
+        with self.assertNumQueries(2):
+            response = self.client.post(
+                "/user/me/relations/",
+                data={"ids": ids},
+                content_type="application/json",
+                headers={"Authorization": f"Bearer {self.token_1}"}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [
+            {"id": self.user_2.id, "status": StatusApplicationEnum.FRI},
+            {"id": self.user_3.id, "status": StatusApplicationEnum.IN},
+            {"id": self.user_4.id, "status": StatusApplicationEnum.OUT},
+            {"id": 1000, "status": StatusApplicationEnum.NONE},
+        ])
+
+    def test_post_error_empty(self):
+        response = self.client.post(
+            "/user/me/relations/",
+            data={"ids": []},
+            content_type="application/json",
+            headers={"Authorization": f"Bearer {self.token_1}"}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class BulkApplicationAPIViewTests(TestCase):
+    def setUp(self):
+        self.user_1 = create_user(TEST_DATA_USERS[0])
+        self.token_1 = RefreshToken.for_user(self.user_1).access_token
+        self.user_2 = create_user(TEST_DATA_USERS[1])
+        self.user_3 = create_user(TEST_DATA_USERS[2])
+        self.user_4 = User.objects.create_user(email="444@example.com", password="pass")
+        Friendship(
+            outgoing_friend=self.user_3,
+            incoming_friend=self.user_1,
+            status=StatusApplicationFriends.SUBMITTED
+        ).save()
+        make_friends(self.user_1, self.user_4)
+
+    def request(self, method: str, ids: list):
+        return getattr(self.client, method)(
+            "/user/me/applications/",
+            data={"ids": ids},
+            content_type="application/json",
+            headers={"Authorization": f"Bearer {self.token_1}"}
+        )
+
+    def test_post(self):
+        response = self.request("post", [self.user_2.id, self.user_3.id, self.user_4.id, self.user_1.id, 1000])
+        self.assertEqual(response.status_code, 200)
+        outcomes = {item["id"]: item for item in response.json()}
+        self.assertEqual(outcomes[self.user_2.id]["detail"], "Заявка успешно отправлена")
+        self.assertEqual(outcomes[self.user_3.id]["detail"], "Вы теперь друзья")
+        self.assertEqual(outcomes[self.user_4.id]["status"], StatusEnum.UNSUCCESS)
+        self.assertEqual(outcomes[self.user_1.id]["status"], StatusEnum.UNSUCCESS)
+        self.assertEqual(outcomes[1000]["detail"], "Пользователь не найден")
+        self.assertTrue(Friendship.objects.submitted().filter(outgoing_friend=self.user_1, incoming_friend=self.user_2))
+        self.assertEqual(Friendship.objects.accepted().between(self.user_1, [self.user_3.id]).count(), 1)
+
+    def test_post_query_count(self):
+        users = [User.objects.create_user(email=f"bulk{i}@example.com", password="pass") for i in range(20)]
+        # пользователь из JWT + SAVEPOINT/RELEASE + блокировка + чтение статусов + UPDATE принятых + INSERT новых
+        # + UPDATE счетчиков: свой, принятых, получивших заявку + INSERT в журнал изменений
+        with self.assertNumQueries(11):
+            self.request("post", [self.user_3.id] + [user.id for user in users])
+        self.assertEqual(Friendship.objects.submitted().filter(outgoing_friend=self.user_1).count(), 20)
+
+    def test_delete(self):
+        Friendship(
+            outgoing_friend=self.user_1,
+            incoming_friend=self.user_2,
+            status=StatusApplicationFriends.SUBMITTED
+        ).save()
+        response = self.request("delete", [self.user_2.id, self.user_3.id, self.user_4.id])
+        self.assertEqual(response.status_code, 200)
+        outcomes = {item["id"]: item for item in response.json()}
+        self.assertEqual(outcomes[self.user_2.id]["detail"], "Заявка отменена")
+        self.assertEqual(outcomes[self.user_3.id]["detail"], "Заявка отклонена. Следующие будут автоматом отклонены")
+        self.assertEqual(outcomes[self.user_4.id]["detail"], "Заявки не существует")
+        self.assertFalse(Friendship.objects.filter(outgoing_friend=self.user_1, incoming_friend=self.user_2).exists())
+        self.assertEqual(
+            Friendship.objects.between(self.user_1, [self.user_3.id]).filter(
+                status=StatusApplicationFriends.REJECTED
+            ).count(),
+            1
+        )
+
+
+@skipUnless(connection.vendor == "postgresql", "Конкурентные тесты только для PostgreSQL (TEST_WITH_POSTGRES=1)")
+class ConcurrentApplicationTests(TransactionTestCase):
+    """Встречные переходы по одной паре из разных потоков не должны терять и дублировать изменения"""
+
+    def setUp(self):
+        self.users = [User.objects.create_user(email=f"race{i}@example.com", password="pass") for i in range(2)]
+
+    def run_concurrently(self, *calls):
+        barrier = threading.Barrier(len(calls))
+        errors = []
+
+        def worker(func, user, target):
+            try:
+                barrier.wait()
+                func(user, [target.id])
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=call) for call in calls]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_mutual_submit(self):
+        user_1, user_2 = self.users
+        for _ in range(10):
+            Friendship.objects.all().delete()
+            self.run_concurrently((submit_applications, user_1, user_2), (submit_applications, user_2, user_1))
+            self.assertEqual(
+                list(Friendship.objects.between(user_1, [user_2.id]).values_list("status", flat=True)),
+                [StatusApplicationFriends.ACCEPTED]
+            )
+
+    def test_accept_and_cancel(self):
+        user_1, user_2 = self.users
+        for _ in range(10):
+            Friendship.objects.all().delete()
+            submit_applications(user_1, [user_2.id])
+            self.run_concurrently((reject_applications, user_1, user_2), (submit_applications, user_2, user_1))
+            statuses = list(Friendship.objects.between(user_1, [user_2.id]).values_list("status", flat=True))
+            # либо заявку успели отменить (и, возможно, отправить встречную), либо пара стала друзьями
+            self.assertIn(statuses, ([], [StatusApplicationFriends.SUBMITTED], [StatusApplicationFriends.ACCEPTED]))
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class FriendsCacheTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user_1 = create_user(TEST_DATA_USERS[0])
+        self.token_1 = RefreshToken.for_user(self.user_1).access_token
+        self.user_2 = create_user(TEST_DATA_USERS[1])
+        self.token_2 = RefreshToken.for_user(self.user_2).access_token
+        self.user_3 = create_user(TEST_DATA_USERS[2])
+        make_friends(self.user_1, self.user_3)
+
+    def get(self, url: str, token):
+        return self.client.get(url, headers={"Authorization": f"Bearer {token}"})
+
+    def test_friends_list_hit(self):
+        self.get("/user/me/friends/", self.token_1)
+        # только пользователь из JWT
+        with self.assertNumQueries(1):
+            response = self.get("/user/me/friends/", self.token_1)
+        self.assertEqual([item["id"] for item in response.json()["results"]], [self.user_3.id])
+        self.assertEqual(friends_cache.get_stats(), {"hits": 1, "misses": 1})
+
+    def test_profile_hit(self):
+        self.get(f"/user/{self.user_1.id}/", self.token_2)
+        self.get(f"/user/{self.user_1.id}/?friends=ids", self.token_2)
+        with self.assertNumQueries(2):
+            response = self.get(f"/user/{self.user_1.id}/", self.token_2)
+        self.assertEqual(response.json()["friends"][0]["id"], self.user_3.id)
+        with self.assertNumQueries(2):
+            response = self.get(f"/user/{self.user_1.id}/?friends=count", self.token_2)
+        self.assertEqual(response.json()["friends"], 1)
+
+    def test_invalidate_on_friend_profile_edit(self):
+        self.get("/user/me/friends/", self.token_1)
+        serializer = UserCreateSerializer(self.user_3, data={"username": "renamed"}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        response = self.get("/user/me/friends/", self.token_1)
+        self.assertEqual([item["username"] for item in response.json()["results"]], ["renamed"])
+
+    def test_next_link_from_request(self):
+        make_friends(self.user_1, self.user_2)
+        self.get("/user/me/friends/?page_size=1", self.token_1)
+        # страница из кэша синхронной view получает ссылку асинхронной
+        response = self.get("/async/user/me/friends/?page_size=1", self.token_1)
+        self.assertEqual(friends_cache.get_stats(), {"hits": 1, "misses": 1})
+        self.assertTrue(response.json()["next"].startswith("http://testserver/async/user/me/friends/?"))
+
+    def test_invalidate_on_accept_and_remove(self):
+        self.assertEqual(friends_cache.get_friend_ids(self.user_1.id), [self.user_3.id])
+        self.get("/user/me/friends/", self.token_2)
+        submit_applications(self.user_1, [self.user_2.id])
+        submit_applications(self.user_2, [self.user_1.id])
+        self.assertEqual(friends_cache.get_friend_ids(self.user_1.id), [self.user_2.id, self.user_3.id])
+        response = self.get("/user/me/friends/", self.token_2)
+        self.assertEqual([item["id"] for item in response.json()["results"]], [self.user_1.id])
+        self.client.delete(f"/user/{self.user_2.id}/", headers={"Authorization": f"Bearer {self.token_1}"})
+        self.assertEqual(friends_cache.get_friend_ids(self.user_1.id), [self.user_3.id])
+        self.assertEqual(self.get("/user/me/friends/", self.token_2).json()["results"], [])
+
+
+@override_settings(
+    JWT_STATELESS_READS=True, CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class ConditionalRequestsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user_1 = create_user(TEST_DATA_USERS[0])
+        self.user_2 = create_user(TEST_DATA_USERS[1])
+        self.user_3 = create_user(TEST_DATA_USERS[2])
+        make_friends(self.user_1, self.user_3)
+        self.headers = {"Authorization": f"Bearer {RefreshToken.for_user(self.user_1).access_token}"}
+
+    def test_not_modified_without_queries(self):
+        for url in ("/user/me/friends/", "/user/me/submitted/in/", "/user/me/submitted/out/"):
+            response = self.client.get(url, headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("private", response.headers["Cache-Control"])
+            with self.assertNumQueries(0):
+                response = self.client.get(url, headers={**self.headers, "If-None-Match": response.headers["ETag"]})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b"")
+
+    def test_profile_etag_only(self):
+        response = self.client.get("/user/me/profile/", headers=self.headers)
+        self.assertNotIn("Last-Modified", response.headers)
+        # без Last-Modified If-Modified-Since не дает 304: время версии не время изменения
+        response = self.client.get(
+            "/user/me/profile/", headers={**self.headers, "If-Modified-Since": "Sun, 17 Oct 2100 00:00:00 GMT"}
+        )
+        self.assertEqual(response.status_code, 200)
+        # профиль читает пользователя из БД при аутентификации, сериализатор и друзья не нужны
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                "/user/me/profile/", headers={**self.headers, "If-None-Match": response.headers["ETag"]}
+            )
+        self.assertEqual(response.status_code, 304)
+
+    def test_changed_after_application(self):
+        etags = {
+            url: self.client.get(url, headers=self.headers).headers["ETag"]
+            for url in ("/user/me/submitted/in/", "/user/me/profile/")
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            submit_applications(self.user_2, [self.user_1.id])
+        for url, etag in etags.items():
+            response = self.client.get(url, headers={**self.headers, "If-None-Match": etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response.headers["ETag"], etag)
+        response = self.client.get("/user/me/submitted/in/", headers=self.headers)
+        self.assertEqual([item["in_user"]["id"] for item in response.json()["results"]], [self.user_2.id])
+
+    def test_etag_per_user(self):
+        etag = self.client.get("/user/me/friends/", headers=self.headers).headers["ETag"]
+        headers = {"Authorization": f"Bearer {RefreshToken.for_user(self.user_3).access_token}"}
+        response = self.client.get("/user/me/friends/", headers={**headers, "If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item["id"] for item in response.json()["results"]], [self.user_1.id])
+
+
+class ChangesAPIViewTests(TestCase):
+    def setUp(self):
+        self.user_1 = create_user(TEST_DATA_USERS[0])
+        self.user_2 = create_user(TEST_DATA_USERS[1])
+        self.user_3 = create_user(TEST_DATA_USERS[2])
+        self.headers = {"Authorization": f"Bearer {RefreshToken.for_user(self.user_1).access_token}"}
+
+    def changes(self, since=None, **params):
+        if since is not None:
+            params["since"] = since
+        return self.client.get("/user/me/changes/", params, headers=self.headers)
+
+    def test_sync(self):
+        cursor = self.changes().json()["cursor"]
+        self.assertEqual(changelog.parse_cursor(cursor)[0], 0)
+        submit_applications(self.user_1, [self.user_2.id])
+        submit_applications(self.user_3, [self.user_1.id])
+
+        data = self.changes(cursor).json()
+        self.assertEqual([user["id"] for user in data["submitted_out"]], [self.user_2.id])
+        self.assertEqual([user["id"] for user in data["submitted_in"]], [self.user_3.id])
+        self.assertEqual((data["friends"], data["removed"], data["has_more"]), ([], [], False))
+        cursor = data["cursor"]
+        self.assertEqual(changelog.parse_cursor(self.changes().json()["cursor"])[0], changelog.parse_cursor(cursor)[0])
+
+        # в ответе - последнее состояние пары: заявка и принятие - просто друзья
+        submit_applications(self.user_2, [self.user_1.id])
+        reject_applications(self.user_1, [self.user_3.id])
+        data = self.changes(cursor).json()
+        self.assertEqual([user["id"] for user in data["friends"]], [self.user_2.id])
+        self.assertEqual(data["removed"], [self.user_3.id])
+        self.assertEqual(data["submitted_in"] + data["submitted_out"], [])
+
+        remove_friend(self.user_2, self.user_1)
+        data = self.changes(data["cursor"]).json()
+        self.assertEqual((data["friends"], data["removed"]), ([], [self.user_2.id]))
+        self.assertEqual(self.changes(data["cursor"]).json()["removed"], [])
+
+    def test_cost_proportional_to_delta(self):
+        for i in range(30):
+            make_friends(self.user_1, User.objects.create_user(email=f"friend{i}@example.com", password="pass"))
+        cursor = self.changes().json()["cursor"]
+        submit_applications(self.user_1, [self.user_2.id])
+        # пользователь из JWT + журнал по (user, id) + пользователи изменившихся пар
+        with self.assertNumQueries(3):
+            data = self.changes(cursor).json()
+        self.assertEqual([user["id"] for user in data["submitted_out"]], [self.user_2.id])
+
+    def test_limit_and_has_more(self):
+        submit_applications(self.user_1, [self.user_2.id, self.user_3.id])
+        data = self.changes(changelog.make_cursor(0), limit=1).json()
+        self.assertTrue(data["has_more"])
+        self.assertEqual(len(data["submitted_out"]), 1)
+        rest = self.changes(data["cursor"], limit=1).json()
+        self.assertFalse(rest["has_more"])
+        self.assertEqual(
+            {user["id"] for user in data["submitted_out"] + rest["submitted_out"]}, {self.user_2.id, self.user_3.id}
+        )
+
+    def test_invalid_and_expired_cursor(self):
+        self.assertEqual(self.changes("abc").status_code, 400)
+        self.assertEqual(self.changes("10").status_code, 400)
+        issued = time.time() - datetime.timedelta(days=30).total_seconds()
+        self.assertEqual(self.changes(f"0.{int(issued)}").status_code, 410)
+        self.assertEqual(self.changes(f"0.{int(issued) + 2 * 60 * 60}").status_code, 200)
+
+    def test_prune(self):
+        submit_applications(self.user_1, [self.user_2.id])
+        FriendshipChange.objects.update(created=F("created") - datetime.timedelta(days=31))
+        submit_applications(self.user_1, [self.user_3.id])
+        out = StringIO()
+        call_command("prune_friendship_changes", stdout=out)
+        self.assertIn("Удалено записей: 2", out.getvalue())
+        self.assertEqual(
+            set(FriendshipChange.objects.values_list("other_user", flat=True)), {self.user_1.id, self.user_3.id}
+        )
+
+
+@skipUnless(connection.vendor == "postgresql", "Транзакции админки только для PostgreSQL (TEST_WITH_POSTGRES=1)")
+class FriendshipAdminTests(TransactionTestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="pass")
+        self.user_1 = create_user(TEST_DATA_USERS[0])
+        self.user_2 = create_user(TEST_DATA_USERS[1])
+        self.user_3 = create_user(TEST_DATA_USERS[2])
+        self.client.force_login(self.admin)
+
+    def test_delete_selected(self):
+        submit_applications(self.user_1, [self.user_2.id, self.user_3.id])
+        submit_applications(self.user_2, [self.user_1.id])
+        cursor = changelog.get_cursor(self.user_1.id)
+        # действие вне delete_view идет без транзакции Django: delete_queryset открывает ее сам
+        response = self.client.post("/admin/core/friendship/", {
+            "action": "delete_selected",
+            "_selected_action": list(Friendship.objects.values_list("id", flat=True)),
+            "post": "yes",
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Friendship.objects.exists())
+        self.assertEqual(counters.reconcile(User.objects.all()), 0)
+        changes, _, _ = changelog.get_changes(self.user_1.id, changelog.parse_cursor(cursor)[0], 10)
+        self.assertEqual(set(changelog.group_changes(changes)["removed"]), {self.user_2.id, self.user_3.id})
+        self.assertEqual(friends_cache.get_friend_ids(self.user_1.id), [])
+
+
+class MutualFriendsAPIViewTests(TestCase):
+    def setUp(self):
+        self.user_1 = create_user(TEST_DATA_USERS[0])
+        self.token_1 = RefreshToken.for_user(self.user_1).access_token
+        self.user_2 = create_user(TEST_DATA_USERS[1])
+        self.common = [User.objects.create_user(email=f"common{i}@example.com", password="pass") for i in range(3)]
+        for friend in self.common:
+            make_friends(self.user_1, friend)
+            make_friends(self.user_2, friend)
+        make_friends(self.user_1, create_user(TEST_DATA_USERS[2]))
+
+    def get(self, url: str):
+        return self.client.get(url, headers={"Authorization": f"Bearer {self.token_1}"})
+
+    def test_get_full(self):
+        response = self.get(f"/user/{self.user_2.id}/mutual/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(item["id"] for item in response.json()["results"]),
+            [friend.id for friend in self.common]
+        )
+
+    def test_get_ids_and_count(self):
+        response = self.get(f"/user/{self.user_2.id}/mutual/?friends=ids")
+        self.assertEqual(response.json()["ids"], [friend.id for friend in self.common])
+        response = self.get(f"/user/{self.user_2.id}/mutual/?friends=count")
+        self.assertEqual(response.json()["count"], 3)
+
+    def test_get_error_not_exist_id(self):
+        response = self.get("/user/1000/mutual/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_bench_command(self):
+        out, friendships = StringIO(), Friendship.objects.count()
+        call_command("bench_mutual", "--friends", "20", "--repeat", "1", stdout=out)
+        self.assertIn("cache warm (ids)", out.getvalue())
+        self.assertEqual(Friendship.objects.count(), friendships)
+
+
+class SuggestionsAPIViewTests(TestCase):
+    def setUp(self):
+        self.user_1 = create_user(TEST_DATA_USERS[0])
+        self.token_1 = RefreshToken.for_user(self.user_1).access_token
+        self.users = {
+            name: User.objects.create_user(email=f"{name}@example.com", password="pass")
+            for name in ("a", "b", "c", "x", "y", "out", "in", "rej")
+        }
+        for friend in ("a", "b", "c"):
+            make_friends(self.user_1, self.users[friend])
+        for friend, candidates in {"a": ("x", "y", "out", "in", "rej"), "b": ("x", "c"), "c": ("x",)}.items():
+            for candidate in candidates:
+                make_friends(self.users[friend], self.users[candidate])
+        Friendship.objects.bulk_create([
+            Friendship(
+                outgoing_friend=self.user_1, incoming_friend=self.users["out"],
+                status=StatusApplicationFriends.SUBMITTED
+            ),
+            Friendship(
+                outgoing_friend=self.users["in"], incoming_friend=self.user_1,
+                status=StatusApplicationFriends.SUBMITTED
+            ),
+            Friendship(
+                outgoing_friend=self.users["rej"], incoming_friend=self.user_1, status=StatusApplicationFriends.REJECTED
+            ),
+        ])
+
+    def get(self, url: str):
+        return self.client.get(url, headers={"Authorization": f"Bearer {self.token_1}"})
+
+    def test_get_ranked_by_mutual(self):
+        response = self.get("/user/me/suggestions/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(item["id"], item["mutual"]) for item in response.json()],
+            [(self.users["x"].id, 3), (self.users["y"].id, 1)]
+        )
+        self.assertEqual(response.json()[0]["email"], "x@example.com")
+
+    def test_sample_limits(self):
+        x = self.users["x"].id
+        # последний друг - c (при равных датах - по id заявки), у него из кандидатов только x
+        self.assertEqual(get_suggestions(self.user_1.id, friends_limit=1), [(x, 1)])
+        self.assertEqual(get_suggestions(self.user_1.id, friends_limit=2), [(x, 2)])
+        # у каждого друга - 2 друга с наименьшими id: user_1 и первый по id, у a это x, у b и c - друзья user_1
+        self.assertEqual(get_suggestions(self.user_1.id, degree_limit=2), [(x, 1)])
+        self.assertEqual(get_suggestions(self.user_1.id, degree_limit=3), [(x, 3), (self.users["y"].id, 1)])
+
+    def test_get_limit(self):
+        response = self.get("/user/me/suggestions/?limit=1")
+        self.assertEqual([item["id"] for item in response.json()], [self.users["x"].id])
+
+    def test_get_num_queries(self):
+        with self.assertNumQueries(3):
+            self.get("/user/me/suggestions/")
+
+    def test_get_error_not_auth(self):
+        response = self.client.get("/user/me/suggestions/")
+        self.assertEqual(response.status_code, 401)
+
+
+class FriendGraphTests(TestCase):
+    def setUp(self):
+        self.user_1 = create_user(TEST_DATA_USERS[0])
+        self.user_2 = create_user(TEST_DATA_USERS[1])
+        self.user_3 = create_user(TEST_DATA_USERS[2])
+        make_friends(self.user_1, self.user_2)
+        make_friends(self.user_1, self.user_3)
+        Friendship.objects.create(
+            outgoing_friend=self.user_2, incoming_friend=self.user_3, status=StatusApplicationFriends.SUBMITTED
+        )
+
+    def tearDown(self):
+        friends_graph.reset()
+
+    def test_load(self):
+        graph = friends_graph.FriendGraph.load()
+        self.assertEqual(graph.neighbors(self.user_1.id), [self.user_2.id, self.user_3.id])
+        self.assertEqual(graph.degree(self.user_2.id), 1)
+        self.assertFalse(graph.has_edge(self.user_2.id, self.user_3.id))
+        self.assertEqual(graph.intersection(self.user_2.id, self.user_3.id), [self.user_1.id])
+        self.assertEqual(graph.neighbors(1000), [])
+
+    def test_update_and_compact(self):
+        graph = friends_graph.FriendGraph.load(compact_threshold=4)
+        graph.update(self.user_1.id, [self.user_2.id], False)
+        snapshot = graph.snapshot
+        # пересборка в фоне ждет, пока тест не сделает запись во время нее
+        resume = threading.Event()
+        iter_edges = graph.iter_edges
+        graph.iter_edges = lambda *args: resume.wait() and iter_edges(*args)
+        graph.update(self.user_2.id, [1000], True)
+        # читатель со старым снимком видит старые массивы вместе с изменениями к ним - тот же граф
+        self.assertIsNot(graph.snapshot, snapshot)
+        for user_id in (self.user_1.id, self.user_2.id, 1000):
+            self.assertEqual(graph.neighbors(user_id, snapshot), graph.neighbors(user_id))
+        self.assertEqual(graph.neighbors(self.user_1.id), [self.user_3.id])
+        self.assertEqual(graph.degree(self.user_2.id), 1)
+        self.assertEqual(graph.neighbors(1000), [self.user_2.id])
+        compaction = graph.compaction
+        graph.update(self.user_1.id, [self.user_2.id], True)
+        resume.set()
+        compaction.join()
+        # запись во время пересборки повторена на новом снимке
+        self.assertIsNot(graph.snapshot.offsets, snapshot.offsets)
+        self.assertEqual((graph.pending, graph.size, graph.compaction), (2, 1001, None))
+        self.assertEqual(graph.neighbors(self.user_1.id), [self.user_2.id, self.user_3.id])
+        self.assertEqual(graph.neighbors(1000), [self.user_2.id])
+
+    def test_no_hooks_until_loaded(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            remove_friend(self.user_1, self.user_2)
+        friends_graph.get_graph()
+        with self.captureOnCommitCallbacks() as loaded_callbacks:
+            remove_friend(self.user_1, self.user_3)
+        self.assertEqual(len(loaded_callbacks), len(callbacks) + 1)
+
+    def test_application_paths(self):
+        graph = friends_graph.get_graph()
+        with self.captureOnCommitCallbacks(execute=True):
+            submit_applications(self.user_3, [self.user_2.id])
+        self.assertEqual(graph.intersection(self.user_1.id, self.user_3.id), [self.user_2.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            remove_friend(self.user_1, self.user_2)
+        self.assertEqual(graph.neighbors(self.user_1.id), [self.user_3.id])
+        self.assertEqual(graph.neighbors(self.user_2.id), [self.user_3.id])
+
+
+class PathAPIViewTests(TestCase):
+    def setUp(self):
+        self.user_1 = create_user(TEST_DATA_USERS[0])
+        self.token_1 = RefreshToken.for_user(self.user_1).access_token
+        self.chain = [User.objects.create_user(email=f"chain{i}@example.com", password="pass") for i in range(4)]
+        for user_1, user_2 in zip([self.user_1, *self.chain], self.chain):
+            make_friends(user_1, user_2)
+        self.shortcut = User.objects.create_user(email="shortcut@example.com", password="pass")
+        make_friends(self.user_1, self.shortcut)
+        make_friends(self.shortcut, self.chain[2])
+        self.stranger = User.objects.create_user(email="stranger@example.com", password="pass")
+
+    def get(self, url: str):
+        return self.client.get(url, headers={"Authorization": f"Bearer {self.token_1}"})
+
+    def test_get_shortest_path(self):
+        response = self.get(f"/user/{self.chain[3].id}/path/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["depth"], 3)
+        self.assertEqual(
+            [user["id"] for user in response.json()["path"]],
+            [self.user_1.id, self.shortcut.id, self.chain[2].id, self.chain[3].id]
+        )
+        self.assertEqual(response.json()["path"][1]["email"], "shortcut@example.com")
+
+    def test_get_max_depth(self):
+        response = self.get(f"/user/{self.chain[3].id}/path/?max_depth=2")
+        self.assertEqual(response.status_code, 404)
+        response = self.get(f"/user/{self.chain[1].id}/path/?max_depth=2")
+        self.assertEqual(response.json()["depth"], 2)
+
+    def test_get_error_no_path(self):
+        response = self.get(f"/user/{self.stranger.id}/path/")
+        self.assertEqual(response.status_code, 404)
+        response = self.get("/user/1000/path/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_find_path_limits(self):
+        self.assertEqual(find_path(self.user_1.id, self.user_1.id), [self.user_1.id])
+        self.assertIsNone(find_path(self.user_1.id, self.chain[3].id, max_visits=3))
+        self.assertEqual(len(find_path(self.user_1.id, self.chain[3].id, max_visits=20)), 4)
+
+    def test_get_num_queries(self):
+        with self.assertNumQueries(6):
+            self.get(f"/user/{self.chain[3].id}/path/")
+
+
+class CountersTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(email=f"count{i}@example.com", password="pass") for i in range(4)]
+
+    def assertCounters(self, user: User, friends: int, incoming: int, outgoing: int):
+        user.refresh_from_db()
+        self.assertEqual(
+            (user.friends_count, user.incoming_pending_count, user.outgoing_pending_count),
+            (friends, incoming, outgoing)
+        )
+
+    def test_transitions(self):
+        user_1, user_2, user_3, user_4 = self.users
+        submit_applications(user_1, [user_2.id, user_3.id, user_4.id])
+        self.assertCounters(user_1, 0, 0, 3)
+        self.assertCounters(user_2, 0, 1, 0)
+        submit_applications(user_2, [user_1.id])
+        self.assertCounters(user_1, 1, 0, 2)
+        self.assertCounters(user_2, 1, 0, 0)
+        reject_applications(user_3, [user_1.id])
+        reject_applications(user_1, [user_4.id])
+        self.assertCounters(user_1, 1, 0, 0)
+        self.assertCounters(user_3, 0, 0, 0)
+        self.assertCounters(user_4, 0, 0, 0)
+        self.assertTrue(remove_friend(user_1, user_2))
+        self.assertFalse(remove_friend(user_2, user_1))
+        self.assertCounters(user_1, 0, 0, 0)
+        self.assertCounters(user_2, 0, 0, 0)
+        self.assertEqual(counters.reconcile(User.objects.all()), 0)
+
+    def test_reconcile_command(self):
+        user_1, user_2, user_3, _ = self.users
+        make_friends(user_1, user_2)
+        Friendship.objects.create(
+            outgoing_friend=user_3, incoming_friend=user_1, status=StatusApplicationFriends.SUBMITTED
+        )
+        User.objects.filter(id=user_2.id).update(friends_count=5, outgoing_pending_count=-1)
+        out = StringIO()
+        call_command("reconcile_counters", "--batch-size", "2", stdout=out)
+        self.assertIn("Исправлено пользователей: 3", out.getvalue())
+        self.assertCounters(user_1, 1, 1, 0)
+        self.assertCounters(user_2, 1, 0, 0)
+        self.assertCounters(user_3, 0, 0, 1)
+
+    def test_profile_save_keeps_counters(self):
+        user_1, user_2, user_3, _ = self.users
+        stale = User.objects.get(id=user_1.id)
+        submit_applications(user_2, [user_1.id])
+        submit_applications(user_3, [user_1.id])
+        stale.username = "renamed"
+        site._registry[User].save_model(None, stale, SimpleNamespace(changed_data=["username"]), True)
+        serializer = UserCreateSerializer(stale, data={"first_name": "Имя"}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.assertCounters(user_1, 0, 2, 0)
+        self.assertEqual((user_1.username, user_1.first_name), ("renamed", "Имя"))
+
+    def test_profile(self):
+        user_1, user_2, _, _ = self.users
+        make_friends(user_1, user_2)
+        token = RefreshToken.for_user(user_1).access_token
+        # только пользователь из JWT, счетчики приходят в той же строке
+        with self.assertNumQueries(1):
+            response = self.client.get("/user/me/profile/?friends=count", headers={"Authorization": f"Bearer {token}"})
+        response_dict = response.json()
+        self.assertEqual(response_dict["friends"], 1)
+        self.assertEqual(
+            [response_dict[field] for field in ("friends_count", "incoming_pending_count", "outgoing_pending_count")],
+            [1, 0, 0]
+        )
+
+
+class StatelessReadsTests(TestCase):
+    def setUp(self):
+        self.user_1 = create_user(TEST_DATA_USERS[0])
+        self.user_2 = create_user(TEST_DATA_USERS[1])
+        self.headers = {"Authorization": f"Bearer {RefreshToken.for_user(self.user_1).access_token}"}
+        make_friends(self.user_1, self.user_2)
+
+    def test_reads_without_user_query(self):
+        for url, queries in (("/user/me/friends/", 1), (f"/user/{self.user_2.id}/application/", 1)):
+            with self.settings(JWT_STATELESS_READS=False), self.assertNumQueries(queries + 1):
+                expected = self.client.get(url, headers=self.headers).json()
+            with self.settings(JWT_STATELESS_READS=True), self.assertNumQueries(queries):
+                self.assertEqual(self.client.get(url, headers=self.headers).json(), expected)
+
+    @override_settings(JWT_STATELESS_READS=True)
+    def test_writes_and_profile_load_user(self):
+        response = self.client.get("/user/me/profile/", headers=self.headers)
+        self.assertEqual(response.json()["username"], self.user_1.username)
+        User.objects.filter(id=self.user_1.id).update(is_active=False)
+        # чтение по id из токена проходит до истечения токена, запись проверяет пользователя в БД
+        self.assertEqual(self.client.get("/user/me/friends/", headers=self.headers).status_code, 200)
+        response = self.client.delete(f"/user/{self.user_2.id}/", headers=self.headers)
+        self.assertIn(response.status_code, (401, 403))
+        self.assertTrue(Friendship.objects.friends_of(self.user_2).exists())
+
+
+class ApiMiddlewareTests(TestCase):
+    def setUp(self):
+        self.user = create_user(TEST_DATA_USERS[0])
+        self.headers = {"Authorization": f"Bearer {RefreshToken.for_user(self.user).access_token}"}
+
+    def test_api_skips_session_and_csrf(self):
+        response = self.client.get("/user/me/profile/", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(hasattr(response.wsgi_request, "session"))
+        self.assertFalse(hasattr(response.wsgi_request, "_messages"))
+        self.assertTrue(hasattr(self.client.get("/admin/login/").wsgi_request, "session"))
+        csrf_client = Client(enforce_csrf_checks=True)
+        self.assertEqual(csrf_client.post("/admin/login/", {"username": "x"}).status_code, 403)
+        response = csrf_client.post(f"/user/{self.user.id}/application/", headers=self.headers)
+        self.assertEqual(response.json()["detail"], "Вы не можете отправить заявку самому себе")
+
+    def test_jwt_first_and_no_basic(self):
+        response = self.client.get("/user/me/profile/")
+        self.assertEqual(response.status_code, 401)
+        self.assertIn("Bearer", response.headers["WWW-Authenticate"])
+        basic = base64.b64encode(f"{TEST_DATA_USERS[0]['email']}:{TEST_DATA_USERS[0]['password']}".encode()).decode()
+        response = self.client.get("/user/me/profile/", headers={"Authorization": f"Basic {basic}"})
+        self.assertEqual(response.status_code, 401)
+
+    def test_admin_session_not_used_by_api(self):
+        self.client.force_login(User.objects.create_superuser(email="admin@example.com", password="pass"))
+        self.assertEqual(self.client.get("/admin/").status_code, 200)
+        self.assertEqual(self.client.get("/user/me/profile/").status_code, 401)
+        self.assertEqual(self.client.get("/user/me/profile/", headers=self.headers).json()["id"], self.user.id)
+
+    def test_api_profile(self):
+        with override_api_settings(
+            MIDDLEWARE=settings_api.MIDDLEWARE,
+            ROOT_URLCONF=settings_api.ROOT_URLCONF,
+            REST_FRAMEWORK=settings_api.REST_FRAMEWORK,
+        ):
+            self.assertEqual(self.client.get("/user/me/profile/?format=api", headers=self.headers).status_code, 404)
+            response = self.client.get("/user/me/profile/", headers=self.headers)
+            self.assertEqual(response.json()["id"], self.user.id)
+            self.assertEqual(self.client.get("/admin/").status_code, 404)
+        self.assertEqual(self.client.get("/user/me/profile/?format=api", headers=self.headers).status_code, 200)
+
+
+class UserImportTests(TestCase):
+    def setUp(self):
+        self.user = create_user(TEST_DATA_USERS[0])
+
+    def test_import_users(self):
+        rows = [
+            {"email": "import1@example.com", "password": "pass-1", "first_name": "Ivan"},
+            {"email": "import2@example.com", "username": "second", "password": "pass-2"},
+            {"email": "import1@example.com", "password": "pass-3"},
+            {"email": "not-an-email", "password": "pass-4"},
+            {"email": "import5@example.com", "password": ""},
+            {"email": TEST_DATA_USERS[0]["email"], "password": "pass-6"},
+        ]
+        with self.assertNumQueries(3):
+            result = import_users(rows, workers=1, batch_size=10)
+        self.assertEqual(result.created, 2)
+        self.assertEqual(sum(result.skipped.values()), 4)
+        first = User.objects.get(email="import1@example.com")
+        self.assertEqual((first.username, first.first_name), ("import1", "Ivan"))
+        self.assertTrue(first.password.startswith("argon2$argon2id$v=19$m=19456,t=2,p=1$"))
+        self.assertTrue(first.check_password("pass-1"))
+        self.assertTrue(User.objects.get(username="second").check_password("pass-2"))
+
+    def test_import_users_process_pool(self):
+        rows = [{"email": f"pool{i}@example.com", "password": f"pass-{i}"} for i in range(6)]
+        result = import_users(rows, workers=2, batch_size=4)
+        self.assertEqual(result.created, 6)
+        self.assertTrue(User.objects.get(email="pool5@example.com").check_password("pass-5"))
+
+    def test_import_users_command(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as csv_file:
+            csv_file.write("email,username,password\ncmd@example.com,cmd,secret-1\n")
+            csv_file.flush()
+            call_command("import_users", csv_file.name, "--workers", "1", stdout=StringIO())
+        self.assertTrue(User.objects.get(username="cmd").check_password("secret-1"))
+
+    def test_pbkdf2_upgraded_on_login(self):
+        User.objects.filter(id=self.user.id).update(
+            password=make_password(TEST_DATA_USERS[0]["password"], hasher="pbkdf2_sha256")
+        )
+        response = self.client.post("/api/token/", data=get_credits(TEST_DATA_USERS[0]))
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("argon2$"))
+        self.assertTrue(self.user.check_password(TEST_DATA_USERS[0]["password"]))
+
+
+class SyntheticGraphTests(TestCase):
+    def test_power_law_pairs(self):
+        user_ids = list(range(1, 1001))
+        pairs = list(power_law_pairs(user_ids, 5000, seed=1))
+        self.assertEqual(pairs, list(power_law_pairs(user_ids, 5000, seed=1)))
+        self.assertTrue(all(user_id != friend_id for user_id, friend_id in pairs))
+        degrees = sorted(
+            Counter(user_id for pair in pairs for user_id in pair).values(), reverse=True
+        )
+        self.assertGreater(degrees[0], 20 * degrees[len(degrees) // 2])
+
+    @override_settings(
+        ALLOWED_HOSTS=["localhost"], CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    def test_measure_sequence_runs_on_commit(self):
+        cache.clear()
+        user_1, user_2 = create_user(TEST_DATA_USERS[0]), create_user(TEST_DATA_USERS[1])
+        make_friends(user_1, user_2)
+        headers = {"Authorization": f"Bearer {RefreshToken.for_user(user_1).access_token}"}
+        measure_sequence([
+            ("friends", "get", "/user/me/friends/", headers, {}),
+            ("remove", "delete", f"/user/{user_2.id}/", headers, {}),
+        ], 1)
+        # удаление в транзакции теста сбросило кэш: второе чтение - снова промах
+        self.assertEqual(friends_cache.get_stats(), {"hits": 0, "misses": 2})
+
+    def test_generate_graph_and_bench_endpoints(self):
+        call_command("generate_graph", "--users", "300", "--edges", "2000", "--prefix", "testgraph", stdout=StringIO())
+        users = graph_users("testgraph")
+        self.assertEqual(users.count(), 300)
+        self.assertEqual(counters.reconcile(users), 0)
+        self.assertTrue(Friendship.objects.submitted().filter(outgoing_friend__in=users).exists())
+
+        out = StringIO()
+        friendships = Friendship.objects.count()
+        with self.settings(ALLOWED_HOSTS=["localhost"]):
+            call_command("bench_endpoints", "--prefix", "testgraph", "--repeat", "2", stdout=out)
+        self.assertIn("POST create/", out.getvalue())
+        self.assertNotIn("ошибок", out.getvalue())
+        self.assertEqual(Friendship.objects.count(), friendships)
+
+        # настоящий пользователь с тем же префиксом не из графа, пара с ним запрещает удаление
+        real_user = User.objects.create_user(email="testgraphfan@example.com", password="pass")
+        self.assertEqual(users.count(), 300)
+        make_friends(real_user, users.first())
+        with self.assertRaises(CommandError):
+            call_command("generate_graph", "--prefix", "testgraph", "--delete", stdout=StringIO())
+        self.assertEqual(users.count(), 300)
+        Friendship.objects.filter(outgoing_friend=real_user).delete()
+
+        call_command("generate_graph", "--prefix", "testgraph", "--delete", stdout=StringIO())
+        self.assertFalse(users.exists())
+        self.assertFalse(Friendship.objects.exists())
+        self.assertTrue(User.objects.filter(id=real_user.id).exists())
+
+
+@override_settings(
+    REPLICA_DATABASES=["replica"],
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class ReplicaRouterTests(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        cache.clear()
+        self.user_1 = create_user(TEST_DATA_USERS[0])
+        self.user_2 = create_user(TEST_DATA_USERS[1])
+        self.user_3 = create_user(TEST_DATA_USERS[2])
+        make_friends(self.user_1, self.user_3)
+        self.headers_1 = {"Authorization": f"Bearer {RefreshToken.for_user(self.user_1).access_token}"}
+        self.headers_3 = {"Authorization": f"Bearer {RefreshToken.for_user(self.user_3).access_token}"}
+
+    def get(self, url: str, headers: dict):
+        """Ответ и число запросов к default и к replica"""
+        with CaptureQueriesContext(connections["default"]) as primary, \
+                CaptureQueriesContext(connections["replica"]) as replica:
+            response = self.client.get(url, headers=headers)
+        return response, len(primary), len(replica)
+
+    def test_reads_go_to_replica(self):
+        response, primary, replica = self.get("/user/me/friends/", self.headers_1)
+        self.assertEqual([item["id"] for item in response.json()["results"]], [self.user_3.id])
+        # на primary - только пользователь из JWT при аутентификации
+        self.assertEqual((primary, replica), (1, 1))
+        response, primary, replica = self.get(f"/user/{self.user_3.id}/application/", self.headers_1)
+        self.assertEqual(response.json()["status"], StatusApplicationEnum.FRI)
+        self.assertEqual((primary, replica), (1, 1))
+
+    def test_pinned_to_primary_after_write(self):
+        response = self.client.post(f"/user/{self.user_2.id}/application/", headers=self.headers_1)
+        self.assertEqual(response.status_code, 201)
+        response, primary, replica = self.get(f"/user/{self.user_2.id}/application/", self.headers_1)
+        self.assertEqual(response.json()["status"], StatusApplicationEnum.IN)
+        self.assertEqual(replica, 0)
+        # второй участник пары тоже читает с primary, и чужой запрос о нем - тоже
+        self.assertEqual(self.get(f"/user/{self.user_2.id}/", self.headers_3)[2], 0)
+        # пользователь вне пары по-прежнему читает с реплики
+        self.assertEqual(self.get("/user/me/friends/", self.headers_3)[2], 1)
+
+        cache.delete_many([routers.pin_key(self.user_1.id), routers.pin_key(self.user_2.id)])
+        self.assertEqual(self.get(f"/user/{self.user_2.id}/application/", self.headers_1)[2], 1)
+
+    def test_writes_go_to_primary(self):
+        token = routers.replica_reads.set(True)
+        try:
+            self.assertEqual(router.db_for_read(Friendship), "replica")
+            self.assertEqual(router.db_for_write(Friendship, instance=User.objects.get(id=self.user_1.id)), "default")
+        finally:
+            routers.replica_reads.reset(token)
+        self.assertEqual(router.db_for_read(Friendship), "default")
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            response = self.client.post(f"/user/{self.user_2.id}/application/", headers=self.headers_1)
+        self.assertEqual((response.status_code, len(replica)), (201, 0))
+
+    def test_replicas_require_shared_cache(self):
+        settings_path = os.path.join(os.path.dirname(settings_api.__file__), "settings.py")
+        with mock.patch.dict(os.environ, {"POSTGRES_REPLICA_HOSTS": "replica-1"}):
+            os.environ.pop("REDIS_URL", None)
+            with self.assertRaises(ImproperlyConfigured):
+                runpy.run_path(settings_path)
+            os.environ["REDIS_URL"] = "redis://localhost:6379/0"
+            runpy.run_path(settings_path)
+
+    def test_workers_require_shared_cache(self):
+        settings_path = os.path.join(os.path.dirname(settings_api.__file__), "settings.py")
+        with mock.patch.dict(os.environ, {"WEB_CONCURRENCY": "2"}):
+            os.environ.pop("REDIS_URL", None)
+            os.environ.pop("FRIENDS_CACHE_TIMEOUT", None)
+            with self.assertRaises(ImproperlyConfigured):
+                runpy.run_path(settings_path)
+            os.environ["WEB_CONCURRENCY"] = "1"
+            self.assertEqual(runpy.run_path(settings_path)["FRIENDS_CACHE_TIMEOUT"], 5)
+            os.environ.update(WEB_CONCURRENCY="2", REDIS_URL="redis://localhost:6379/0")
+            self.assertEqual(runpy.run_path(settings_path)["FRIENDS_CACHE_TIMEOUT"], 60 * 60)
+
+
+@skipUnless(connection.vendor == "postgresql", "Секционирование только для PostgreSQL (TEST_WITH_POSTGRES=1)")
+class PartitionFriendshipsTests(TransactionTestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(email=f"part{i}@example.com", password="pass") for i in range(4)]
+        user_1, user_2, user_3, user_4 = self.users
+        make_friends(user_1, user_2)
+        submit_applications(user_1, [user_3.id])
+        submit_applications(user_2, [user_4.id])
+
+    def tearDown(self):
+        if partitioning.is_partitioned():
+            partitioning.undo()
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {partitioning.STAGING_TABLE}")
+            cursor.execute(f"DROP FUNCTION IF EXISTS {partitioning.SYNC_FUNCTION}() CASCADE")
+            cursor.execute(f"DROP FUNCTION IF EXISTS {partitioning.PAIR_FUNCTION}() CASCADE")
+
+    def rows(self) -> list[tuple]:
+        return list(Friendship.objects.order_by("id").values_list("id", "outgoing_friend", "incoming_friend", "status"))
+
+    def test_changes_during_copy(self):
+        user_1, user_2, user_3, user_4 = self.users
+        partitioning.create_staging(4)
+        # изменения до и во время переноса пачками переносит триггер
+        submit_applications(user_3, [user_1.id])
+        remove_friend(user_2, user_1)
+        Friendship.objects.filter(outgoing_friend=user_2).delete()
+        batches = partitioning.copy_rows(1)
+        next(batches)
+        submit_applications(user_3, [user_4.id])
+        list(batches)
+        expected = self.rows()
+        partitioning.swap()
+
+        self.assertTrue(partitioning.is_partitioned())
+        self.assertEqual(self.rows(), expected)
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN SELECT * FROM {partitioning.TABLE} WHERE outgoing_friend_id = %s", [user_1.id])
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+        self.assertEqual(len(set(re.findall(rf"{partitioning.TABLE}_p\d+", plan))), 1, plan)
+
+        outcome = submit_applications(user_4, [user_1.id])[user_1.id]
+        self.assertEqual(outcome["code"], 201)
+        self.assertGreater(Friendship.objects.get(outgoing_friend=user_4).id, expected[-1][0])
+        self.assertEqual(Friendship.objects.between(user_1, [user_4.id]).count(), 1)
+        # зеркальная пара из генераторов не вставляется, прямая вставка (админка) - IntegrityError от триггера
+        insert_friendships([(user_1.id, user_4.id, StatusApplicationFriends.SUBMITTED)])
+        create_friendships([(user_1.id, user_4.id), (user_3.id, user_4.id), (user_4.id, user_3.id)])
+        self.assertEqual(Friendship.objects.between(user_1, [user_4.id]).count(), 1)
+        self.assertEqual(Friendship.objects.between(user_3, [user_4.id]).count(), 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Friendship.objects.create(
+                outgoing_friend=user_1, incoming_friend=user_4, status=StatusApplicationFriends.ACCEPTED
+            )
+        friendship = Friendship.objects.get(outgoing_friend=user_4, incoming_friend=user_1)
+        friendship.outgoing_friend, friendship.incoming_friend = user_1, user_4
+        friendship.save()
+
+        expected = self.rows()
+        call_command("partition_friendships", "--undo", stdout=StringIO())
+        self.assertFalse(partitioning.is_partitioned())
+        self.assertEqual(self.rows(), expected)
+        status = StatusApplicationFriends.SUBMITTED
+        Friendship.objects.create(outgoing_friend=user_2, incoming_friend=user_4, status=status)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Friendship.objects.create(outgoing_friend=user_4, incoming_friend=user_2, status=status)
+
+    def test_command(self):
+        expected = self.rows()
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command("partition_friendships", "--drop-old", stdout=out)
+        call_command("partition_friendships", "--partitions", "2", "--batch-size", "2", stdout=out)
+        self.assertIn("перенесено пачками 3", out.getvalue())
+        self.assertEqual(self.rows(), expected)
+        call_command("partition_friendships", stdout=out)
+        self.assertIn("уже секционирована", out.getvalue())
+        # friendship_pair_uniq секционированной таблицы не уникален - проверка идет по строкам
+        call_command("collapse_friendships", stdout=out)
+        self.assertIn("Готово, удалено 0", out.getvalue())
+
+
+class AsyncViewsTests(TestCase):
+    def setUp(self):
+        self.user_1 = create_user(TEST_DATA_USERS[0])
+        self.user_2 = create_user(TEST_DATA_USERS[1])
+        self.user_3 = create_user(TEST_DATA_USERS[2])
+        self.headers = {"Authorization": f"Bearer {RefreshToken.for_user(self.user_1).access_token}"}
+        make_friends(self.user_1, self.user_3)
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_same_responses_as_sync(self):
+        cache.clear()
+        for url in ("me/profile/", "me/profile/?friends=ids", "me/friends/", f"{self.user_3.id}/application/"):
+            sync_response = self.client.get(f"/user/{url}", headers=self.headers)
+            async_response = self.client.get(f"/async/user/{url}", headers=self.headers)
+            self.assertEqual(async_response.status_code, sync_response.status_code, url)
+            self.assertEqual(async_response.json(), sync_response.json(), url)
+        # профиль, id друзей и страница друзей, закэшированные синхронными view, читаются асинхронными
+        self.assertEqual(friends_cache.get_stats(), {"hits": 3, "misses": 3})
+
+    def test_application(self):
+        url = f"/async/user/{self.user_2.id}/application/"
+        response = self.client.post(url, headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["detail"], "Заявка успешно отправлена")
+        self.assertEqual(self.client.get(url, headers=self.headers).json()["status"], StatusApplicationEnum.IN)
+        response = self.client.delete(url, headers=self.headers)
+        self.assertEqual(response.json()["detail"], "Заявка отменена")
+        self.assertFalse(Friendship.objects.between(self.user_1, [self.user_2.id]).exists())
+
+    def test_errors(self):
+        self.assertEqual(self.client.get("/async/user/abc/application/", headers=self.headers).status_code, 404)
+        self.assertEqual(self.client.get("/async/user/1000/application/", headers=self.headers).status_code, 404)
+        self.assertEqual(self.client.put("/async/user/me/profile/", headers=self.headers).status_code, 405)
+        response = self.client.get("/async/user/me/profile/")
+        self.assertEqual(response.status_code, 401)
+        self.assertIn("Bearer", response.headers["WWW-Authenticate"])
+        response = self.client.get("/async/user/me/profile/", headers={"Authorization": "Bearer broken"})
+        self.assertEqual(response.json()["code"], "token_not_valid")
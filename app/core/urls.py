@@ -1,9 +1,15 @@
 from django.urls import path
 from .views import (
     ApplicationAPIView,
+    BulkApplicationAPIView,
+    ChangesAPIView,
     CreateUserAPIView,
     FriendsViewSet,
+    MutualFriendsAPIView,
+    PathAPIView,
+    RelationsAPIView,
     SubmittedApplicationOutViewSet,
+    SuggestionsAPIView,
     SubmittedApplicationInViewSet,
     UserAPIView,
     UserMeAPIView,
@@ -13,8 +19,14 @@ urlpatterns = [
     path('create/', CreateUserAPIView.as_view(), name='user_create'),
     path('<pk>/', UserAPIView.as_view(), name='user'),
     path('<pk>/application/', ApplicationAPIView.as_view(), name='user_application'),
+    path('<int:pk>/mutual/', MutualFriendsAPIView.as_view(), name='user_mutual'),
+    path('<int:pk>/path/', PathAPIView.as_view(), name='user_path'),
     path('me/profile/', UserMeAPIView.as_view(), name='user_me_profile'),
     path('me/friends/', FriendsViewSet.as_view(), name='user_me_friends'),
+    path('me/relations/', RelationsAPIView.as_view(), name='user_me_relations'),
+    path('me/applications/', BulkApplicationAPIView.as_view(), name='user_me_applications'),
+    path('me/changes/', ChangesAPIView.as_view(), name='user_me_changes'),
+    path('me/suggestions/', SuggestionsAPIView.as_view(), name='user_me_suggestions'),
     path('me/submitted/out/', SubmittedApplicationOutViewSet.as_view(), name='user_me_submitted_out'),
     path('me/submitted/in/', SubmittedApplicationInViewSet.as_view(), name='user_me_submitted_in'),
 ]
@@ -0,0 +1,116 @@
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+
+from .models import User
+
+IMPORT_BATCH_SIZE = 2000
+IMPORT_FIELDS = ('email', 'username', 'password', 'first_name', 'last_name')
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    skipped: dict[str, int] = field(default_factory=dict)
+
+    def skip(self, reason: str) -> None:
+        self.skipped[reason] = self.skipped.get(reason, 0) + 1
+
+
+class InlineExecutor(Executor):
+    """Хэширование в текущем процессе (workers=1): без запуска пула и копирования данных"""
+
+    def map(self, fn, *iterables, timeout=None, chunksize=1):
+        return map(fn, *iterables)
+
+
+def hash_pool(workers: int) -> Executor:
+    """
+    Пул процессов для make_password: хэш упирается в CPU, GIL не дает распараллелить его потоками.
+    Воркеры не ходят в БД - им нужны только настройки хэшеров
+    """
+    if workers == 1:
+        return InlineExecutor()
+    return ProcessPoolExecutor(max_workers=workers, initializer=django.setup)
+
+
+def clean_rows(rows, result: ImportResult) -> list[dict]:
+    """
+    Строки с email и паролем, нормализованные как в UserManager.create_user. Некорректные и повторы
+    внутри пачки (по email и username) пропускаются с причиной в result
+    """
+    cleaned, emails, usernames = [], set(), set()
+    for row in rows:
+        email = User.objects.normalize_email((row.get('email') or '').strip())
+        username = (row.get('username') or '').strip() or email.split('@')[0]
+        try:
+            validate_email(email)
+        except ValidationError:
+            result.skip('некорректный email')
+            continue
+        if not row.get('password'):
+            result.skip('пустой пароль')
+            continue
+        if len(email) > User._meta.get_field('email').max_length \
+                or len(username) > User._meta.get_field('username').max_length:
+            result.skip('слишком длинный email или username')
+            continue
+        if email in emails or username in usernames:
+            result.skip('повтор в файле')
+            continue
+        emails.add(email)
+        usernames.add(username)
+        cleaned.append({
+            'email': email,
+            'username': username,
+            'password': row['password'],
+            'first_name': (row.get('first_name') or '')[:User._meta.get_field('first_name').max_length],
+            'last_name': (row.get('last_name') or '')[:User._meta.get_field('last_name').max_length],
+        })
+    return cleaned
+
+
+def import_batch(rows, pool: Executor, workers: int, result: ImportResult) -> None:
+    """Пачка: пропуск занятых email/username, хэши паролей в пуле, один INSERT через bulk_create"""
+    rows = clean_rows(rows, result)
+    taken = User.objects.filter(email__in=[row['email'] for row in rows]).values_list('email', flat=True)
+    taken_emails = set(taken)
+    taken = User.objects.filter(username__in=[row['username'] for row in rows]).values_list('username', flat=True)
+    taken_usernames = set(taken)
+    new_rows = []
+    for row in rows:
+        if row['email'] in taken_emails or row['username'] in taken_usernames:
+            result.skip('пользователь существует')
+        else:
+            new_rows.append(row)
+    if not new_rows:
+        return
+    chunksize = max(1, len(new_rows) // (workers * 4))
+    passwords = pool.map(make_password, [row['password'] for row in new_rows], chunksize=chunksize)
+    users = [User(**{**row, 'password': password}) for row, password in zip(new_rows, passwords)]
+    User.objects.bulk_create(users)
+    result.created += len(users)
+
+
+def import_users(rows, workers: int | None = None, batch_size: int = IMPORT_BATCH_SIZE) -> ImportResult:
+    """
+    Массовое создание пользователей из словарей с полями IMPORT_FIELDS, пачками по batch_size.
+    Пачка фиксируется отдельно: при ошибке созданные ранее пачки остаются
+    """
+    result = ImportResult()
+    workers = workers or os.cpu_count() or 1
+    with hash_pool(workers) as pool:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                import_batch(batch, pool, workers, result)
+                batch = []
+        if batch:
+            import_batch(batch, pool, workers, result)
+    return result
@@ -1,23 +1,59 @@
+from django.http import Http404
 from django.shortcuts import get_object_or_404
-from django.db.utils import IntegrityError
+from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import generics, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework_simplejwt.authentication import JWTAuthentication
 
+from . import cache as friends_cache
+from . import changelog
+from .authentication import StatelessReadMixin
+from .pagination import KeysetPagination
+from .routers import ReplicaReadMixin
 from .serializers import (
     FriendSerializer,
+    SuggestionSerializer,
+    ChangesSerializer,
+    PathSerializer,
     FriendshipOutSerializer,
     FriendshipInSerializer,
     UserSerializer,
     UserCreateSerializer,
     ResponseSerializer,
     StatusApplicationSerializer,
+    UserIdsSerializer,
+    RelationSerializer,
+    ApplicationOutcomeSerializer,
+    get_friends_projection,
+)
+from .models import Friendship, User
+from .enums import FriendsProjectionEnum
+from .services import (
+    resolve_status_application,
+    split_pair_status,
+    get_statuses_application,
+    submit_applications,
+    reject_applications,
+    remove_friend,
+    get_mutual_friend_ids,
+    get_suggestions,
+    find_path,
+    PATH_MAX_DEPTH,
+    SUGGESTIONS_LIMIT,
+    SUGGESTIONS_MAX_LIMIT,
+)
+from .managers import FRIEND_FIELDS
+
+FRIENDS_PROJECTION_PARAMETER = openapi.Parameter(
+    'friends',
+    openapi.IN_QUERY,
+    description='Представление списка друзей: full - объекты, ids - только id, count - количество',
+    type=openapi.TYPE_STRING,
+    enum=[e.value for e in FriendsProjectionEnum],
+    default=FriendsProjectionEnum.FULL.value,
 )
-from .models import Friendship, User, StatusApplicationFriends
-from .enums import StatusEnum, StatusApplicationEnum
 
 
 class CreateUserAPIView(APIView):
@@ -43,21 +79,19 @@ class UserMeAPIView(APIView):
 
     @swagger_auto_schema(
         operation_description="Возвращает детальную информацию о собственном профиле",
+        manual_parameters=[FRIENDS_PROJECTION_PARAMETER],
         responses={
             200: 'Успех',
             'Shema': UserSerializer
         }
     )
+    @friends_cache.conditional_get
     def get(self, request):
-        JWT_authenticator = JWTAuthentication()
-        response = JWT_authenticator.authenticate(request)
-        if response is not None:
-            user, token = response
-            serializer = UserSerializer(user)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+        serializer = UserSerializer(request.user, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class UserAPIView(generics.RetrieveAPIView, generics.DestroyAPIView):
+class UserAPIView(StatelessReadMixin, ReplicaReadMixin, generics.RetrieveAPIView, generics.DestroyAPIView):
     """
     get:
     Возвращает детальную информацию о выбранном профиле
@@ -68,63 +102,262 @@ class UserAPIView(generics.RetrieveAPIView, generics.DestroyAPIView):
     permission_classes = (IsAuthenticated,)
 
     def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('context', self.get_serializer_context())
         return UserSerializer(*args, **kwargs)
 
+    @swagger_auto_schema(manual_parameters=[FRIENDS_PROJECTION_PARAMETER])
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
     def delete(self, request, *args, **kwargs):
-        if (friendship := Friendship.objects.filter(
-            outgoing_friend=self.request.user,
-            incoming_friend=self.get_object(),
-            status=StatusApplicationFriends.ACCEPTED
-        )).exists():
-            friendship.update(status=StatusApplicationFriends.REJECTED)
-            Friendship.objects.filter(
-                outgoing_friend=self.get_object(),
-                incoming_friend=self.request.user,
-                status=StatusApplicationFriends.ACCEPTED
-            ).update(status=StatusApplicationFriends.REJECTED)
+        if remove_friend(self.request.user, self.get_object()):
             return Response(status=status.HTTP_200_OK)
         return Response({"detail": "Вы не можете удалить из друзей"}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class FriendsViewSet(generics.ListAPIView):
+class FriendsViewSet(StatelessReadMixin, ReplicaReadMixin, generics.ListAPIView):
+    """
+    get:
+    Возвращает список друзей (курсорная пагинация)
+    """
+    serializer_class = FriendSerializer
+    permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        return Friendship.objects.friend_sides_of(self.request.user)
+
+    def paginate_queryset(self, queryset):
+        """Страница строк пар по (friendship_date, id), в ответ - вторые пользователи пар"""
+        return [friendship.get_friend(self.request.user.id) for friendship in super().paginate_queryset(queryset)]
+
+    @friends_cache.conditional_get
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_page(self) -> tuple:
+        """Курсор следующей страницы и друзья страницы - запись кэша, общая с AsyncFriendsAPIView"""
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        return self.paginator.next_cursor, self.get_serializer(page, many=True).data
+
+    def list(self, request, *args, **kwargs):
+        # в кэше курсор, а не ссылка: хост и путь ссылки - из текущего запроса
+        next_cursor, results = friends_cache.get_or_set(
+            request.user.id, f'rows:{request.query_params.urlencode()}', self.get_page
+        )
+        self.paginator.resume(request, next_cursor)
+        return self.get_paginated_response(results)
+
+
+class MutualFriendsAPIView(StatelessReadMixin, ReplicaReadMixin, generics.ListAPIView):
+    """
+    get:
+    Общие друзья с выбранным пользователем: full - объекты (курсорная пагинация), ids - только id, count - количество
+    """
     serializer_class = FriendSerializer
     permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        return [i.incoming_friend for i in User.objects.get(
-            id=self.request.user.id
-        ).incoming_friends.filter(
-            status=StatusApplicationFriends.ACCEPTED
-        )]
+        if getattr(self, 'swagger_fake_view', False):
+            return Friendship.objects.none()
+        return Friendship.objects.mutual_friends_of(self.request.user, self.other)
+
+    def paginate_queryset(self, queryset):
+        return [friendship.get_friend(self.request.user.id) for friendship in super().paginate_queryset(queryset)]
+
+    @swagger_auto_schema(manual_parameters=[FRIENDS_PROJECTION_PARAMETER])
+    def get(self, request, *args, **kwargs):
+        self.other = get_object_or_404(User.objects.only('id'), id=self.kwargs['pk'])
+        projection = get_friends_projection(request)
+        if projection == FriendsProjectionEnum.FULL:
+            return self.list(request, *args, **kwargs)
+        mutual_ids = get_mutual_friend_ids(request.user.id, self.other.id)
+        if projection == FriendsProjectionEnum.COUNT:
+            return Response({"count": len(mutual_ids)}, status=status.HTTP_200_OK)
+        return Response({"ids": mutual_ids}, status=status.HTTP_200_OK)
+
+
+class PathAPIView(StatelessReadMixin, ReplicaReadMixin, APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def get_max_depth(self, request) -> int:
+        try:
+            max_depth = int(request.query_params['max_depth'])
+        except (KeyError, ValueError):
+            return PATH_MAX_DEPTH
+        return min(max(max_depth, 1), PATH_MAX_DEPTH)
+
+    @swagger_auto_schema(
+        operation_description='Кратчайшая цепочка друзей до выбранного пользователя',
+        manual_parameters=[openapi.Parameter(
+            'max_depth', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, default=PATH_MAX_DEPTH,
+            description=f'Максимальная длина цепочки, не больше {PATH_MAX_DEPTH}',
+        )],
+        responses={200: PathSerializer, 404: 'Пользователь не найден или цепочка длиннее max_depth'},
+    )
+    def get(self, request, pk):
+        other = get_object_or_404(User.objects.only('id'), id=pk)
+        path = find_path(request.user.id, other.id, max_depth=self.get_max_depth(request))
+        if path is None:
+            return Response({"detail": "Цепочка друзей не найдена"}, status=status.HTTP_404_NOT_FOUND)
+        users = User.objects.only(*FRIEND_FIELDS).in_bulk(path)
+        data = {"depth": len(path) - 1, "path": [users[user_id] for user_id in path]}
+        return Response(PathSerializer(data).data, status=status.HTTP_200_OK)
+
+
+class SuggestionsAPIView(StatelessReadMixin, ReplicaReadMixin, APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def get_limit(self, request) -> int:
+        try:
+            limit = int(request.query_params['limit'])
+        except (KeyError, ValueError):
+            return SUGGESTIONS_LIMIT
+        return min(max(limit, 1), SUGGESTIONS_MAX_LIMIT)
+
+    @swagger_auto_schema(
+        operation_description=(
+            'Возможно, вы знакомы: друзья друзей по убыванию количества общих друзей. '
+            'Считается по ограниченной выборке друзей (см. mutual) и одинаково на любой СУБД'
+        ),
+        manual_parameters=[openapi.Parameter(
+            'limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, default=SUGGESTIONS_LIMIT,
+            description=f'Количество кандидатов, не больше {SUGGESTIONS_MAX_LIMIT}',
+        )],
+        responses={200: SuggestionSerializer(many=True)},
+    )
+    def get(self, request):
+        mutual = dict(get_suggestions(request.user.id, limit=self.get_limit(request)))
+        users = list(User.objects.filter(id__in=mutual).only(*FRIEND_FIELDS).order_by())
+        for user in users:
+            user.mutual = mutual[user.id]
+        users.sort(key=lambda user: (-user.mutual, user.id))
+        return Response(SuggestionSerializer(users, many=True).data, status=status.HTTP_200_OK)
+
+
+class ChangesAPIView(StatelessReadMixin, ReplicaReadMixin, APIView):
+    permission_classes = (IsAuthenticated,)
+    groups = ('friends', 'submitted_in', 'submitted_out')
+
+    def get_limit(self, request) -> int:
+        try:
+            limit = int(request.query_params['limit'])
+        except (KeyError, ValueError):
+            return changelog.CHANGES_LIMIT
+        return min(max(limit, 1), changelog.CHANGES_MAX_LIMIT)
+
+    @swagger_auto_schema(
+        operation_description=(
+            'Изменения дружбы и заявок после курсора since - последнее состояние каждой изменившейся пары. '
+            'Без since - только курсор: запросить его до загрузки списков друзей и заявок'
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                'since', openapi.IN_QUERY, type=openapi.TYPE_STRING, description='cursor из предыдущего ответа',
+            ),
+            openapi.Parameter(
+                'limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, default=changelog.CHANGES_LIMIT,
+                description=f'Записей журнала за запрос, не больше {changelog.CHANGES_MAX_LIMIT}',
+            ),
+        ],
+        responses={
+            200: ChangesSerializer,
+            400: 'since - не курсор',
+            410: 'Изменения после since удалены из журнала - нужна полная загрузка списков',
+        },
+    )
+    def get(self, request):
+        since = request.query_params.get('since')
+        data = {'has_more': False, 'removed': [], **{group: [] for group in self.groups}}
+        if since is None:
+            data['cursor'] = changelog.get_cursor(request.user.id)
+            return Response(ChangesSerializer(data).data, status=status.HTTP_200_OK)
+        if (cursor := changelog.parse_cursor(since)) is None:
+            return Response({"detail": "since - курсор из предыдущего ответа"}, status=status.HTTP_400_BAD_REQUEST)
+        change_id, issued = cursor
+        if changelog.is_expired(issued):
+            return Response({"detail": "Курсор устарел, загрузите списки заново"}, status=status.HTTP_410_GONE)
+        changes, data['cursor'], data['has_more'] = changelog.get_changes(
+            request.user.id, change_id, self.get_limit(request)
+        )
+        groups = changelog.group_changes(changes)
+        users = User.objects.only(*FRIEND_FIELDS).in_bulk([
+            user_id for group in self.groups for user_id in groups[group]
+        ])
+        data['removed'] = groups['removed']
+        for group in self.groups:
+            data[group] = [users[user_id] for user_id in groups[group] if user_id in users]
+        return Response(ChangesSerializer(data).data, status=status.HTTP_200_OK)
 
 
-class SubmittedApplicationOutViewSet(generics.ListAPIView):
+class SubmittedApplicationOutViewSet(StatelessReadMixin, ReplicaReadMixin, generics.ListAPIView):
     """
     get:
-    Возвращает список исходящих заявок
+    Возвращает список исходящих заявок (курсорная пагинация)
     """
     serializer_class = FriendshipOutSerializer
     permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        return Friendship.objects.filter(outgoing_friend=self.request.user, status=StatusApplicationFriends.SUBMITTED)
+        return Friendship.objects.outgoing_submitted(self.request.user)
+
+    @friends_cache.conditional_get
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
 
 
-class SubmittedApplicationInViewSet(generics.ListAPIView):
+class SubmittedApplicationInViewSet(StatelessReadMixin, ReplicaReadMixin, generics.ListAPIView):
     """
     get:
-    Возвращает список входящих заявок
+    Возвращает список входящих заявок (курсорная пагинация)
     """
     serializer_class = FriendshipInSerializer
     permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        return Friendship.objects.filter(incoming_friend=self.request.user, status=StatusApplicationFriends.SUBMITTED)
+        return Friendship.objects.incoming_submitted(self.request.user)
+
+    @friends_cache.conditional_get
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
+class ApplicationMixin:
+    """Общее у синхронной и асинхронной (core.async_views) view заявки одному пользователю"""
+
+    def get_friend_id(self) -> int:
+        try:
+            return int(self.kwargs['pk'])
+        except ValueError:
+            raise Http404
+
+    def get_response(self, outcomes: dict) -> Response:
+        """Ответ по результату перехода из core.services (одна пара)"""
+        (outcome,) = outcomes.values()
+        code = outcome.pop("code")
+        return Response(outcome, status=code)
+
+    def get_status_response(self, user, friend) -> Response:
+        if user == friend:
+            return Response({"detail": "Не можете выбрать себя"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            {"status": resolve_status_application(
+                *split_pair_status(user.id, friend.pair_status, friend.pair_outgoing_id)
+            )},
+            status=status.HTTP_200_OK
+        )
 
 
-class ApplicationAPIView(APIView):
+class ApplicationAPIView(StatelessReadMixin, ReplicaReadMixin, ApplicationMixin, APIView):
     permission_classes = (IsAuthenticated,)
 
+    def get_relation(self, user) -> User:
+        """Пользователь из url со статусом пары - единственное чтение в обработчике"""
+        return get_object_or_404(Friendship.objects.relations(user), id=self.get_friend_id())
+
     @swagger_auto_schema(
         operation_description="Отправка/одобрение заявки",
         responses={
@@ -134,35 +367,7 @@ class ApplicationAPIView(APIView):
         }
     )
     def post(self, request, *args, **kwargs):
-        JWT_authenticator = JWTAuthentication()
-        user, token = JWT_authenticator.authenticate(request)
-        friend = get_object_or_404(User, id=self.kwargs['pk'])
-        friendship_reverse = Friendship.objects.filter(outgoing_friend=friend, incoming_friend=user)
-        if user == friend:
-            return Response({"detail": "Вы не можете отправить заявку самому себе"}, status=status.HTTP_400_BAD_REQUEST)
-        response = {"status": StatusEnum.SUCCESS}
-        if friendship_reverse.exists() and friendship_reverse[0].status == StatusApplicationFriends.SUBMITTED:
-            friendship_reverse.update(status=StatusApplicationFriends.ACCEPTED)
-            Friendship(outgoing_friend=user, incoming_friend=friend, status=StatusApplicationFriends.ACCEPTED).save()
-            response.update({"detail": "Вы теперь друзья"})
-        elif friendship_reverse.exists() and friendship_reverse[0].status == StatusApplicationFriends.ACCEPTED:
-            return Response({"detail": "Вы и так друзья"}, status=status.HTTP_400_BAD_REQUEST)
-        elif friendship_reverse.exists() and friendship_reverse[0].status == StatusApplicationFriends.REJECTED:
-            return Response(
-                {"status": StatusEnum.UNSUCCESS, "detail": "Вы не сможете стать друзьями"},
-                status=status.HTTP_200_OK
-            )
-        elif not friendship_reverse.exists():
-            try:
-                Friendship(
-                    outgoing_friend=user, incoming_friend=friend, status=StatusApplicationFriends.SUBMITTED
-                ).save()
-                response |= {"detail": "Заявка успешно отправлена"}
-            except IntegrityError:
-                return Response({"detail": "Заявка и так отправлена"}, status=status.HTTP_400_BAD_REQUEST)
-        else:
-            response |= {"detail": "Заявка успешно отправлена"}
-        return Response(response, status=status.HTTP_201_CREATED)
+        return self.get_response(submit_applications(request.user, [self.get_friend_id()]))
 
     @swagger_auto_schema(
         operation_description="Отмена иходящей/ удадение входящей заявки",
@@ -173,32 +378,7 @@ class ApplicationAPIView(APIView):
         }
     )
     def delete(self, request, *args, **kwargs):
-        JWT_authenticator = JWTAuthentication()
-        user, token = JWT_authenticator.authenticate(request)
-        friend = get_object_or_404(User, id=self.kwargs['pk'])
-        if user == friend:
-            return Response({"detail": "Вы не можете удалить самого себя!"}, status=status.HTTP_400_BAD_REQUEST)
-        friendship_reverse = Friendship.objects.filter(outgoing_friend=friend, incoming_friend=user)
-        response = {"status": StatusEnum.SUCCESS}
-        if friendship_reverse.exists() and friendship_reverse[0].status == StatusApplicationFriends.SUBMITTED:
-            friendship_reverse.update(status=StatusApplicationFriends.REJECTED)
-            Friendship(outgoing_friend=user, incoming_friend=friend, status=StatusApplicationFriends.REJECTED).save()
-            response |= {"detail": "Заявка отклонена. Следующие будут автоматом отклонены"}
-        elif friendship_reverse.exists() and friendship_reverse[0].status == StatusApplicationFriends.REJECTED:
-            return Response(
-                {"status": StatusEnum.UNSUCCESS, "detail": "Заявкf была уже отклонена"}, status=status.HTTP_200_OK
-            )
-        elif (friendship := Friendship.objects.filter(
-                outgoing_friend=user,
-                incoming_friend=friend,
-                status=StatusApplicationFriends.SUBMITTED
-            )
-        ).exists():
-            friendship.delete()
-            response |= {"detail": "Заявка отменена"}
-        else:
-            return Response({"detail": "Заявки не существует"}, status=status.HTTP_400_BAD_REQUEST)
-        return Response(response, status=status.HTTP_200_OK)
+        return self.get_response(reject_applications(request.user, [self.get_friend_id()]))
 
     @swagger_auto_schema(
         operation_description="Получение статуса заявки",
@@ -209,21 +389,63 @@ class ApplicationAPIView(APIView):
         }
     )
     def get(self, request, *args, **kwargs):
-        JWT_authenticator = JWTAuthentication()
-        user, token = JWT_authenticator.authenticate(request)
-        friend = get_object_or_404(User, id=self.kwargs['pk'])
-        if user == friend:
-            return Response({"detail": "Не можете выбрать себя"}, status=status.HTTP_400_BAD_REQUEST)
-        friendship_reverse = Friendship.objects.filter(outgoing_friend=friend, incoming_friend=user)
-        if friendship_reverse.exists() and friendship_reverse[0].status == StatusApplicationFriends.SUBMITTED:
-            return Response({"status": StatusApplicationEnum.OUT}, status=status.HTTP_200_OK)
-        elif friendship_reverse.exists() and friendship_reverse[0].status == StatusApplicationFriends.ACCEPTED:
-            return Response({"status": StatusApplicationEnum.FRI}, status=status.HTTP_200_OK)
-        elif friendship_reverse.exists() and friendship_reverse[0].status == StatusApplicationFriends.REJECTED:
-            return Response({"status": StatusApplicationEnum.REJ}, status=status.HTTP_200_OK)
-        elif Friendship.objects.filter(
-            outgoing_friend=user, incoming_friend=friend, status=StatusApplicationFriends.SUBMITTED
-        ).exists():
-            return Response({"status": StatusApplicationEnum.IN}, status=status.HTTP_200_OK)
-        else:
-            return Response({"status": StatusApplicationEnum.NONE}, status=status.HTTP_200_OK)
+        return self.get_status_response(request.user, self.get_relation(request.user))
+
+
+class RelationsAPIView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    @swagger_auto_schema(
+        operation_description="Статусы отношений с несколькими пользователями сразу (до 500 id)",
+        request_body=UserIdsSerializer,
+        responses={
+            200: RelationSerializer(many=True),
+            400: 'Ошибка',
+        }
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = UserIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_ids = list(dict.fromkeys(serializer.validated_data['ids']))
+        statuses = get_statuses_application(request.user, user_ids)
+        return Response(
+            RelationSerializer([{"id": pk, "status": value} for pk, value in statuses.items()], many=True).data,
+            status=status.HTTP_200_OK
+        )
+
+
+class BulkApplicationAPIView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def get_user_ids(self, request) -> list[int]:
+        serializer = UserIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return list(dict.fromkeys(serializer.validated_data['ids']))
+
+    def get_response(self, outcomes: dict) -> Response:
+        return Response(
+            ApplicationOutcomeSerializer([{"id": pk, **outcome} for pk, outcome in outcomes.items()], many=True).data,
+            status=status.HTTP_200_OK
+        )
+
+    @swagger_auto_schema(
+        operation_description="Массовая отправка/одобрение заявок (до 500 id) в одной транзакции",
+        request_body=UserIdsSerializer,
+        responses={
+            200: ApplicationOutcomeSerializer(many=True),
+            400: 'Ошибка',
+        }
+    )
+    def post(self, request, *args, **kwargs):
+        return self.get_response(submit_applications(request.user, self.get_user_ids(request)))
+
+    @swagger_auto_schema(
+        operation_description="Массовое отклонение входящих/отмена исходящих заявок (до 500 id) в одной транзакции",
+        request_body=UserIdsSerializer,
+        responses={
+            200: ApplicationOutcomeSerializer(many=True),
+            400: 'Ошибка',
+        }
+    )
+    def delete(self, request, *args, **kwargs):
+        return self.get_response(reject_applications(request.user, self.get_user_ids(request)))